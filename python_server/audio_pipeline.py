@@ -0,0 +1,144 @@
+"""
+Chunked audio transcription.
+
+A recording is split on silence into segments that are transcribed concurrently by a
+pluggable speech-to-text backend, then reassembled in order with timestamps. The
+timestamped transcript format round-trips through parse_transcript(), so cached
+transcripts still yield per-segment timestamps for chunk metadata.
+"""
+
+import os
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+AUDIO_EXTENSIONS = {'.mp3', '.wav'}
+
+MIN_SILENCE_MS = int(os.getenv("AUDIO_MIN_SILENCE_MS", "700"))
+SILENCE_THRESH_DB = int(os.getenv("AUDIO_SILENCE_THRESH_DB", "-40"))
+MAX_SEGMENT_MS = int(os.getenv("AUDIO_MAX_SEGMENT_MS", "60000"))
+TRANSCRIBE_WORKERS = int(os.getenv("AUDIO_TRANSCRIBE_WORKERS", "8"))
+TRANSCRIPTION_BACKEND = os.getenv("AUDIO_TRANSCRIPTION_BACKEND", "google")
+
+TIMESTAMP_LINE = re.compile(r"^\[(\d+):(\d{2}):(\d{2}(?:\.\d+)?) - (\d+):(\d{2}):(\d{2}(?:\.\d+)?)\] (.*)$")
+
+
+@dataclass
+class TranscriptSegment:
+    start: float  # seconds
+    end: float    # seconds
+    text: str
+
+
+# backend name -> function(wav bytes) -> text
+TRANSCRIPTION_BACKENDS: Dict[str, Callable[[bytes], str]] = {}
+
+
+def register_backend(name: str, transcribe: Callable[[bytes], str]) -> None:
+    """Register a speech-to-text backend taking WAV bytes and returning the text."""
+    TRANSCRIPTION_BACKENDS[name] = transcribe
+
+
+def _speech_recognition_backend(method: str) -> Callable[[bytes], str]:
+    def transcribe(wav: bytes) -> str:
+        import speech_recognition as sr
+
+        recognizer = sr.Recognizer()
+        with sr.AudioFile(io.BytesIO(wav)) as source:
+            audio = recognizer.record(source)
+        try:
+            return getattr(recognizer, method)(audio)
+        except sr.UnknownValueError:
+            # No intelligible speech in this segment
+            return ""
+    return transcribe
+
+
+# Google Web Speech API (what markitdown uses), and CMU Sphinx as a local stand-in
+register_backend("google", _speech_recognition_backend("recognize_google"))
+register_backend("sphinx", _speech_recognition_backend("recognize_sphinx"))
+
+
+def split_on_silence(file_path: str) -> Tuple["AudioSegment", List[Tuple[int, int]]]:
+    """
+    Find the non-silent ranges of a recording, in milliseconds.
+    Ranges longer than MAX_SEGMENT_MS are cut so no single request gets too long.
+    """
+    from pydub import AudioSegment
+    from pydub.silence import detect_nonsilent
+
+    audio = AudioSegment.from_file(file_path)
+    ranges = detect_nonsilent(
+        audio,
+        min_silence_len=MIN_SILENCE_MS,
+        silence_thresh=SILENCE_THRESH_DB,
+        seek_step=10
+    ) or [[0, len(audio)]]
+
+    segments = []
+    for start, end in ranges:
+        for cut in range(start, end, MAX_SEGMENT_MS):
+            segments.append((cut, min(cut + MAX_SEGMENT_MS, end)))
+    return audio, segments
+
+
+def transcribe_audio(file_path: str, backend: str = TRANSCRIPTION_BACKEND) -> List[TranscriptSegment]:
+    """Split a recording on silence and transcribe the segments concurrently, in order."""
+    if backend not in TRANSCRIPTION_BACKENDS:
+        raise ValueError(f"Unknown transcription backend: {backend}")
+    transcribe = TRANSCRIPTION_BACKENDS[backend]
+
+    audio, ranges = split_on_silence(file_path)
+    print(f"Transcribing {len(ranges)} audio segments with {backend}")
+
+    def run(segment_range: Tuple[int, int]) -> TranscriptSegment:
+        start, end = segment_range
+        wav = io.BytesIO()
+        audio[start:end].export(wav, format="wav")
+        return TranscriptSegment(start / 1000, end / 1000, transcribe(wav.getvalue()).strip())
+
+    with ThreadPoolExecutor(max_workers=TRANSCRIBE_WORKERS) as executor:
+        segments = list(executor.map(run, ranges))
+    return [segment for segment in segments if segment.text]
+
+
+def _format_time(seconds: float) -> str:
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+
+def format_transcript(segments: List[TranscriptSegment]) -> str:
+    """One "[HH:MM:SS.mmm - HH:MM:SS.mmm] text" line per segment."""
+    return "\n".join(
+        f"[{_format_time(s.start)} - {_format_time(s.end)}] {s.text}" for s in segments
+    )
+
+
+def parse_transcript(text: str) -> List[TranscriptSegment]:
+    """Inverse of format_transcript(); lines without a timestamp are ignored."""
+    segments = []
+    for line in text.splitlines():
+        match = TIMESTAMP_LINE.match(line)
+        if match:
+            h1, m1, s1, h2, m2, s2, content = match.groups()
+            segments.append(TranscriptSegment(
+                start=int(h1) * 3600 + int(m1) * 60 + float(s1),
+                end=int(h2) * 3600 + int(m2) * 60 + float(s2),
+                text=content
+            ))
+    return segments
+
+
+def group_segments(segments: List[TranscriptSegment], max_chars: int = 1500) -> List[TranscriptSegment]:
+    """Merge consecutive segments into chunk-sized groups, keeping the overall time span."""
+    groups: List[TranscriptSegment] = []
+    for segment in segments:
+        if groups and len(groups[-1].text) + len(segment.text) + 1 <= max_chars:
+            groups[-1].end = segment.end
+            groups[-1].text += " " + segment.text
+        else:
+            groups.append(TranscriptSegment(segment.start, segment.end, segment.text))
+    return groups
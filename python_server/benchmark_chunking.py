@@ -0,0 +1,108 @@
+"""
+Benchmark the markdown chunker against the previous character splitter.
+
+    python benchmark_chunking.py Data/Comp1021 notes.md --repeat 10
+
+Markdown / text files are read as is; PDFs are extracted with PyMuPDF only (no marker),
+so the benchmark needs no models. --repeat concatenates the corpus to test multi-megabyte
+inputs. For each splitter it reports the time, throughput, chunk count, chunk sizes in
+tokens, chunks over the token budget and chunks that cut through a code fence.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+from typing import Callable, List
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from chunking import CHUNK_TOKENS, MarkdownChunker
+
+
+def load_corpus(paths: List[str]) -> List[str]:
+    texts = []
+    for path in paths:
+        if os.path.isdir(path):
+            texts.extend(load_corpus(sorted(os.path.join(path, name) for name in os.listdir(path))))
+        elif path.lower().endswith(".pdf"):
+            from pdf_pipeline import analyze_pdf
+            texts.append("\n\n".join(page.text for page in analyze_pdf(path) if page.text))
+        elif path.lower().endswith((".md", ".txt")):
+            with open(path, encoding="utf-8") as f:
+                texts.append(f.read())
+    return texts
+
+
+def character_splitter() -> Callable[[str], List[str]]:
+    """The splitter ChromaDB.add_documents used before the markdown chunker."""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=2000,
+        chunk_overlap=200,
+        separators=[
+            "\n\n",
+            "\n",
+            " ",
+            ".",
+            ",",
+            "\u200b",  # Zero-width space
+            "\uff0c",  # Fullwidth comma
+            "\u3001",  # Ideographic comma
+            "\uff0e",  # Fullwidth full stop
+            "\u3002",  # Ideographic full stop
+            "",
+        ],
+    )
+    return splitter.split_text
+
+
+def markdown_chunker() -> Callable[[str], List[str]]:
+    chunker = MarkdownChunker()
+    return lambda text: [chunk for chunk, _ in chunker.split_text(text)]
+
+
+def run(name: str, split: Callable[[str], List[str]], texts: List[str], chunker: MarkdownChunker) -> None:
+    start = time.perf_counter()
+    chunks = [chunk for text in texts for chunk in split(text)]
+    elapsed = time.perf_counter() - start
+
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 1024 / 1024
+    tokens = chunker._count(chunks) if chunks else [0]
+    # a chunk with an odd number of fence lines starts or ends inside a code block
+    broken_fences = sum(
+        1 for chunk in chunks
+        if sum(line.lstrip().startswith("```") for line in chunk.splitlines()) % 2
+    )
+    print(f"{name}:")
+    print(f"  time            {elapsed:.3f}s ({megabytes / elapsed if elapsed else 0:.1f} MB/s)")
+    print(f"  chunks          {len(chunks)}")
+    print(
+        f"  tokens/chunk    mean {statistics.mean(tokens):.0f}, min {min(tokens)}, max {max(tokens)}, "
+        f"stdev {statistics.pstdev(tokens):.0f}"
+    )
+    print(f"  over {CHUNK_TOKENS} tokens  {sum(count > CHUNK_TOKENS for count in tokens)}")
+    print(f"  broken code fences  {broken_fences}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="markdown / text / PDF files or directories")
+    parser.add_argument("--repeat", type=int, default=1, help="concatenate the corpus this many times")
+    args = parser.parse_args()
+
+    texts = load_corpus(args.paths)
+    if not texts:
+        sys.exit("No .md, .txt or .pdf input found")
+    texts = ["\n\n".join([text] * args.repeat) for text in texts]
+    print(
+        f"{len(texts)} documents, "
+        f"{sum(len(text.encode('utf-8')) for text in texts) / 1024 / 1024:.1f} MB\n"
+    )
+
+    chunker = MarkdownChunker()
+    run("RecursiveCharacterTextSplitter (2000 chars, 200 overlap)", character_splitter(), texts, chunker)
+    run(f"MarkdownChunker ({CHUNK_TOKENS} tokens)", markdown_chunker(), texts, chunker)
+
+
+if __name__ == "__main__":
+    main()
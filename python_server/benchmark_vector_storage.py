@@ -0,0 +1,107 @@
+"""
+Recall / latency report of compact vector storage against full-precision storage.
+
+    python benchmark_vector_storage.py Data/Comp1021 --dimensions 256 --quantization int8
+
+The corpus (PDFs extracted with PyMuPDF, markdown / text files as is) is chunked and
+embedded once with an embedding backend (EMBEDDING_BACKEND unless --backend is given),
+then loaded into a full-precision and a compact Chroma collection in a temporary
+directory. Queries are the opening sentence of a sample of the chunks. Recall@k is
+measured against the full-precision top-k.
+"""
+
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+import chromadb
+from chromadb.config import Settings
+
+import compact_vectors
+from benchmark_chunking import load_corpus
+from chunking import MarkdownChunker
+from database import _directory_size
+from embedding_backends import EMBEDDING_BACKEND, EMBEDDING_BACKENDS, get_embeddings
+
+
+def timed_query(collection, embedding, k):
+    start = time.perf_counter()
+    result = collection.query(query_embeddings=[embedding], n_results=k, include=["distances"])
+    return result["ids"][0], time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=["Data/Comp1021"])
+    parser.add_argument("--dimensions", type=int, default=compact_vectors.COMPACT_DIMENSIONS)
+    parser.add_argument("--quantization", choices=compact_vectors.QUANTIZATIONS, default=compact_vectors.COMPACT_QUANTIZATION)
+    parser.add_argument("--rerank", type=int, default=compact_vectors.RERANK_CANDIDATES, help="candidates per result")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--backend", choices=list(EMBEDDING_BACKENDS), default=EMBEDDING_BACKEND)
+    args = parser.parse_args()
+    embed_model = get_embeddings(args.backend)
+
+    chunks = [chunk for text in load_corpus(args.paths) for chunk, _ in MarkdownChunker().split_text(text)]
+    if not chunks:
+        sys.exit("No chunks in the corpus")
+    print(f"Embedding {len(chunks)} chunks with {args.backend}")
+    embeddings = embed_model.embed_documents(chunks)
+
+    random.seed(0)
+    samples = random.sample(chunks, min(args.queries, len(chunks)))
+    queries = embed_model.embed_documents([sample.split(".")[0][:300] for sample in samples])
+
+    directory = tempfile.mkdtemp(prefix="storage_benchmark_")
+    try:
+        client = chromadb.PersistentClient(path=directory, settings=Settings(anonymized_telemetry=False))
+        ids = [str(i) for i in range(len(chunks))]
+
+        full = client.create_collection("full")
+        full_dir = _directory_size(directory)
+        for start in range(0, len(ids), 1000):
+            full.add(ids=ids[start:start + 1000], embeddings=embeddings[start:start + 1000])
+        full_bytes = _directory_size(directory) - full_dir
+
+        compact_vectors.RERANK_CANDIDATES = args.rerank
+        compact = compact_vectors.CompactCollection(
+            client.create_collection("compact", metadata={
+                "storage": "compact",
+                "storage_dimensions": args.dimensions,
+                "storage_quantization": args.quantization
+            }),
+            directory
+        )
+        compact_dir = _directory_size(directory)
+        for start in range(0, len(ids), 1000):
+            compact.add(ids=ids[start:start + 1000], embeddings=embeddings[start:start + 1000])
+        compact_bytes = _directory_size(directory) - compact_dir
+
+        recalls, full_times, compact_times = [], [], []
+        for query in queries:
+            expected, full_time = timed_query(full, query, args.k)
+            found, compact_time = timed_query(compact, query, args.k)
+            recalls.append(len(set(expected) & set(found)) / len(expected))
+            full_times.append(full_time)
+            compact_times.append(compact_time)
+
+        dims = len(embeddings[0])
+        index_dims = args.dimensions if 0 < args.dimensions < dims else dims
+        side_bytes = dims * (2 if args.quantization == "float16" else 1) + (4 if args.quantization == "int8" else 0)
+        print(f"\n{len(chunks)} chunks, {dims} dims, {len(queries)} queries, k={args.k}")
+        print(f"full:    {dims * 4} B/vector in the index, {full_bytes / 1024 / 1024:.1f} MB on disk, "
+              f"{statistics.mean(full_times) * 1000:.2f} ms/query")
+        print(f"compact: {index_dims * 4} B/vector in the index + {side_bytes} B {args.quantization}, "
+              f"{compact_bytes / 1024 / 1024:.1f} MB on disk, {statistics.mean(compact_times) * 1000:.2f} ms/query "
+              f"({args.rerank}x rerank)")
+        print(f"recall@{args.k}: {statistics.mean(recalls):.3f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Token-aware, markdown-structure-aware chunking.
+
+Chunks are sized in tiktoken tokens (the embedding model's encoding), so English and
+Chinese text produce chunks of similar cost. The markdown produced by the converters is
+read once, line by line, into blocks (headings, paragraphs, fenced code, tables, $$ math
+blocks), each block's tokens are counted once, and the blocks are packed greedily:
+
+- a heading starts a new chunk once the current one has CHUNK_MIN_TOKENS, and the
+  heading path is stored as the chunk's "section" metadata
+- code fences, tables and math blocks are never cut inside; when one alone is larger
+  than a chunk it is split on line boundaries, reopening the fence or repeating the
+  table header in every piece
+- oversized paragraphs are split on sentence boundaries (Latin and CJK punctuation),
+  and sentences without one on word boundaries
+- consecutive chunks of the same section share up to CHUNK_OVERLAP_TOKENS of text
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+import tiktoken
+from langchain.schema import Document
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "128"))
+# encoding of the OpenAI embedding models
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+FENCE = re.compile(r"^\s*(`{3,}|~{3,})")
+TABLE_ROW = re.compile(r"^\s*\|")
+TABLE_SEPARATOR = re.compile(r"^\s*\|?\s*:?-{3,}")
+SENTENCE = re.compile(r".+?(?:[.!?](?=\s)|[\u3002\uff01\uff1f\uff1b]|$)\s*", re.S)
+WORD = re.compile(r"\s*\S+\s*")
+
+
+@dataclass
+class _Unit:
+    text: str
+    tokens: int
+    kind: str  # "heading", "text", "code", "table" or "math"
+    section: str
+    joined: bool = False  # continues the previous unit (piece of a split paragraph)
+
+
+class MarkdownChunker:
+    """Split markdown into chunks of at most chunk_tokens tokens, see the module docstring."""
+
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        min_tokens: int = CHUNK_MIN_TOKENS,
+        encoding: str = CHUNK_ENCODING
+    ):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+        self.min_tokens = min(min_tokens, chunk_tokens)
+        self.encoding = tiktoken.get_encoding(encoding)
+        # blocks of a chunk are joined by a blank line
+        self.separator_tokens = self._count(["\n\n"])[0]
+
+    def _count(self, texts: List[str]) -> List[int]:
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+
+    @staticmethod
+    def _blocks(text: str) -> List[Tuple[str, str, str]]:
+        """Read markdown into (kind, text, section) blocks in one pass over the lines."""
+        blocks = []
+        headings: List[str] = []
+        lines = text.splitlines()
+        paragraph: List[str] = []
+
+        def section() -> str:
+            return " > ".join(heading for heading in headings if heading)
+
+        def end_paragraph():
+            if paragraph:
+                blocks.append(("text", "\n".join(paragraph), section()))
+                paragraph.clear()
+
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            fence = FENCE.match(line)
+            heading = HEADING.match(line)
+            if fence:
+                end_paragraph()
+                marker = fence.group(1)
+                end = i + 1
+                while end < len(lines) and not lines[end].lstrip().startswith(marker):
+                    end += 1
+                blocks.append(("code", "\n".join(lines[i:end + 1]), section()))
+                i = end + 1
+                continue
+            if line.strip().startswith("$$") and line.strip().count("$$") == 1:
+                end_paragraph()
+                end = i + 1
+                while end < len(lines) and "$$" not in lines[end]:
+                    end += 1
+                blocks.append(("math", "\n".join(lines[i:end + 1]), section()))
+                i = end + 1
+                continue
+            if TABLE_ROW.match(line):
+                end_paragraph()
+                end = i
+                while end < len(lines) and TABLE_ROW.match(lines[end]):
+                    end += 1
+                blocks.append(("table", "\n".join(lines[i:end]), section()))
+                i = end
+                continue
+            if heading:
+                end_paragraph()
+                level = len(heading.group(1))
+                del headings[level - 1:]
+                headings.extend([""] * (level - 1 - len(headings)))
+                headings.append(heading.group(2))
+                blocks.append(("heading", line, section()))
+            elif line.strip():
+                paragraph.append(line)
+            else:
+                end_paragraph()
+            i += 1
+        end_paragraph()
+        return blocks
+
+    def _split_lines(self, kind: str, text: str, section: str) -> List[_Unit]:
+        """Split an oversized code, table or math block on line boundaries."""
+        lines = text.split("\n")
+        head, tail = [], []
+        if kind == "code":
+            head = lines[:1]
+            tail = lines[-1:] if len(lines) > 1 and FENCE.match(lines[-1]) else []
+            lines = lines[1:len(lines) - len(tail)]
+        elif kind == "table" and len(lines) > 2 and TABLE_SEPARATOR.match(lines[1]):
+            head, lines = lines[:2], lines[2:]
+
+        frame = sum(self._count(["\n".join(head + tail)])) + 1
+        budget = max(1, self.chunk_tokens - frame)
+        units = []
+        piece, size = [], 0
+        for line, tokens in zip(lines, self._count(lines)):
+            if piece and size + tokens + 1 > budget:
+                units.append(_Unit("\n".join(head + piece + tail), frame + size, kind, section))
+                piece, size = [], 0
+            piece.append(line)
+            size += tokens + 1
+        if piece:
+            units.append(_Unit("\n".join(head + piece + tail), frame + size, kind, section))
+        return units
+
+    def _split_paragraph(self, text: str, section: str) -> List[_Unit]:
+        """Split an oversized paragraph on sentences; overlong sentences on words."""
+        sentences = [match.group(0) for match in SENTENCE.finditer(text)]
+        pieces = []
+        for sentence, tokens in zip(sentences, self._count(sentences)):
+            if tokens <= self.chunk_tokens:
+                pieces.append(sentence)
+            else:
+                pieces.extend(self._split_words(sentence))
+        return [
+            _Unit(piece, tokens, "text", section, joined=i > 0)
+            for i, (piece, tokens) in enumerate(zip(pieces, self._count(pieces)))
+        ]
+
+    def _split_words(self, sentence: str) -> List[str]:
+        """
+        Pack the words of a sentence with no boundary to split on into pieces of at most
+        chunk_tokens. Only a word longer than that (or a CJK run, which has no spaces) is
+        cut, by characters in proportion to its tokens.
+        """
+        words = WORD.findall(sentence)
+        pieces = []
+        part, size = "", 0
+        for word, tokens in zip(words, self._count(words)):
+            if part and size + tokens > self.chunk_tokens:
+                pieces.append(part)
+                part, size = "", 0
+            if tokens > self.chunk_tokens:
+                step = max(1, len(word) * self.chunk_tokens // tokens)
+                pieces.extend(word[start:start + step] for start in range(0, len(word), step))
+                continue
+            part += word
+            size += tokens
+        if part:
+            pieces.append(part)
+        return pieces
+
+    def _units(self, text: str) -> List[_Unit]:
+        blocks = self._blocks(text)
+        units = []
+        for (kind, block, section), tokens in zip(blocks, self._count([block for _, block, _ in blocks])):
+            if tokens <= self.chunk_tokens:
+                units.append(_Unit(block, tokens, kind, section))
+            elif kind == "text" or kind == "heading":
+                units.extend(self._split_paragraph(block, section))
+            else:
+                units.extend(self._split_lines(kind, block, section))
+        return units
+
+    @staticmethod
+    def _join(units: List[_Unit]) -> str:
+        parts = []
+        for i, unit in enumerate(units):
+            if i and not unit.joined:
+                parts.append("\n\n")
+            parts.append(unit.text)
+        return "".join(parts).strip()
+
+    def split_text(self, text: str) -> List[Tuple[str, str]]:
+        """
+        Returns:
+            List of (chunk text, section) pairs, section being the heading path
+            ("Chapter > Section") at the start of the chunk, or "" before any heading
+        """
+        chunks: List[List[_Unit]] = []
+        current: List[_Unit] = []
+        size = 0
+
+        def cost(unit: _Unit, after: List[_Unit]) -> int:
+            """Tokens unit adds to a chunk made of the units in after."""
+            return unit.tokens + (self.separator_tokens if after and not unit.joined else 0)
+
+        def size_of(units: List[_Unit]) -> int:
+            return sum(cost(unit, units[:i]) for i, unit in enumerate(units))
+
+        def flush(next_tokens: int = 0, overlap: bool = False):
+            nonlocal current, size
+            # a heading belongs with the content after it
+            carried = []
+            while current and current[-1].kind == "heading":
+                carried.insert(0, current.pop())
+            if current:
+                chunks.append(current)
+            tail = []
+            if overlap and current:
+                budget = min(
+                    self.overlap_tokens,
+                    self.chunk_tokens - next_tokens - size_of(carried) - self.separator_tokens
+                )
+                for unit in reversed(current):
+                    if unit.kind != "text" or unit.tokens + self.separator_tokens > budget:
+                        break
+                    tail.insert(0, unit)
+                    budget -= unit.tokens + self.separator_tokens
+            current = tail + carried
+            size = size_of(current)
+
+        for unit in self._units(text):
+            if unit.kind == "heading" and size >= self.min_tokens:
+                flush()
+            elif current and size + cost(unit, current) > self.chunk_tokens:
+                flush(unit.tokens + self.separator_tokens, overlap=unit.kind != "heading")
+            size += cost(unit, current)
+            current.append(unit)
+        if current:
+            chunks.append(current)
+
+        results = []
+        for units in chunks:
+            chunk = self._join(units)
+            if chunk:
+                results.append((chunk, units[0].section))
+        return results
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Split documents, copying their metadata and adding the chunk's "section"."""
+        split_docs = []
+        for document in documents:
+            for chunk, section in self.split_text(document.page_content):
+                metadata = dict(document.metadata)
+                if section:
+                    metadata["section"] = section
+                split_docs.append(Document(page_content=chunk, metadata=metadata))
+        return split_docs
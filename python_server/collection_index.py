@@ -0,0 +1,604 @@
+"""
+Local SQLite bookkeeping stored alongside the Chroma collections.
+
+Chroma only knows about chunks; the tables here track what the rest of the server needs
+to know about collections without scanning every chunk.
+"""
+
+import os
+import json
+import base64
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+INDEX_FILENAME = "studymate_index.sqlite3"
+
+
+def connect(persist_directory: str = "./chroma_db") -> sqlite3.Connection:
+    """Open the index database of a Chroma persist directory."""
+    os.makedirs(persist_directory, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(persist_directory, INDEX_FILENAME), timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class IngestionManifest:
+    """
+    Per-collection record of the server-side files ingested by upload_from_paths:
+    path, size, mtime, content hash and the ids of the chunks they produced.
+    Lets re-runs skip unchanged files and replace or delete the chunks of changed
+    and removed files.
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingestion_manifest (
+                    collection TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    PRIMARY KEY (collection, path)
+                )
+            """)
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        entry = dict(row)
+        entry["chunk_ids"] = json.loads(entry["chunk_ids"])
+        return entry
+
+    def get(self, collection: str, path: str) -> Optional[dict]:
+        with connect(self.persist_directory) as conn:
+            row = conn.execute(
+                "SELECT * FROM ingestion_manifest WHERE collection = ? AND path = ?",
+                (collection, path)
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def entries_under(self, collection: str, directory: str) -> List[dict]:
+        """All entries for files inside a directory (at any depth)."""
+        prefix = os.path.join(directory, "")
+        with connect(self.persist_directory) as conn:
+            rows = conn.execute(
+                "SELECT * FROM ingestion_manifest WHERE collection = ? AND substr(path, 1, ?) = ?",
+                (collection, len(prefix), prefix)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def upsert(
+        self,
+        collection: str,
+        path: str,
+        size: int,
+        mtime: float,
+        content_hash: str,
+        chunk_ids: List[str]
+    ) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingestion_manifest "
+                "(collection, path, size, mtime, content_hash, chunk_ids) VALUES (?, ?, ?, ?, ?, ?)",
+                (collection, path, size, mtime, content_hash, json.dumps(chunk_ids))
+            )
+
+    def delete(self, collection: str, path: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute(
+                "DELETE FROM ingestion_manifest WHERE collection = ? AND path = ?",
+                (collection, path)
+            )
+
+    def forget_chunks(self, collection: str, chunk_ids: List[str]) -> None:
+        """
+        Delete the entries of files that lost chunks outside of upload_from_paths, so the
+        next incremental run ingests them again.
+        """
+        deleted = set(chunk_ids)
+        with connect(self.persist_directory) as conn:
+            rows = conn.execute(
+                "SELECT path, chunk_ids FROM ingestion_manifest WHERE collection = ?", (collection,)
+            ).fetchall()
+            conn.executemany(
+                "DELETE FROM ingestion_manifest WHERE collection = ? AND path = ?",
+                [
+                    (collection, row["path"])
+                    for row in rows if deleted.intersection(json.loads(row["chunk_ids"]))
+                ]
+            )
+
+    def drop(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute("DELETE FROM ingestion_manifest WHERE collection = ?", (collection,))
+
+
+class CollectionVersions:
+    """
+    Version counter per collection, bumped on every write (add / delete).
+    Stored in SQLite so all server processes see the same versions; caches key their
+    entries by version, so a bump invalidates them exactly.
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS collection_versions (
+                    collection TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+
+    def get(self, collection: str) -> int:
+        with connect(self.persist_directory) as conn:
+            row = conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()
+        return row["version"] if row else 0
+
+    def bump(self, collection: str) -> int:
+        with connect(self.persist_directory) as conn:
+            conn.execute(
+                "INSERT INTO collection_versions (collection, version) VALUES (?, 1) "
+                "ON CONFLICT(collection) DO UPDATE SET version = version + 1",
+                (collection,)
+            )
+            return conn.execute(
+                "SELECT version FROM collection_versions WHERE collection = ?", (collection,)
+            ).fetchone()["version"]
+
+
+class CollectionBackends:
+    """
+    The embedding backend each collection is bound to. Recorded when a collection is
+    first opened, so changing the configuration never mixes vectors of two backends.
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS collection_backends (
+                    collection TEXT PRIMARY KEY,
+                    backend TEXT NOT NULL
+                )
+            """)
+
+    def get(self, collection: str) -> Optional[str]:
+        with connect(self.persist_directory) as conn:
+            row = conn.execute(
+                "SELECT backend FROM collection_backends WHERE collection = ?", (collection,)
+            ).fetchone()
+        return row["backend"] if row else None
+
+    def set(self, collection: str, backend: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO collection_backends (collection, backend) VALUES (?, ?)",
+                (collection, backend)
+            )
+
+    def drop(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute("DELETE FROM collection_backends WHERE collection = ?", (collection,))
+
+
+class CollectionMigrations:
+    """
+    Personal collections whose private Chroma collection was copied into the shared chunk
+    store, so a migration interrupted before the private collection was dropped is not
+    copied again.
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS collection_migrations (
+                    collection TEXT PRIMARY KEY
+                )
+            """)
+
+    def is_done(self, collection: str) -> bool:
+        with connect(self.persist_directory) as conn:
+            return conn.execute(
+                "SELECT 1 FROM collection_migrations WHERE collection = ?", (collection,)
+            ).fetchone() is not None
+
+    def mark_done(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO collection_migrations (collection) VALUES (?)", (collection,)
+            )
+
+
+FACET_FIELDS = ("course_code", "topic", "filename")
+
+
+class FacetIndex:
+    """
+    Chunk counts per metadata value (course code, topic, filename) for each collection,
+    maintained on insert and delete so facets are served without scanning the chunks.
+    A collection's index is built once from its existing chunks before first use.
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS facets (
+                    collection TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (collection, field, value)
+                );
+                CREATE TABLE IF NOT EXISTS facet_state (
+                    collection TEXT PRIMARY KEY
+                );
+            """)
+
+    @staticmethod
+    def _count_values(metadatas: List[dict]) -> Dict[Tuple[str, str], int]:
+        counts: Dict[Tuple[str, str], int] = {}
+        for metadata in metadatas:
+            if not metadata:
+                continue
+            for field in FACET_FIELDS:
+                if field in metadata and metadata[field] is not None:
+                    key = (field, str(metadata[field]))
+                    counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    def is_built(self, collection: str) -> bool:
+        with connect(self.persist_directory) as conn:
+            return conn.execute(
+                "SELECT 1 FROM facet_state WHERE collection = ?", (collection,)
+            ).fetchone() is not None
+
+    def rebuild(self, collection: str, metadata_pages: Iterable[List[dict]]) -> None:
+        """Recount a collection from scratch, from pages of chunk metadatas."""
+        counts: Dict[Tuple[str, str], int] = {}
+        for metadatas in metadata_pages:
+            for key, count in self._count_values(metadatas).items():
+                counts[key] = counts.get(key, 0) + count
+        with connect(self.persist_directory) as conn:
+            conn.execute("DELETE FROM facets WHERE collection = ?", (collection,))
+            conn.executemany(
+                "INSERT INTO facets (collection, field, value, count) VALUES (?, ?, ?, ?)",
+                [(collection, field, value, count) for (field, value), count in counts.items()]
+            )
+            conn.execute("INSERT OR IGNORE INTO facet_state (collection) VALUES (?)", (collection,))
+
+    def add(self, collection: str, metadatas: List[dict]) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.executemany(
+                "INSERT INTO facets (collection, field, value, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(collection, field, value) DO UPDATE SET count = count + excluded.count",
+                [
+                    (collection, field, value, count)
+                    for (field, value), count in self._count_values(metadatas).items()
+                ]
+            )
+
+    def remove(self, collection: str, metadatas: List[dict]) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.executemany(
+                "UPDATE facets SET count = count - ? WHERE collection = ? AND field = ? AND value = ?",
+                [
+                    (count, collection, field, value)
+                    for (field, value), count in self._count_values(metadatas).items()
+                ]
+            )
+            conn.execute("DELETE FROM facets WHERE collection = ? AND count <= 0", (collection,))
+
+    def drop(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute("DELETE FROM facets WHERE collection = ?", (collection,))
+            conn.execute("DELETE FROM facet_state WHERE collection = ?", (collection,))
+
+    def get(self, collection: str) -> Dict[str, Dict[str, int]]:
+        """Return {field: {value: chunk count}} for a collection."""
+        facets: Dict[str, Dict[str, int]] = {field: {} for field in FACET_FIELDS}
+        with connect(self.persist_directory) as conn:
+            for row in conn.execute(
+                "SELECT field, value, count FROM facets WHERE collection = ? ORDER BY field, value",
+                (collection,)
+            ):
+                facets[row["field"]][row["value"]] = row["count"]
+        return facets
+
+    def may_match(self, collection: str, metadata_filters: Optional[dict]) -> bool:
+        """
+        False when no chunk can match the filters: some filtered field has none of its
+        values in the collection. True does not guarantee a match (fields are AND-ed).
+        """
+        if not metadata_filters:
+            return True
+        with connect(self.persist_directory) as conn:
+            for field in FACET_FIELDS:
+                values = metadata_filters.get(field)
+                if not values:
+                    continue
+                row = conn.execute(
+                    f"SELECT 1 FROM facets WHERE collection = ? AND field = ? "
+                    f"AND value IN ({','.join('?' * len(values))}) AND count > 0 LIMIT 1",
+                    [collection, field, *[str(value) for value in values]]
+                ).fetchone()
+                if row is None:
+                    return False
+        return True
+
+
+class DocumentRegistry:
+    """
+    One row per document (chunks sharing a filename) of each collection: filename, type,
+    course code, topic, chunk count, byte size of the chunk text and date added, with the
+    chunk ids of each document in a table of their own. Maintained on insert and delete,
+    so listing a collection is an indexed query instead of a scan over every chunk. A
+    collection is registered once from its existing chunks before first use.
+    """
+
+    # sort key accepted by page() -> column
+    SORT_COLUMNS = {
+        "date_added": "date_added",
+        "filename": "filename",
+        "type": "type",
+        "chunk_count": "chunk_count",
+        "byte_size": "byte_size"
+    }
+
+    DOCUMENTS_TABLE = """
+        CREATE TABLE IF NOT EXISTS documents (
+            collection TEXT NOT NULL,
+            document_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            type TEXT NOT NULL,
+            course_code TEXT,
+            topic TEXT,
+            chunk_count INTEGER NOT NULL,
+            byte_size INTEGER NOT NULL,
+            date_added TEXT NOT NULL,
+            PRIMARY KEY (collection, document_id)
+        );
+        CREATE INDEX IF NOT EXISTS documents_by_date ON documents (collection, date_added, document_id);
+        CREATE INDEX IF NOT EXISTS documents_by_filename ON documents (collection, filename, document_id);
+        CREATE INDEX IF NOT EXISTS documents_by_type ON documents (collection, type, document_id);
+        CREATE INDEX IF NOT EXISTS documents_by_chunks ON documents (collection, chunk_count, document_id);
+        CREATE INDEX IF NOT EXISTS documents_by_size ON documents (collection, byte_size, document_id);
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.executescript(self.DOCUMENTS_TABLE + """
+                CREATE TABLE IF NOT EXISTS document_chunks (
+                    collection TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (collection, document_id, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS document_registry_state (
+                    collection TEXT PRIMARY KEY
+                );
+            """)
+            # Registries created when the chunk ids were a JSON list in the documents row
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "chunk_ids" in columns:
+                conn.executescript("""
+                    BEGIN;
+                    INSERT OR IGNORE INTO document_chunks (collection, document_id, chunk_id)
+                        SELECT d.collection, d.document_id, j.value
+                        FROM documents d, json_each(d.chunk_ids) j;
+                    ALTER TABLE documents RENAME TO documents_with_chunk_ids;
+                    DROP INDEX IF EXISTS documents_by_date;
+                    DROP INDEX IF EXISTS documents_by_filename;
+                    DROP INDEX IF EXISTS documents_by_type;
+                    DROP INDEX IF EXISTS documents_by_chunks;
+                    DROP INDEX IF EXISTS documents_by_size;
+                """ + self.DOCUMENTS_TABLE + """
+                    INSERT INTO documents (collection, document_id, filename, type, course_code, topic,
+                                           chunk_count, byte_size, date_added)
+                        SELECT collection, document_id, filename, type, course_code, topic,
+                               chunk_count, byte_size, date_added
+                        FROM documents_with_chunk_ids;
+                    DROP TABLE documents_with_chunk_ids;
+                    COMMIT;
+                """)
+
+    @staticmethod
+    def _group_chunks(ids: List[str], metadatas: List[dict], documents: List[str]) -> Dict[str, dict]:
+        """Group chunks by document id (their filename)."""
+        groups: Dict[str, dict] = {}
+        for chunk_id, metadata, text in zip(ids, metadatas, documents):
+            metadata = metadata or {}
+            document_id = str(metadata.get("filename", "Unknown"))
+            group = groups.setdefault(document_id, {
+                "metadata": metadata,
+                "chunk_ids": [],
+                "byte_size": 0
+            })
+            group["chunk_ids"].append(chunk_id)
+            group["byte_size"] += len((text or "").encode("utf-8"))
+        return groups
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        entry = dict(row)
+        del entry["collection"]
+        entry["id"] = entry.pop("document_id")
+        return entry
+
+    def _add_groups(self, conn: sqlite3.Connection, collection: str, groups: Dict[str, dict]) -> None:
+        for document_id, group in groups.items():
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO document_chunks (collection, document_id, chunk_id) VALUES (?, ?, ?)",
+                [(collection, document_id, chunk_id) for chunk_id in group["chunk_ids"]]
+            )
+            added = conn.total_changes - before
+            updated = conn.execute(
+                "UPDATE documents SET chunk_count = chunk_count + ?, byte_size = byte_size + ? "
+                "WHERE collection = ? AND document_id = ?",
+                (added, group["byte_size"], collection, document_id)
+            ).rowcount
+            if updated:
+                continue
+            metadata = group["metadata"]
+            conn.execute(
+                "INSERT INTO documents (collection, document_id, filename, type, course_code, topic, "
+                "chunk_count, byte_size, date_added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    collection,
+                    document_id,
+                    document_id,
+                    metadata.get("type", "Unknown"),
+                    metadata.get("course_code"),
+                    metadata.get("topic"),
+                    added,
+                    group["byte_size"],
+                    metadata.get("date_added", "Unknown")
+                )
+            )
+
+    def is_built(self, collection: str) -> bool:
+        with connect(self.persist_directory) as conn:
+            return conn.execute(
+                "SELECT 1 FROM document_registry_state WHERE collection = ?", (collection,)
+            ).fetchone() is not None
+
+    def rebuild(
+        self,
+        collection: str,
+        chunk_pages: Iterable[Tuple[List[str], List[dict], List[str]]]
+    ) -> None:
+        """Register a collection from scratch, from pages of (ids, metadatas, documents)."""
+        with connect(self.persist_directory) as conn:
+            self._drop(conn, collection)
+            for ids, metadatas, documents in chunk_pages:
+                self._add_groups(conn, collection, self._group_chunks(ids, metadatas, documents))
+            conn.execute(
+                "INSERT OR IGNORE INTO document_registry_state (collection) VALUES (?)", (collection,)
+            )
+
+    def add(self, collection: str, ids: List[str], metadatas: List[dict], documents: List[str]) -> None:
+        with connect(self.persist_directory) as conn:
+            self._add_groups(conn, collection, self._group_chunks(ids, metadatas, documents))
+
+    def remove(self, collection: str, ids: List[str], metadatas: List[dict], documents: List[str]) -> None:
+        with connect(self.persist_directory) as conn:
+            for document_id, group in self._group_chunks(ids, metadatas, documents).items():
+                removed = 0
+                for start in range(0, len(group["chunk_ids"]), 500):
+                    batch = group["chunk_ids"][start:start + 500]
+                    removed += conn.execute(
+                        f"DELETE FROM document_chunks WHERE collection = ? AND document_id = ? "
+                        f"AND chunk_id IN ({','.join('?' * len(batch))})",
+                        [collection, document_id, *batch]
+                    ).rowcount
+                if not removed:
+                    continue
+                conn.execute(
+                    "UPDATE documents SET chunk_count = chunk_count - ?, byte_size = MAX(0, byte_size - ?) "
+                    "WHERE collection = ? AND document_id = ?",
+                    (removed, group["byte_size"], collection, document_id)
+                )
+                conn.execute(
+                    "DELETE FROM documents WHERE collection = ? AND document_id = ? AND chunk_count <= 0",
+                    (collection, document_id)
+                )
+
+    @staticmethod
+    def _drop(conn: sqlite3.Connection, collection: str) -> None:
+        conn.execute("DELETE FROM documents WHERE collection = ?", (collection,))
+        conn.execute("DELETE FROM document_chunks WHERE collection = ?", (collection,))
+
+    def drop(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            self._drop(conn, collection)
+            conn.execute("DELETE FROM document_registry_state WHERE collection = ?", (collection,))
+
+    def get(self, collection: str, document_id: str) -> Optional[dict]:
+        """A document with its chunk ids, which page() leaves out."""
+        with connect(self.persist_directory) as conn:
+            row = conn.execute(
+                "SELECT * FROM documents WHERE collection = ? AND document_id = ?",
+                (collection, document_id)
+            ).fetchone()
+            if not row:
+                return None
+            entry = self._to_dict(row)
+            entry["chunk_ids"] = [
+                chunk["chunk_id"] for chunk in conn.execute(
+                    "SELECT chunk_id FROM document_chunks WHERE collection = ? AND document_id = ?",
+                    (collection, document_id)
+                )
+            ]
+        return entry
+
+    def count(self, collection: str) -> int:
+        with connect(self.persist_directory) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?", (collection,)
+            ).fetchone()[0]
+
+    @staticmethod
+    def encode_cursor(value, document_id: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([value, document_id]).encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[object, str]:
+        try:
+            value, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        return value, document_id
+
+    def page(
+        self,
+        collection: str,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        sort: str = "date_added",
+        order: str = "desc"
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        One page of a collection's documents, keyset paginated on (sort column, document id).
+
+        Args:
+            limit: Documents per page
+            cursor: next_cursor of the previous page, None for the first page
+            sort: One of SORT_COLUMNS
+            order: "asc" or "desc"
+
+        Returns:
+            Tuple containing:
+                - the documents of the page
+                - the cursor of the next page, None on the last page
+        """
+        if sort not in self.SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort: {sort}. Supported: {', '.join(self.SORT_COLUMNS)}")
+        if order not in ("asc", "desc"):
+            raise ValueError("order must be 'asc' or 'desc'")
+        column = self.SORT_COLUMNS[sort]
+        direction, comparison = ("ASC", ">") if order == "asc" else ("DESC", "<")
+
+        query = "SELECT * FROM documents WHERE collection = ?"
+        params: list = [collection]
+        if cursor:
+            value, document_id = self.decode_cursor(cursor)
+            query += f" AND ({column} {comparison} ? OR ({column} = ? AND document_id {comparison} ?))"
+            params += [value, value, document_id]
+        query += f" ORDER BY {column} {direction}, document_id {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        with connect(self.persist_directory) as conn:
+            rows = conn.execute(query, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = self.encode_cursor(rows[-1][column], rows[-1]["document_id"])
+        return [self._to_dict(row) for row in rows], next_cursor
@@ -0,0 +1,254 @@
+"""
+Compact vector storage.
+
+A collection created with VECTOR_STORAGE=compact keeps only a truncated, renormalized
+copy of each embedding (COMPACT_DIMENSIONS dims) in the Chroma HNSW index, which is what
+Chroma holds in memory, and the full-dimension vector scalar-quantized to float16 or int8
+(one float32 scale per vector) in the collection index database. A search takes
+RERANK_CANDIDATES x k candidates from the small index and reranks them by their exact
+distance over the dequantized full vectors, in the collection's own metric.
+
+The storage settings are recorded in the Chroma collection metadata when a collection is
+created, so existing full-precision collections keep working whatever the configuration.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+import numpy as np
+from collection_index import connect
+
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full")  # "full" or "compact"
+COMPACT_DIMENSIONS = int(os.getenv("COMPACT_DIMENSIONS", "256"))  # 0 keeps every dimension
+COMPACT_QUANTIZATION = os.getenv("COMPACT_QUANTIZATION", "int8")  # "int8" or "float16"
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "4"))
+
+QUANTIZATIONS = ("int8", "float16")
+
+
+def storage_metadata() -> Dict[str, Any]:
+    """Chroma collection metadata for a new collection under the current configuration."""
+    if VECTOR_STORAGE != "compact":
+        return {}
+    if COMPACT_QUANTIZATION not in QUANTIZATIONS:
+        raise ValueError(f"Unknown COMPACT_QUANTIZATION: {COMPACT_QUANTIZATION}")
+    return {
+        "storage": "compact",
+        "storage_dimensions": COMPACT_DIMENSIONS,
+        "storage_quantization": COMPACT_QUANTIZATION
+    }
+
+
+def quantize(vectors: np.ndarray, quantization: str) -> List[bytes]:
+    if quantization == "float16":
+        return [vector.astype(np.float16).tobytes() for vector in vectors]
+    # symmetric int8 with a per-vector scale stored in front
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return [
+        np.float32(scale).tobytes() + row.tobytes()
+        for scale, row in zip(scales, quantized)
+    ]
+
+
+def dequantize(blobs: List[bytes], quantization: str) -> np.ndarray:
+    if quantization == "float16":
+        return np.stack([np.frombuffer(blob, dtype=np.float16) for blob in blobs]).astype(np.float32)
+    return np.stack([
+        np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * np.frombuffer(blob[:4], dtype=np.float32)[0]
+        for blob in blobs
+    ])
+
+
+def truncate(vectors: np.ndarray, dimensions: int) -> np.ndarray:
+    """Keep the first dimensions and renormalize, so l2 / cosine ranking still holds."""
+    if not dimensions or dimensions >= vectors.shape[1]:
+        return vectors
+    truncated = vectors[:, :dimensions]
+    return truncated / np.maximum(np.linalg.norm(truncated, axis=1, keepdims=True), 1e-12)
+
+
+def distances(query_embedding: List[float], embeddings: Any, space: str = "l2") -> np.ndarray:
+    """Distances from the query as Chroma computes them for an hnsw:space."""
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if space == "ip":
+        return 1 - vectors @ query_vector
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+        return 1 - (vectors @ query_vector) / np.maximum(norms, 1e-12)
+    return ((vectors - query_vector) ** 2).sum(axis=1)
+
+
+class QuantizedVectors:
+    """Quantized full-dimension vectors by (Chroma collection, chunk id)."""
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS quantized_vectors (
+                    collection TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (collection, chunk_id)
+                ) WITHOUT ROWID
+            """)
+
+    def put(self, collection: str, ids: List[str], blobs: List[bytes]) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO quantized_vectors (collection, chunk_id, vector) VALUES (?, ?, ?)",
+                [(collection, chunk_id, blob) for chunk_id, blob in zip(ids, blobs)]
+            )
+
+    def get(self, collection: str, ids: List[str]) -> Dict[str, bytes]:
+        found = {}
+        with connect(self.persist_directory) as conn:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                found.update(conn.execute(
+                    f"SELECT chunk_id, vector FROM quantized_vectors WHERE collection = ? "
+                    f"AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [collection, *batch]
+                ).fetchall())
+        return found
+
+    def sample(self, collection: str) -> Optional[bytes]:
+        """Any one stored vector of a collection, or None if it has none."""
+        with connect(self.persist_directory) as conn:
+            row = conn.execute(
+                "SELECT vector FROM quantized_vectors WHERE collection = ? LIMIT 1", (collection,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def remove(self, collection: str, ids: List[str]) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.executemany(
+                "DELETE FROM quantized_vectors WHERE collection = ? AND chunk_id = ?",
+                [(collection, chunk_id) for chunk_id in ids]
+            )
+
+    def drop(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            conn.execute("DELETE FROM quantized_vectors WHERE collection = ?", (collection,))
+
+
+class CompactCollection:
+    """
+    Wraps a Chroma collection created with compact storage metadata, exposing the same
+    add / get / delete / query / count calls with full-dimension vectors, see the
+    module docstring.
+    """
+
+    def __init__(self, collection: Any, persist_directory: str = "./chroma_db"):
+        self.inner = collection
+        self.name = collection.name
+        self.metadata = collection.metadata or {}
+        self.dimensions = int(self.metadata.get("storage_dimensions", 0))
+        self.quantization = self.metadata.get("storage_quantization", "int8")
+        self.space = self.metadata.get("hnsw:space", "l2")
+        self.vectors = QuantizedVectors(persist_directory)
+
+    @staticmethod
+    def is_compact(collection: Any) -> bool:
+        return (collection.metadata or {}).get("storage") == "compact"
+
+    def _full_vectors(self, ids: List[str], dimensions: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Full-dimension vectors by id. Chunks without a quantized row fall back to their
+        index vector, zero-padded to the full dimension (given, or that of the stored
+        vectors) so it can be compared with the others.
+        """
+        blobs = self.vectors.get(self.name, ids)
+        found = list(blobs)
+        vectors = {}
+        if found:
+            vectors = dict(zip(found, dequantize([blobs[chunk_id] for chunk_id in found], self.quantization)))
+        missing = [chunk_id for chunk_id in ids if chunk_id not in vectors]
+        if not missing:
+            return vectors
+        index = self.inner.get(ids=missing, include=["embeddings"])
+        if dimensions is None:
+            sample = next(iter(vectors.values()), None)
+            if sample is None:
+                sample_blob = self.vectors.sample(self.name)
+                sample = dequantize([sample_blob], self.quantization)[0] if sample_blob else None
+            dimensions = len(sample) if sample is not None else 0
+        for chunk_id, embedding in zip(index["ids"], index["embeddings"]):
+            vector = np.asarray(embedding, dtype=np.float32)
+            vectors[chunk_id] = np.pad(vector, (0, max(0, dimensions - len(vector))))
+        return vectors
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        documents: Optional[List[str]] = None
+    ) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        self.vectors.put(self.name, ids, quantize(vectors, self.quantization))
+        self.inner.add(
+            ids=ids,
+            embeddings=truncate(vectors, self.dimensions).tolist(),
+            metadatas=metadatas,
+            documents=documents
+        )
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        include = ["metadatas", "documents"] if include is None else include
+        result = self.inner.get(
+            ids=ids, include=[field for field in include if field != "embeddings"], **kwargs
+        )
+        if "embeddings" in include:
+            vectors = self._full_vectors(list(result["ids"]))
+            result["embeddings"] = [vectors.get(chunk_id) for chunk_id in result["ids"]]
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None) -> None:
+        if ids is None or where is not None:
+            ids = self.inner.get(ids=ids, where=where, include=[])["ids"]
+        if not ids:
+            return
+        self.inner.delete(ids=ids)
+        self.vectors.remove(self.name, ids)
+
+    def count(self) -> int:
+        return self.inner.count()
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Candidates from the truncated index, reranked over the full-dimension vectors."""
+        include = include or ["metadatas", "documents", "distances"]
+        query_vector = np.asarray(query_embeddings[0], dtype=np.float32)[None, :]
+        candidates = self.inner.query(
+            query_embeddings=truncate(query_vector, self.dimensions).tolist(),
+            n_results=n_results * max(1, RERANK_CANDIDATES),
+            where=where,
+            include=[field for field in include if field in ("metadatas", "documents")]
+        )
+        ids = list(candidates["ids"][0])
+        if not ids:
+            return {"ids": [[]], **{field: [[]] for field in include}}
+
+        vectors = self._full_vectors(ids, query_vector.shape[1])
+        # Chunks deleted since the candidate query
+        ids = [chunk_id for chunk_id in ids if chunk_id in vectors]
+        if not ids:
+            return {"ids": [[]], **{field: [[]] for field in include}}
+        exact = distances(query_vector[0], np.stack([vectors[chunk_id] for chunk_id in ids]), self.space)
+        order = np.argsort(exact)[:n_results]
+        positions = {chunk_id: i for i, chunk_id in enumerate(candidates["ids"][0])}
+
+        result: Dict[str, Any] = {"ids": [[ids[i] for i in order]]}
+        for field in ("metadatas", "documents"):
+            if field in include:
+                result[field] = [[candidates[field][0][positions[ids[i]]] for i in order]]
+        if "distances" in include:
+            result["distances"] = [[float(exact[i]) for i in order]]
+        return result
@@ -0,0 +1,146 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import time
+from importlib import metadata
+from typing import Dict, Optional
+
+# Bump this when the cached markdown format changes (e.g. post-processing of converter output)
+CACHE_FORMAT_VERSION = "1"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path: str) -> str:
+    """Hash a file in fixed-size chunks so large uploads are never fully loaded into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def converter_version(package: str) -> str:
+    """Installed version of a converter package, or 'unknown' if it can't be resolved."""
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+class ConversionCache:
+    """
+    Persistent on-disk cache of converted markdown.
+
+    Entries are content-addressed: the key combines the file's SHA-256, the conversion
+    mode and the converter version, so a new marker/markitdown release never serves
+    stale output. Markdown is stored as one file per entry and an SQLite index tracks
+    sizes and last access times for size-bounded LRU eviction.
+    """
+
+    def __init__(self, cache_dir: str = "./conversion_cache", max_bytes: int = 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite3"), timeout=30)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.md")
+
+    @staticmethod
+    def make_key(content_hash: str, mode: str, version: str) -> str:
+        """Build the cache key for one (content, mode, converter version) combination."""
+        raw = f"{CACHE_FORMAT_VERSION}:{content_hash}:{mode}:{version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached markdown for key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE key = ?",
+                    (time.time(), key)
+                )
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        """Store markdown for key and evict least recently used entries if over budget."""
+        data = text.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)",
+                    (key, len(data), time.time())
+                )
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(self._entry_path(key))
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process plus the current on-disk footprint."""
+        with self._connect() as conn:
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes
+        }
+
+
+conversion_cache = ConversionCache(
+    cache_dir=os.getenv("CONVERSION_CACHE_DIR", "./conversion_cache"),
+    max_bytes=int(os.getenv("CONVERSION_CACHE_MAX_MB", "1024")) * 1024 * 1024
+)
@@ -0,0 +1,162 @@
+import os
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+
+
+def _init_worker(warmup_marker: bool) -> None:
+    """Load the converters once per worker process instead of once per job."""
+    from document_manager import DocumentManager
+    DocumentManager.warmup(load_marker=warmup_marker)
+
+
+def _noop() -> None:
+    pass
+
+
+def convert_in_worker(file_path: str, mode: str) -> str:
+    """Entry point executed inside a worker process."""
+    from document_manager import DocumentManager
+    return DocumentManager.convert_file(file_path, mode)
+
+
+def convert_pdf_range_in_worker(file_path: str, page_range: List[int]) -> Tuple[Dict[int, str], Dict[str, Any]]:
+    """Convert a page range of a PDF with marker inside a worker process."""
+    import marker_models
+    text, images = marker_models.convert_pdf(file_path, page_range=page_range)
+    return marker_models.split_paginated(text), images
+
+
+def ocr_batch_in_worker(file_paths: List[str]) -> List[str]:
+    """OCR a batch of images inside a worker process."""
+    from document_manager import DocumentManager
+    return DocumentManager.ocr_images(file_paths)
+
+
+class ConversionPool:
+    """
+    Process pool for the CPU-heavy document converters (marker, markitdown).
+
+    Conversions run outside the uvicorn event loop so one large PDF doesn't stall
+    other requests. The number of queued + running jobs is capped, and callers stop
+    waiting on a job after a timeout.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue: int = 16,
+        timeout: float = 600,
+        warmup_marker: bool = False
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.warmup_marker = warmup_marker
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn avoids forking a parent that already holds torch/marker state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.warmup_marker,)
+                )
+            return self._executor
+
+    def _release(self, _future: Optional[Future] = None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a pool a dead worker broke; a new one is started on the next job."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Run fn(*args) in a worker process and await its result.
+
+        Raises:
+            HTTPException(503) if the queue is full or a worker process died
+            HTTPException(504) if the job doesn't finish within the timeout
+        """
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Conversion queue is full, please retry later"
+                )
+            self._pending += 1
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException as e:
+            self._release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard_executor(executor)
+                raise HTTPException(status_code=503, detail="Conversion worker died, please retry")
+            raise
+        # The slot is freed when the job really ends: a job that timed out keeps its
+        # worker busy until it finishes
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future),
+                timeout=timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            # Only drops the job if it hasn't started yet
+            future.cancel()
+            raise HTTPException(
+                status_code=504,
+                detail="Document conversion timed out"
+            )
+        except BrokenProcessPool:
+            # e.g. the OOM killer took a worker: every job of this pool fails from now on
+            print("Conversion pool broken by a dead worker, restarting it")
+            self._discard_executor(executor)
+            raise HTTPException(status_code=503, detail="Conversion worker died, please retry")
+
+    async def warmup(self) -> None:
+        """Start the worker processes now so the first conversion doesn't pay for it."""
+        await asyncio.gather(*(
+            asyncio.wrap_future(self._get_executor().submit(_noop))
+            for _ in range(self.max_workers)
+        ))
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker processes; a new pool is started on the next job."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+conversion_pool = ConversionPool(
+    max_workers=int(os.getenv("CONVERSION_WORKERS", "2")),
+    max_queue=int(os.getenv("CONVERSION_QUEUE_LIMIT", "16")),
+    timeout=float(os.getenv("CONVERSION_TIMEOUT", "600")),
+    warmup_marker=os.getenv("MARKER_WARMUP", "false").lower() == "true"
+)
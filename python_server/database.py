@@ -1,59 +1,546 @@
 import os
-from typing import List, Dict, Any, Optional
+import time
+import sqlite3
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import numpy as np
+import chromadb
+from chromadb.config import Settings
 from langchain_chroma import Chroma
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings, OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.schema import Document
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from embedding_backends import configured_backend, get_embeddings
+from collection_index import (
+    INDEX_FILENAME, CollectionBackends, CollectionMigrations, CollectionVersions,
+    DocumentRegistry, FacetIndex
+)
+from lexical_index import LexicalIndex
+from shared_chunks import ReferenceCollection, reference_count
+from compact_vectors import CompactCollection, QuantizedVectors, distances, storage_metadata
+from retrieval_cache import retrieval_cache
+from chunking import MarkdownChunker
 
 # Load environment variables / Change to your API key
 load_dotenv()
-os.environ["AZURE_OPENAI_ENDPOINT"] = "https://hkust.azure-api.net"
-os.environ["AZURE_OPENAI_API_KEY"] = os.getenv("AZURE_OPENAI_API_KEY")
-os.environ["AZURE_OPENAI_API_VERSION"] = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-01-preview")
 
-embed_model = AzureOpenAIEmbeddings()
+# Embedding models are built per backend on first use (see embedding_backends), and
+# cached on disk by (model, text hash) for both chunks and queries
+
+# Token-aware markdown chunker, sized by CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS; created on
+# first use since loading the tokenizer may need the network
+_chunker: Optional[MarkdownChunker] = None
+_chunker_lock = threading.Lock()
+
+
+def get_chunker() -> MarkdownChunker:
+    global _chunker
+    with _chunker_lock:
+        if _chunker is None:
+            _chunker = MarkdownChunker()
+        return _chunker
+
+# Chunks per embedding request, concurrent embedding requests and retries per failed batch
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+
+# Open collection handles kept in the pool, and memory budget for Chroma's loaded HNSW segments
+MAX_OPEN_COLLECTIONS = int(os.getenv("CHROMA_MAX_OPEN_COLLECTIONS", "64"))
+CHROMA_MEMORY_LIMIT_BYTES = int(os.getenv("CHROMA_MEMORY_LIMIT_MB", "2048")) * 1024 * 1024
+
+# Hybrid search: weight of the vector score against BM25, and candidates fetched per result
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", "0.5"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "5"))
+SEARCH_MODES = ("vector", "hybrid", "mmr")
+
+# MMR: relevance / diversity trade-off, candidates fetched per result, and the cosine
+# similarity above which a candidate counts as a near duplicate of a selected chunk
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "5"))
+MMR_DUPLICATE_THRESHOLD = float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+
+# Personal collections keep references into one content-addressed chunk store
+SHARED_CHUNK_STORE = os.getenv("SHARED_CHUNK_STORE", "true").lower() == "true"
+SHARED_CHUNK_COLLECTION = os.getenv("SHARED_CHUNK_COLLECTION", "shared_chunks")
+PERSONAL_COLLECTION_PREFIX = "user_"
+
+# A compaction copies a collection to {name}__compacting, renames the original to
+# {name}__superseded, renames the copy to {name} and drops the superseded original
+COMPACTING_SUFFIX = "__compacting"
+SUPERSEDED_SUFFIX = "__superseded"
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
 
 class ChromaDB:
-    _instances: Dict[str, 'ChromaDB'] = {}  # Collection name -> Instance mapping
+    # Collection name -> Instance mapping, in least recently used order
+    _instances: "OrderedDict[str, ChromaDB]" = OrderedDict()
+    _clients: Dict[str, Any] = {}  # persist directory -> process-wide Chroma client
+    _lock = threading.RLock()
+    # (persist directory, Chroma collection name) -> lock held by writes and compaction,
+    # and the number of times the Chroma collection was rebuilt by a compaction
+    _write_locks: Dict[Tuple[str, str], threading.RLock] = {}
+    _store_generations: Dict[Tuple[str, str], int] = {}
+    # (persist directory, collection name) of the lexical indexes being built in the background
+    _lexical_builds: set = set()
     
     def __init__(self, collection_name: str = "default", persist_directory: str = "./chroma_db"):
         self.persist_directory = persist_directory
         self.collection_name = collection_name
+        self.is_personal = SHARED_CHUNK_STORE and collection_name.startswith(PERSONAL_COLLECTION_PREFIX)
+        self.backends = CollectionBackends(persist_directory)
+        self.embedding_backend = self._resolve_backend()
+        self.embed_model = get_embeddings(self.embedding_backend)
+        self._open_storage()
+        self.versions = CollectionVersions(persist_directory)
+        self.facets = FacetIndex(persist_directory)
+        self.registry = DocumentRegistry(persist_directory)
+        self.lexical = LexicalIndex(persist_directory)
+
+    @classmethod
+    def get_client(cls, persist_directory: str = "./chroma_db"):
+        """
+        Return the process-wide persistent client for a directory.
+        Chroma's LRU segment cache keeps the loaded indexes within CHROMA_MEMORY_LIMIT_MB.
+        """
+        with cls._lock:
+            if persist_directory not in cls._clients:
+                client = chromadb.PersistentClient(
+                    path=persist_directory,
+                    settings=Settings(
+                        anonymized_telemetry=False,
+                        chroma_segment_cache_policy="LRU",
+                        chroma_memory_limit_bytes=CHROMA_MEMORY_LIMIT_BYTES
+                    )
+                )
+                cls._recover_compactions(client)
+                cls._clients[persist_directory] = client
+            return cls._clients[persist_directory]
+
+    @staticmethod
+    def _recover_compactions(client) -> None:
+        """
+        Finish the compactions a crash interrupted. Where the original is gone, the copy
+        (complete once the original was renamed) or else the superseded original is
+        renamed back; leftovers next to an intact original are dropped.
+        """
+        # Collection objects before chromadb 0.6, names after
+        names = {getattr(collection, "name", collection) for collection in client.list_collections()}
+        originals = {
+            name[:-len(suffix)]
+            for name in names
+            for suffix in (COMPACTING_SUFFIX, SUPERSEDED_SUFFIX)
+            if name.endswith(suffix)
+        }
+        for name in sorted(originals):
+            copy, superseded = name + COMPACTING_SUFFIX, name + SUPERSEDED_SUFFIX
+            if name not in names:
+                restored = copy if copy in names else superseded
+                print(f"Restoring {name} from {restored} after an interrupted compaction")
+                client.get_collection(restored).modify(name=name)
+                names.discard(restored)
+            for leftover in (copy, superseded):
+                if leftover in names:
+                    print(f"Dropping {leftover} left by an interrupted compaction")
+                    client.delete_collection(leftover)
+
+    @classmethod
+    def _write_lock(cls, persist_directory: str, name: str) -> threading.RLock:
+        with cls._lock:
+            return cls._write_locks.setdefault((persist_directory, name), threading.RLock())
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold the write lock of the Chroma collection behind this instance (shared by the
+        personal collections of one chunk store), reopening it if it was compacted since.
+        """
+        key = (self.persist_directory, self._chroma_collection_name())
+        with self._write_lock(*key):
+            if self._storage_generation != ChromaDB._store_generations.get(key, 0):
+                self._open_storage()
+            yield
+
+    def _open_storage(self) -> None:
+        """Open the Chroma collection behind this instance."""
+        key = (self.persist_directory, self._chroma_collection_name())
+        self._storage_generation = ChromaDB._store_generations.get(key, 0)
         self.vector_store = self._initialize_vector_store()
+        # Collections created with compact storage are read and written through the wrapper
+        storage = self.vector_store._collection
+        if CompactCollection.is_compact(storage):
+            storage = CompactCollection(storage, self.persist_directory)
+        if self.is_personal:
+            self.collection = ReferenceCollection(self.collection_name, storage, self.persist_directory)
+        else:
+            self.collection = storage
+
+    def _chroma_collection_name(self) -> str:
+        """Personal collections live in the shared chunk store of their embedding backend."""
+        if not self.is_personal:
+            return self.collection_name
+        if self.embedding_backend == "azure":
+            return SHARED_CHUNK_COLLECTION
+        return f"{SHARED_CHUNK_COLLECTION}_{self.embedding_backend}"
+
+    def _resolve_backend(self) -> str:
+        """
+        The embedding backend bound to this collection, binding it on first open:
+        collections that already have chunks were embedded with Azure before backends
+        were selectable, new ones follow the configuration. The binding is only saved
+        once the backend's embeddings could be built, so a misconfigured backend name
+        doesn't stick to the collection.
+        """
+        backend = self.backends.get(self.collection_name)
+        if backend:
+            return backend
+        client = self.get_client(self.persist_directory)
+        try:
+            client.get_collection(self.collection_name)
+            exists = True
+        except Exception:
+            exists = self.is_personal and reference_count(self.collection_name, self.persist_directory) > 0
+        backend = "azure" if exists else configured_backend(self.collection_name)
+        # Raises for an unknown backend or one whose model can't be loaded
+        get_embeddings(backend)
+        self.backends.set(self.collection_name, backend)
+        return backend
 
     def _initialize_vector_store(self) -> Chroma:
-        """Initialize or load the Chroma vector store with specific collection."""
+        """
+        Initialize or load the Chroma vector store with specific collection.
+        Personal collections open the shared chunk store instead. New collections get
+        the storage settings of VECTOR_STORAGE in their metadata.
+        """
+        client = self.get_client(self.persist_directory)
+        name = self._chroma_collection_name()
+        try:
+            client.get_collection(name)
+            collection_metadata = None
+        except Exception:
+            collection_metadata = storage_metadata() or None
         return Chroma(
-            collection_name=self.collection_name,
-            persist_directory=self.persist_directory,
-            embedding_function=embed_model
+            client=client,
+            collection_name=name,
+            embedding_function=self.embed_model,
+            collection_metadata=collection_metadata
         )
 
-    def add_documents(self, documents: List[Document]) -> None:
-        """Add documents to the vector store."""
+    def _migrate_private_collection(self, private, page_size: int = 1000) -> None:
+        """
+        Copy the chunks of a personal collection created before the shared chunk store
+        into it, keeping their ids and metadata.
+        """
+        print(f"Moving {private.count()} chunks of {self.collection_name} to the shared chunk store")
+        offset = 0
+        while True:
+            page = private.get(
+                include=["embeddings", "metadatas", "documents"], limit=page_size, offset=offset
+            )
+            if not len(page["ids"]):
+                break
+            self.collection.add(
+                ids=page["ids"],
+                embeddings=page["embeddings"],
+                metadatas=page["metadatas"],
+                documents=page["documents"]
+            )
+            offset += len(page["ids"])
+
+    @classmethod
+    def migrate_private_collections(cls, persist_directory: str = "./chroma_db") -> None:
+        """
+        Move the personal collections created before the shared chunk store into it and
+        drop their private Chroma collections. Run once at startup, before requests are
+        served; a migration is recorded once copied, so a restart after a crash only
+        drops the leftover private collection.
+        """
+        if not SHARED_CHUNK_STORE:
+            return
+        client = cls.get_client(persist_directory)
+        migrations = CollectionMigrations(persist_directory)
+        # Collection objects before chromadb 0.6, names after
+        names = {getattr(collection, "name", collection) for collection in client.list_collections()}
+        for name in sorted(names):
+            if not name.startswith(PERSONAL_COLLECTION_PREFIX):
+                continue
+            try:
+                if not migrations.is_done(name):
+                    instance = ChromaDB(collection_name=name, persist_directory=persist_directory)
+                    with instance._writing():
+                        instance._migrate_private_collection(client.get_collection(name))
+                    instance.versions.bump(name)
+                    migrations.mark_done(name)
+                client.delete_collection(name)
+            except Exception as e:
+                # Left as is and retried on the next start
+                print(f"Error moving {name} to the shared chunk store: {e}")
+
+    def add_documents(
+        self,
+        documents: List[Document],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        chunk_ids_callback: Optional[Callable[[List[str]], None]] = None
+    ) -> List[str]:
+        """
+        Split documents into token-sized chunks along their markdown structure, embed them
+        in concurrent batches and add them to the vector store.
+
+        Args:
+            documents: Documents to add
+            progress_callback: Called as progress_callback(embedded_chunks, total_chunks)
+                after each embedding batch completes
+            chunk_ids_callback: Called with the chunk ids before they are written, so a
+                write interrupted by a crash can be undone
+
+        Returns:
+            The ids of the stored chunks
+        """
         print(f"Adding {len(documents)} documents to the vector store")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=200,
-            separators=[
-                "\n\n",
-                "\n",
-                " ",
-                ".",
-                ",",
-                "\u200b",  # Zero-width space
-                "\uff0c",  # Fullwidth comma
-                "\u3001",  # Ideographic comma
-                "\uff0e",  # Fullwidth full stop
-                "\u3002",  # Ideographic full stop
-                "",
-            ],
+        split_docs = get_chunker().split_documents(documents)
+        if not split_docs:
+            return []
+
+        texts = [doc.page_content for doc in split_docs]
+        embeddings = self._embed_in_batches(texts, progress_callback)
+        ids = [str(uuid.uuid4()) for _ in split_docs]
+        if chunk_ids_callback:
+            chunk_ids_callback(ids)
+        self._write_chunks(ids, embeddings, [doc.metadata for doc in split_docs], texts)
+        return ids
+
+    def _embed_in_batches(
+        self,
+        texts: List[str],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> List[List[float]]:
+        """
+        Embed texts in batches of EMBED_BATCH_SIZE with up to EMBED_CONCURRENCY requests
+        in flight. Only batches that fail are retried, with exponential backoff.
+        """
+        batches = {
+            start: texts[start:start + EMBED_BATCH_SIZE]
+            for start in range(0, len(texts), EMBED_BATCH_SIZE)
+        }
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        done = 0
+        pending = list(batches)
+
+        with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as executor:
+            for attempt in range(EMBED_MAX_RETRIES + 1):
+                if attempt:
+                    time.sleep(2 ** (attempt - 1))
+                    print(f"Retrying {len(pending)} failed embedding batches (attempt {attempt + 1})")
+                futures = {
+                    executor.submit(self.embed_model.embed_documents, batches[start]): start
+                    for start in pending
+                }
+                failed = []
+                errors = []
+                for future in as_completed(futures):
+                    start = futures[future]
+                    try:
+                        vectors = future.result()
+                    except Exception as e:
+                        failed.append(start)
+                        errors.append(e)
+                        continue
+                    embeddings[start:start + len(vectors)] = vectors
+                    done += len(vectors)
+                    if progress_callback:
+                        progress_callback(done, len(texts))
+                print(f"Embedded {done}/{len(texts)} chunks")
+                pending = failed
+                if not pending:
+                    return embeddings
+
+        raise RuntimeError(
+            f"Embedding failed for {len(pending)} batches after {EMBED_MAX_RETRIES} retries: {errors[-1]}"
         )
-        split_docs = text_splitter.split_documents(documents)
-        self.vector_store.add_documents(split_docs)
+
+    def _write_chunks(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+        documents: List[str]
+    ) -> None:
+        """Write precomputed chunks to the collection, respecting Chroma's max batch size."""
+        with self._writing():
+            # Index the chunks already in the collection before adding to the indexes
+            self.ensure_facets()
+            self.ensure_registry()
+            self.ensure_lexical()
+            max_batch = self._max_batch()
+            for start in range(0, len(ids), max_batch):
+                end = start + max_batch
+                self.collection.add(
+                    ids=ids[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end],
+                    documents=documents[start:end]
+                )
+            self.facets.add(self.collection_name, metadatas)
+            self.registry.add(self.collection_name, ids, metadatas, documents)
+            self.lexical.add(self.collection_name, ids, documents)
+            self.versions.bump(self.collection_name)
+
+    def _max_batch(self) -> int:
+        """Chroma's max batch size for one add / delete call."""
+        try:
+            return self.vector_store._client.get_max_batch_size()
+        except AttributeError:
+            return 5000
+
+    def _iter_pages(self, include: List[str], page_size: int = 1000):
+        """Yield pages (Chroma get results) of the whole collection, page_size chunks at a time."""
+        offset = 0
+        while True:
+            page = self.collection.get(
+                include=include, limit=page_size, offset=offset
+            )
+            if not page["ids"]:
+                return
+            yield page
+            offset += len(page["ids"])
+
+    def ensure_facets(self) -> None:
+        """Build the facet index from the existing chunks if it hasn't been built yet."""
+        if not self.facets.is_built(self.collection_name):
+            print(f"Building facet index for {self.collection_name}")
+            self.facets.rebuild(
+                self.collection_name,
+                (page["metadatas"] for page in self._iter_pages(["metadatas"]))
+            )
+
+    def ensure_registry(self) -> None:
+        """Register the documents of the existing chunks if it hasn't been done yet."""
+        if not self.registry.is_built(self.collection_name):
+            print(f"Building document registry for {self.collection_name}")
+            self.registry.rebuild(
+                self.collection_name,
+                (
+                    (page["ids"], page["metadatas"], page["documents"])
+                    for page in self._iter_pages(["metadatas", "documents"])
+                )
+            )
+
+    def ensure_lexical(self) -> None:
+        """Build the BM25 index from the existing chunks if it hasn't been built yet."""
+        if not self.lexical.is_built(self.collection_name):
+            print(f"Building lexical index for {self.collection_name}")
+            self.lexical.rebuild(
+                self.collection_name,
+                ((page["ids"], page["documents"]) for page in self._iter_pages(["documents"]))
+            )
+
+    def _lexical_ready(self) -> bool:
+        """
+        Whether the lexical index can be searched now. If it hasn't been built yet, it is
+        built in a background thread and searches use the vector side only meanwhile.
+        """
+        if self.lexical.is_built(self.collection_name):
+            return True
+        key = (self.persist_directory, self.collection_name)
+        with ChromaDB._lock:
+            if key in ChromaDB._lexical_builds:
+                return False
+            ChromaDB._lexical_builds.add(key)
+
+        def build() -> None:
+            try:
+                # Writes wait, so no chunk is missed or indexed twice
+                with self._writing():
+                    self.ensure_lexical()
+                # Hybrid results cached meanwhile had no BM25 side
+                self.versions.bump(self.collection_name)
+            except Exception as e:
+                print(f"Building lexical index for {self.collection_name} failed: {e}")
+            finally:
+                with ChromaDB._lock:
+                    ChromaDB._lexical_builds.discard(key)
+
+        threading.Thread(target=build, name=f"lexical-{self.collection_name}", daemon=True).start()
+        return False
+
+    def get_facets(self) -> Dict[str, Dict[str, int]]:
+        """Return {field: {value: chunk count}} for course_code, topic and filename."""
+        self.ensure_facets()
+        return self.facets.get(self.collection_name)
+
+    def _delete(self, where: Optional[dict] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """
+        Delete chunks by where clause and/or ids, keeping the facet index, the document
+        registry, the lexical index and the collection version in sync.
+
+        Returns:
+            The ids of the deleted chunks
+        """
+        with self._writing():
+            self.ensure_facets()
+            self.ensure_registry()
+            self.ensure_lexical()
+            affected = self.collection.get(
+                where=where, ids=ids, include=["metadatas", "documents"]
+            )
+            if not affected["ids"]:
+                return []
+            max_batch = self._max_batch()
+            for start in range(0, len(affected["ids"]), max_batch):
+                self.collection.delete(ids=affected["ids"][start:start + max_batch])
+            self.facets.remove(self.collection_name, affected["metadatas"])
+            self.registry.remove(
+                self.collection_name, affected["ids"], affected["metadatas"], affected["documents"]
+            )
+            self.lexical.remove(self.collection_name, affected["ids"])
+            self.versions.bump(self.collection_name)
+            return affected["ids"]
+
+    @staticmethod
+    def build_where(metadata_filters: dict = None) -> Optional[dict]:
+        """
+        Build a Chroma where clause from metadata filters, e.g.,
+            {
+                "course_code": ["CS101", "CS102"],
+                "topic": ["Introduction", "Arrays"],
+                "filename": ["lecture1.pdf"]
+            }
+        Values within a field are OR-ed and the fields are AND-ed.
+        """
+        if not metadata_filters:
+            return None
+
+        conditions = []
+        for field in ("course_code", "topic", "filename"):
+            values = metadata_filters.get(field)
+            if not values:
+                continue
+            if len(values) == 1:
+                conditions.append({field: values[0]})
+            else:
+                conditions.append({
+                    "$or": [{field: value} for value in values]
+                })
+        
+        # Combine all conditions with $and
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
 
     def similarity_search(
         self, 
@@ -74,53 +561,123 @@ class ChromaDB:
                     "filename": ["lecture1.pdf"]
                 }
         """
-        where_clause = {}
-        
-        if metadata_filters:
-            conditions = []
-            
-            # Handle course code filter
-            if "course_code" in metadata_filters and metadata_filters["course_code"]:
-                if len(metadata_filters["course_code"]) == 1:
-                    conditions.append({"course_code": metadata_filters["course_code"][0]})
-                else:
-                    conditions.append({
-                        "$or": [{"course_code": code} for code in metadata_filters["course_code"]]
-                    })
-            
-            # Handle topic filter
-            if "topic" in metadata_filters and metadata_filters["topic"]:
-                if len(metadata_filters["topic"]) == 1:
-                    conditions.append({"topic": metadata_filters["topic"][0]})
-                else:
-                    conditions.append({
-                        "$or": [{"topic": topic} for topic in metadata_filters["topic"]]
-                    })
-            
-            # Handle filename filter
-            if "filename" in metadata_filters and metadata_filters["filename"]:
-                if len(metadata_filters["filename"]) == 1:
-                    conditions.append({"filename": metadata_filters["filename"][0]})
-                else:
-                    conditions.append({
-                        "$or": [{"filename": fname} for fname in metadata_filters["filename"]]
-                    })
-            
-            # Combine all conditions with $and
-            if conditions:
-                if len(conditions) == 1:
-                    where_clause = conditions[0]
-                else:
-                    where_clause = {"$and": conditions}
-        
+        return [
+            doc for doc, _ in self.similarity_search_with_scores(query, k, metadata_filters)
+        ]
+
+    def similarity_search_with_scores(
+        self,
+        query: str,
+        k: int = 4,
+        metadata_filters: dict = None,
+        embed_query: Optional[Callable[[], List[float]]] = None,
+        mode: str = "vector"
+    ) -> List[Tuple[Document, float]]:
+        """
+        Similarity search through the retrieval cache.
+
+        Results are cached by (collection, collection version, query, filters, k, mode); a
+        hit skips both the query embedding and the index search.
+
+        Args:
+            embed_query: Returns the query embedding, for callers that share one embedding
+                across collections; defaults to embedding the query with the collection's
+                embedding backend
+            mode: "vector" for embedding search, "hybrid" to fuse it with BM25 over the
+                lexical index, "mmr" for diverse results without near duplicates
+
+        Returns:
+            List of (document, score) pairs. The score is the distance in vector and mmr
+            mode and 1 - fused score in hybrid mode; lower is closer. Results are closest
+            first, except in mmr mode where they are in selection order.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}. Supported: {', '.join(SEARCH_MODES)}")
+
+        def search(query_embedding: List[float]) -> List[Tuple[Document, float]]:
+            if mode == "hybrid":
+                return self.hybrid_search_by_vector_with_scores(query, query_embedding, k, metadata_filters)
+            if mode == "mmr":
+                return self.mmr_search_by_vector_with_scores(query_embedding, k, metadata_filters)
+            return self.similarity_search_by_vector_with_scores(query_embedding, k, metadata_filters)
+
+        return self._cached_search(query, k, metadata_filters, embed_query, mode, search)
+
+    def search_candidates(
+        self,
+        query: str,
+        k: int = 4,
+        metadata_filters: dict = None,
+        embed_query: Optional[Callable[[], List[float]]] = None,
+        mode: str = "hybrid"
+    ) -> List[tuple]:
+        """
+        The candidates of a hybrid or mmr search before they are ranked, through the
+        retrieval cache, for callers that rank the candidates of several collections
+        together (see RetrievalService). Scores normalized within each collection can't be
+        compared across collections, and MMR has to see every collection's candidates to
+        suppress duplicates between them.
+
+        Args:
+            mode: "hybrid" or "mmr"
+
+        Returns:
+            hybrid: List of (document, distance, BM25 score or None if not a lexical hit)
+            mmr: List of (document, distance, embedding as a float32 array)
+        """
+        if mode == "hybrid":
+            def search(query_embedding: List[float]) -> List[tuple]:
+                return self._hybrid_candidates(query, query_embedding, k, metadata_filters)
+        elif mode == "mmr":
+            def search(query_embedding: List[float]) -> List[tuple]:
+                return self._mmr_candidates(query_embedding, k, metadata_filters)
+        else:
+            raise ValueError(f"Unknown candidate search mode: {mode}")
+        return self._cached_search(query, k, metadata_filters, embed_query, f"{mode}-candidates", search)
+
+    def _cached_search(
+        self,
+        query: str,
+        k: int,
+        metadata_filters: Optional[dict],
+        embed_query: Optional[Callable[[], List[float]]],
+        cache_mode: str,
+        search: Callable[[List[float]], List[tuple]]
+    ) -> List[tuple]:
+        """Run search(query embedding) unless the filters match nothing or the result is cached."""
+        # A filter value that no chunk has means no result, skip the search entirely
+        if self.facets.is_built(self.collection_name) and not self.facets.may_match(
+            self.collection_name, metadata_filters
+        ):
+            return []
+
+        version = self.versions.get(self.collection_name)
+        key = retrieval_cache.make_key(self.collection_name, version, query, metadata_filters, k, cache_mode)
+        cached = retrieval_cache.get(key)
+        if cached is not None:
+            return cached
+
         # Get embeddings for the query
-        query_embedding = embed_model.embed_query(query)
-        
-        # Perform the search with filters
-        results = self.vector_store._collection.query(
+        query_embedding = embed_query() if embed_query else self.embed_model.embed_query(query)
+        results = search(query_embedding)
+        # A write during the search may or may not be in the results: don't cache them
+        # under the version from before it
+        if self.versions.get(self.collection_name) == version:
+            retrieval_cache.put(key, results)
+        return results
+
+    def _query_by_vector(
+        self,
+        query_embedding: List[float],
+        k: int,
+        metadata_filters: dict = None
+    ) -> List[Tuple[str, Document, float]]:
+        """Nearest chunks to an embedding as (id, document, distance), closest first."""
+        results = self.collection.query(
             query_embeddings=[query_embedding],
             n_results=k,
-            where=where_clause if where_clause else None
+            where=self.build_where(metadata_filters),
+            include=["documents", "metadatas", "distances"]
         )
         
         # Convert results to Documents
@@ -131,63 +688,486 @@ class ChromaDB:
                     page_content=results['documents'][0][i],
                     metadata=results['metadatas'][0][i]
                 )
-                documents.append(doc)
+                documents.append((results['ids'][0][i], doc, results['distances'][0][i]))
         
         return documents
 
+    def similarity_search_by_vector_with_scores(
+        self,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filters: dict = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Search with an already computed query embedding.
+
+        Returns:
+            List of (document, distance) pairs, closest first
+        """
+        return [
+            (doc, distance)
+            for _, doc, distance in self._query_by_vector(query_embedding, k, metadata_filters)
+        ]
+
+    def _distances(self, query_embedding: List[float], embeddings: List[List[float]]) -> List[float]:
+        """Distances from the query in the collection's own metric, as Chroma reports them."""
+        space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        return distances(query_embedding, embeddings, space).tolist()
+
+    @staticmethod
+    def _mmr_select(
+        query_embedding: List[float],
+        embeddings: Any,
+        k: int,
+        lambda_mult: float = MMR_LAMBDA,
+        duplicate_threshold: float = MMR_DUPLICATE_THRESHOLD
+    ) -> List[int]:
+        """
+        Greedy max marginal relevance over cosine similarities, vectorized: each step
+        scores every remaining candidate at once as
+        lambda * sim(query) - (1 - lambda) * max sim(selected).
+        Candidates at or above duplicate_threshold to a selected one are never picked.
+
+        Returns:
+            Indexes of the selected embeddings, in selection order
+        """
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+
+        relevance = vectors @ query_vector
+        redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+        available = np.ones(len(vectors), dtype=bool)
+        selected: List[int] = []
+        while len(selected) < k and available.any():
+            scores = lambda_mult * relevance - (1 - lambda_mult) * np.maximum(redundancy, 0)
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            similarity = vectors @ vectors[best]
+            redundancy = np.maximum(redundancy, similarity)
+            available &= similarity < duplicate_threshold
+            available[best] = False
+        return selected
+
+    def mmr_search_by_vector_with_scores(
+        self,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filters: dict = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Take k * MMR_CANDIDATES nearest chunks and select k of them by max marginal
+        relevance, skipping near duplicates (slides repeated across pages).
+
+        Returns:
+            List of (document, distance) pairs, in selection order
+        """
+        candidates = self._mmr_candidates(query_embedding, k, metadata_filters)
+        if not candidates:
+            return []
+        selected = self._mmr_select(query_embedding, [embedding for _, _, embedding in candidates], k)
+        return [(candidates[i][0], candidates[i][1]) for i in selected]
+
+    def _mmr_candidates(
+        self,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filters: dict = None
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        """
+        The k * MMR_CANDIDATES nearest chunks with their stored embeddings.
+
+        Returns:
+            List of (document, distance, embedding as a float32 array), closest first
+        """
+        candidates = self._query_by_vector(query_embedding, k * max(1, MMR_CANDIDATES), metadata_filters)
+        if not candidates:
+            return []
+        fetched = self.collection.get(ids=[chunk_id for chunk_id, _, _ in candidates], include=["embeddings"])
+        vectors = {
+            chunk_id: np.asarray(vector, dtype=np.float32)
+            for chunk_id, vector in zip(fetched["ids"], fetched["embeddings"])
+            if vector is not None
+        }
+        return [
+            (doc, distance, vectors[chunk_id])
+            for chunk_id, doc, distance in candidates if chunk_id in vectors
+        ]
+
+    @staticmethod
+    def _min_max(scores: Dict[str, float]) -> Dict[str, float]:
+        if not scores:
+            return {}
+        low, high = min(scores.values()), max(scores.values())
+        if high == low:
+            return {key: 1.0 for key in scores}
+        return {key: (value - low) / (high - low) for key, value in scores.items()}
+
+    def hybrid_search_by_vector_with_scores(
+        self,
+        query: str,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filters: dict = None
+    ) -> List[Tuple[Document, float]]:
+        """
+        Fuse embedding search with BM25 over the lexical index, see _hybrid_candidates()
+        and fuse_hybrid().
+
+        Returns:
+            List of (document, 1 - fused score) pairs, closest first
+        """
+        candidates = self._hybrid_candidates(query, query_embedding, k, metadata_filters)
+        return [(candidates[i][0], score) for i, score in self.fuse_hybrid(candidates, k)]
+
+    def _hybrid_candidates(
+        self,
+        query: str,
+        query_embedding: List[float],
+        k: int = 4,
+        metadata_filters: dict = None
+    ) -> List[Tuple[Document, float, Optional[float]]]:
+        """
+        k * HYBRID_CANDIDATES candidates from each of the embedding search and BM25 over the
+        lexical index (none while the index is still being built, see _lexical_ready).
+        Lexical candidates missing from the vector results get their true distance from
+        their stored embeddings.
+
+        Returns:
+            List of (document, distance, BM25 score or None if not a lexical hit)
+        """
+        candidates = k * max(1, HYBRID_CANDIDATES)
+        vector_hits = self._query_by_vector(query_embedding, candidates, metadata_filters)
+        documents = {chunk_id: doc for chunk_id, doc, _ in vector_hits}
+        distances = {chunk_id: distance for chunk_id, _, distance in vector_hits}
+
+        lexical_hits = {}
+        if self._lexical_ready():
+            # Oversample when filtering, the lexical index doesn't know the metadata
+            lexical_hits = dict(self.lexical.search(
+                self.collection_name, query, candidates * (4 if metadata_filters else 1)
+            ))
+        missing = [chunk_id for chunk_id in lexical_hits if chunk_id not in documents]
+        if missing:
+            fetched = self.collection.get(
+                ids=missing,
+                where=self.build_where(metadata_filters),
+                include=["documents", "metadatas", "embeddings"]
+            )
+            if fetched["ids"]:
+                for chunk_id, distance, text, metadata in zip(
+                    fetched["ids"],
+                    self._distances(query_embedding, fetched["embeddings"]),
+                    fetched["documents"],
+                    fetched["metadatas"]
+                ):
+                    documents[chunk_id] = Document(page_content=text, metadata=metadata)
+                    distances[chunk_id] = distance
+        return [
+            (documents[chunk_id], distances[chunk_id], lexical_hits.get(chunk_id))
+            for chunk_id in documents
+        ]
+
+    @staticmethod
+    def fuse_hybrid(candidates: List[Tuple[Document, float, Optional[float]]], k: int) -> List[Tuple[int, float]]:
+        """
+        Rank hybrid candidates: negated distances and BM25 scores are min-max normalized
+        over all the candidates and combined as HYBRID_ALPHA * vector + (1 - HYBRID_ALPHA) * BM25,
+        candidates without a BM25 score counting 0 on that side.
+
+        Returns:
+            Up to k (candidate index, 1 - fused score) pairs, best first
+        """
+        vector_scores = ChromaDB._min_max({i: -distance for i, (_, distance, _) in enumerate(candidates)})
+        bm25_scores = ChromaDB._min_max({
+            i: bm25 for i, (_, _, bm25) in enumerate(candidates) if bm25 is not None
+        })
+        fused = {
+            i: HYBRID_ALPHA * vector_scores[i] + (1 - HYBRID_ALPHA) * bm25_scores.get(i, 0.0)
+            for i in range(len(candidates))
+        }
+        ranked = sorted(fused, key=fused.get, reverse=True)[:k]
+        return [(i, 1 - fused[i]) for i in ranked]
+
     def as_retriever(self):
         """Get the vector store as a retriever."""
         return self.vector_store.as_retriever()
     
-    def get_collection_info(self) -> Dict[str, Any]:
-        """Get information about all documents in the collection."""
+    def get_collection_info(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        sort: str = "date_added",
+        order: str = "desc"
+    ) -> Dict[str, Any]:
+        """
+        Get one page of the documents in the collection from the document registry.
+
+        Args:
+            limit: Documents per page
+            cursor: next_cursor returned with the previous page
+            sort: date_added, filename, type, chunk_count or byte_size
+            order: "asc" or "desc"
+
+        Returns:
+            Chunk count, document count, the page of documents and the next page cursor
+            (None on the last page)
+        """
+        self.ensure_registry()
+        documents, next_cursor = self.registry.page(self.collection_name, limit, cursor, sort, order)
         return {
-            "count": self.vector_store._collection.count(),
-            "documents": [
-                {
-                    "id": metadata.get("filename", "Unknown"),
-                    "type": metadata.get("type", "Unknown"),
-                    "date_added": metadata.get("date_added", "Unknown")
-                }
-                for metadata in self.vector_store._collection.get()["metadatas"]
-            ]
+            "count": self.collection.count(),
+            "total_documents": self.registry.count(self.collection_name),
+            "documents": documents,
+            "next_cursor": next_cursor
         }
     
-    def delete_document(self, document_id: str) -> bool:
-        """Delete a document from the vector store by its ID."""
+    def delete_document(self, document_id: str) -> List[str]:
+        """
+        Delete a document from the vector store by its ID.
+
+        Returns:
+            The ids of the deleted chunks, empty when the collection has no chunk of that
+            document
+        """
         try:
-            self.vector_store._collection.delete(
-                where={"filename": document_id}
-            )
-            self.vector_store.persist()
-            return True
+            # Chroma persists every write, there is nothing to flush afterwards
+            return self._delete(where={"filename": document_id})
         except Exception as e:
             print(f"Error deleting document: {e}")
-            return False
+            return []
+
+    def delete_ids(self, ids: List[str]) -> None:
+        """Delete chunks by id."""
+        if ids:
+            self._delete(ids=ids)
+
+    def bulk_delete(
+        self,
+        metadata_filters: Optional[dict] = None,
+        ids: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Delete every chunk matching the metadata filters and/or the ids in one operation.
+
+        Args:
+            metadata_filters: Dict of metadata filters, see similarity_search, e.g.
+                {"course_code": ["COMP1021"]} or {"filename": ["a.pdf", "b.pdf"]}
+            ids: Chunk ids; combined with the filters, only chunks matching both go
+
+        Returns:
+            The ids of the deleted chunks
+        """
+        where = self.build_where(metadata_filters)
+        if where is None and not ids:
+            raise ValueError("Give metadata filters or ids to delete, use drop_collection to delete everything")
+        return self._delete(where=where, ids=ids or None)
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Rebuild the Chroma collection from its live chunks, so the HNSW index holds no
+        deleted entries, then VACUUM the SQLite files. Personal collections live in the
+        shared chunk store, which only compact_shared_stores rebuilds.
+
+        Returns:
+            Chunks copied, directory size before / after and the reclaimed bytes
+        """
+        if self.is_personal:
+            raise ValueError(
+                f"{self.collection_name} is stored in the shared chunk store, which is compacted as a whole"
+            )
+        return self._compact_store(self.persist_directory, self.collection_name)
+
+    @classmethod
+    def compact_shared_stores(cls, persist_directory: str = "./chroma_db") -> List[Dict[str, Any]]:
+        """Compact the shared chunk store of every embedding backend, see compact."""
+        client = cls.get_client(persist_directory)
+        names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+        return [
+            cls._compact_store(persist_directory, name)
+            for name in sorted(names)
+            if (name == SHARED_CHUNK_COLLECTION or name.startswith(f"{SHARED_CHUNK_COLLECTION}_"))
+            and not name.endswith((COMPACTING_SUFFIX, SUPERSEDED_SUFFIX))
+        ]
+
+    @classmethod
+    def _compact_store(cls, persist_directory: str, name: str) -> Dict[str, Any]:
+        """
+        Copy a Chroma collection into a new one and swap it in. Writes to the collection
+        wait on its write lock meanwhile; the original is only dropped once the copy has
+        its name, so a crash at any point leaves one complete collection for
+        _recover_compactions to restore.
+        """
+        client = cls.get_client(persist_directory)
+        with cls._write_lock(persist_directory, name):
+            cls._recover_compactions(client)
+            size_before = _directory_size(persist_directory)
+            old = client.get_collection(name)
+            temporary = client.create_collection(name + COMPACTING_SUFFIX, metadata=old.metadata)
+
+            copied = 0
+            offset = 0
+            while True:
+                page = old.get(include=["embeddings", "metadatas", "documents"], limit=1000, offset=offset)
+                if not len(page["ids"]):
+                    break
+                temporary.add(
+                    ids=page["ids"],
+                    embeddings=page["embeddings"],
+                    metadatas=page["metadatas"],
+                    documents=page["documents"]
+                )
+                copied += len(page["ids"])
+                offset += len(page["ids"])
+
+            old.modify(name=name + SUPERSEDED_SUFFIX)
+            temporary.modify(name=name)
+            client.delete_collection(name + SUPERSEDED_SUFFIX)
+            # Open handles still point to the old collection: writers reopen it under the
+            # lock, everything else on the next get_collection
+            key = (persist_directory, name)
+            cls._store_generations[key] = cls._store_generations.get(key, 0) + 1
+            cls.evict_all_handles()
+
+        for path in (
+            os.path.join(persist_directory, "chroma.sqlite3"),
+            os.path.join(persist_directory, INDEX_FILENAME)
+        ):
+            try:
+                conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+                conn.execute("VACUUM")
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Could not vacuum {path}: {e}")
+
+        size_after = _directory_size(persist_directory)
+        print(f"Compacted {name}: {copied} chunks, {size_before - size_after} bytes reclaimed")
+        return {
+            "collection": name,
+            "chunks": copied,
+            "size_before": size_before,
+            "size_after": size_after,
+            "reclaimed_bytes": size_before - size_after
+        }
+
+    @classmethod
+    def collection_exists(cls, collection_name: str, persist_directory: str = "./chroma_db") -> bool:
+        """
+        Whether a collection exists, without creating it: a Chroma collection, or for
+        personal collections references or an embedding backend bound on first open.
+        """
+        if SHARED_CHUNK_STORE and collection_name.startswith(PERSONAL_COLLECTION_PREFIX):
+            return (
+                reference_count(collection_name, persist_directory) > 0
+                or CollectionBackends(persist_directory).get(collection_name) is not None
+            )
+        client = cls.get_client(persist_directory)
+        # Collection objects before chromadb 0.6, names after
+        return collection_name in {
+            getattr(collection, "name", collection) for collection in client.list_collections()
+        }
+
+    @classmethod
+    def drop_collection(cls, collection_name: str) -> int:
+        """
+        Delete a whole collection with its facet index, document registry and lexical
+        index. Personal collections drop their references (and shared chunks nobody else
+        references).
+
+        Returns:
+            Number of chunks deleted
+
+        Raises:
+            KeyError: If the collection doesn't exist
+        """
+        if not cls.collection_exists(collection_name):
+            raise KeyError(f"Collection {collection_name} not found")
+        instance = cls.get_collection(collection_name)
+        with instance._writing():
+            count = instance.collection.count()
+            if instance.is_personal:
+                instance.collection.delete()
+            else:
+                instance.get_client(instance.persist_directory).delete_collection(collection_name)
+                QuantizedVectors(instance.persist_directory).drop(collection_name)
+        instance.facets.drop(collection_name)
+        instance.registry.drop(collection_name)
+        instance.lexical.drop(collection_name)
+        instance.versions.bump(collection_name)
+        instance.backends.drop(collection_name)
+        cls.evict_collection(collection_name)
+        return count
 
     @classmethod
     def get_collection(cls, collection_name: str) -> 'ChromaDB':
-        """Get or create a collection instance."""
-        if collection_name not in cls._instances:
-            cls._instances[collection_name] = ChromaDB(collection_name=collection_name)
-        return cls._instances[collection_name]
+        """
+        Get or create a collection instance from the pool of open collections.
+        The least recently used handles are dropped beyond CHROMA_MAX_OPEN_COLLECTIONS.
+        """
+        with cls._lock:
+            if collection_name in cls._instances:
+                cls._instances.move_to_end(collection_name)
+                return cls._instances[collection_name]
+
+            instance = ChromaDB(collection_name=collection_name)
+            cls._instances[collection_name] = instance
+            while len(cls._instances) > MAX_OPEN_COLLECTIONS:
+                cls._instances.popitem(last=False)
+            return instance
     
     @classmethod
     def close_collection(cls, collection_name: str) -> None:
-        """Close and cleanup a specific collection."""
-        if collection_name in cls._instances:
-            instance = cls._instances[collection_name]
-            del cls._instances[collection_name]
+        """
+        Release a collection after a request. The handle stays in the pool for the next
+        request; use evict_collection to actually drop it.
+        """
+
+    @classmethod
+    def evict_collection(cls, collection_name: str) -> None:
+        """Drop a collection handle from the pool (e.g. after the collection was deleted)."""
+        with cls._lock:
+            cls._instances.pop(collection_name, None)
     
+    @classmethod
+    def evict_all_handles(cls) -> None:
+        """Drop every pooled collection handle, they are reopened on next use."""
+        with cls._lock:
+            cls._instances.clear()
+
     @classmethod
     def close_all_collections(cls) -> None:
-        """Close all open collections."""
-        for collection_name in list(cls._instances.keys()):
-            cls.close_collection(collection_name)
+        """Close all open collections and the clients."""
+        with cls._lock:
+            cls._instances.clear()
+            for client in cls._clients.values():
+                # release loaded segments; not every chromadb version exposes this
+                try:
+                    client.clear_system_cache()
+                except AttributeError:
+                    pass
+            cls._clients.clear()
+
+    @classmethod
+    def pool_stats(cls) -> Dict[str, Any]:
+        return {
+            "open_collections": len(cls._instances),
+            "max_open_collections": MAX_OPEN_COLLECTIONS,
+            "memory_limit_bytes": CHROMA_MEMORY_LIMIT_BYTES
+        }
 
 # Instantiate the database
 # db = ChromaDB()  # Remove global instance to prevent memory leaks
 
+def startup():
+    """
+    Call this when starting the application to open the shared Chroma client and move
+    the personal collections created before the shared chunk store into it.
+    """
+    ChromaDB.get_client()
+    ChromaDB.migrate_private_collections()
+
 def cleanup():
     """Call this when shutting down the application to clean up resources"""
     ChromaDB.close_all_collections()
@@ -1,17 +1,29 @@
 import os
-import tempfile
+import math
+import asyncio
 from datetime import datetime
-from typing import Dict, Any, List, Tuple
+from typing import Callable, Dict, Any, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 from fastapi import HTTPException, UploadFile
 from fastapi.responses import JSONResponse
 from database import ChromaDB
+from collection_index import IngestionManifest
+from conversion_cache import conversion_cache, converter_version, file_sha256
+from upload_spool import SpooledUpload, spool_upload
+from conversion_pool import conversion_pool, convert_in_worker, convert_pdf_range_in_worker, ocr_batch_in_worker
 from markitdown import MarkItDown
 from openai import AzureOpenAI, OpenAI
 from langchain.schema import Document
-from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
-from marker.output import text_from_rendered
+import fitz
+import marker_models
+from pdf_pipeline import convert_pdf_hybrid
+from ocr_pipeline import (
+    IMAGE_EXTENSIONS, OCR_MIN_CONFIDENCE, OCR_REMOTE_ESCALATION, ocr_available, ocr_images, ocr_languages
+)
+from audio_pipeline import (
+    AUDIO_EXTENSIONS, TRANSCRIPTION_BACKEND,
+    transcribe_audio, format_transcript, parse_transcript, group_segments
+)
 from langchain.prompts import PromptTemplate
 
 SUPPORTED_FILE_TYPES = {
@@ -29,11 +41,15 @@ SUPPORTED_FILE_TYPES = {
     'md': '.md'
 }
 
+# PDFs longer than this are converted in page ranges of (at least) this size in parallel
+PDF_CHUNK_PAGES = int(os.getenv("PDF_CHUNK_PAGES", "20"))
+ingestion_manifest = IngestionManifest()
+
+# Number of files of one batch upload processed at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
 class DocumentManager:
     _md = None
-    _pdf_converter = PdfConverter(
-        artifact_dict=create_model_dict(),
-    )
 
     @classmethod
     def get_markitdown(cls):
@@ -54,7 +70,14 @@ class DocumentManager:
         return cls._md
 
     @staticmethod
-    def pdf_to_markdown_precise(file_path: str) -> Tuple[str, List]:
+    def warmup(load_marker: bool = True) -> None:
+        """Load the converters ahead of the first request instead of on demand."""
+        DocumentManager.get_markitdown()
+        if load_marker and not os.getenv("MARKER_SERVER_ADDRESS"):
+            marker_models.get_pdf_converter()
+
+    @staticmethod
+    def pdf_to_markdown_precise(file_path: str) -> Tuple[str, Dict]:
         """
         Convert PDF to markdown and extract images.
         
@@ -64,43 +87,199 @@ class DocumentManager:
         Returns:
             Tuple containing:
                 - markdown text
-                - list of extracted images
+                - dict of extracted images
         """
         try:
-            rendered = DocumentManager._pdf_converter(file_path)
-            text, _, images = text_from_rendered(rendered)
-            return text, images
+            # marker models are loaded on first use (or served by the shared model server)
+            return marker_models.convert_pdf(file_path)
         except Exception as e:
             print(f"Error converting PDF to markdown: {str(e)}")
             raise
 
     @staticmethod
-    async def process_content(file_path: str, file_extension: str, use_precise_pdf: bool = False) -> str:
+    def split_page_ranges(page_count: int, chunk_pages: int = PDF_CHUNK_PAGES) -> List[List[int]]:
+        """
+        Split a document into contiguous page ranges for parallel conversion.
+        At most two ranges per conversion worker are created so a huge PDF doesn't
+        fill the conversion queue on its own.
+        """
+        max_ranges = max(1, conversion_pool.max_workers * 2)
+        chunk_pages = max(chunk_pages, math.ceil(page_count / max_ranges), 1)
+        return [
+            list(range(start, min(start + chunk_pages, page_count)))
+            for start in range(0, page_count, chunk_pages)
+        ]
+
+    @staticmethod
+    async def pdf_to_markdown_precise_parallel(file_path: str) -> Tuple[str, Dict]:
+        """
+        Convert a PDF with marker, splitting large documents into page ranges that are
+        converted concurrently across the conversion workers and stitched back together.
+
+        Returns:
+            Tuple containing:
+                - markdown text in page order
+                - dict of extracted images, with names made unique across ranges
+        """
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+
+        if page_count <= PDF_CHUNK_PAGES:
+            text = await conversion_pool.run(convert_in_worker, file_path, "marker")
+            return text, {}
+
+        page_ranges = DocumentManager.split_page_ranges(page_count)
+        print(f"Converting {page_count} pages in {len(page_ranges)} parallel ranges")
+        results = await asyncio.gather(*(
+            conversion_pool.run(convert_pdf_range_in_worker, file_path, page_range)
+            for page_range in page_ranges
+        ))
+
+        pages: Dict[int, str] = {}
+        all_images: Dict[str, Any] = {}
+        for range_index, (range_pages, images) in enumerate(results):
+            for name, image in images.items():
+                unique_name = name
+                if unique_name in all_images:
+                    # Rename clashing images and point this range's references at the new name
+                    unique_name = f"range{range_index}_{name}"
+                    range_pages = {
+                        index: text.replace(f"]({name})", f"]({unique_name})")
+                        for index, text in range_pages.items()
+                    }
+                all_images[unique_name] = image
+            pages.update(range_pages)
+
+        return "\n\n".join(pages[index] for index in sorted(pages) if pages[index]), all_images
+
+    @staticmethod
+    def parse_pdf_mode(precise_pdf: str) -> Union[bool, str]:
+        """
+        Parse the precise_pdf form field: "true" for marker, "auto" for the hybrid
+        PyMuPDF + marker pipeline, anything else for markitdown.
+        """
+        value = precise_pdf.lower()
+        if value == "auto":
+            return "auto"
+        return value == "true"
+
+    @staticmethod
+    def conversion_mode(file_extension: str, use_precise_pdf: Union[bool, str] = False) -> str:
+        """Name of the converter used for a file, which is also part of its cache key."""
+        if file_extension in AUDIO_EXTENSIONS:
+            return "audio"
+        if file_extension in IMAGE_EXTENSIONS and ocr_available():
+            return "ocr"
+        if file_extension == '.pdf' and use_precise_pdf == "auto":
+            return "hybrid"
+        if file_extension == '.pdf' and use_precise_pdf:
+            return "marker"
+        return "markitdown"
+
+    @staticmethod
+    def converter_version(mode: str) -> str:
+        """Version string of the packages behind a conversion mode."""
+        if mode == "hybrid":
+            return f"pymupdf-{converter_version('PyMuPDF')}+marker-{converter_version('marker-pdf')}"
+        if mode == "marker":
+            return converter_version("marker-pdf")
+        if mode == "ocr":
+            escalation = f"escalate{OCR_MIN_CONFIDENCE:g}" if OCR_REMOTE_ESCALATION else "local"
+            return f"pytesseract-{converter_version('pytesseract')}-{ocr_languages()}-{escalation}"
+        if mode == "audio":
+            return (
+                f"{TRANSCRIPTION_BACKEND}-speechrecognition-{converter_version('SpeechRecognition')}"
+                f"+pydub-{converter_version('pydub')}"
+            )
+        return converter_version("markitdown")
+
+    @staticmethod
+    def ocr_images(file_paths: List[str]) -> List[str]:
+        """OCR images locally, escalating low-confidence ones to the markitdown vision model if enabled."""
+        return ocr_images(
+            file_paths,
+            escalate=lambda path: DocumentManager.get_markitdown().convert(path).text_content
+        )
+
+    @staticmethod
+    def convert_file(file_path: str, mode: str) -> str:
+        """
+        Convert a file to markdown synchronously with the given converter.
+        Runs inside a conversion worker process, see conversion_pool.py.
+        """
+        if mode == "hybrid":
+            return convert_pdf_hybrid(file_path)
+        if mode == "audio":
+            return format_transcript(transcribe_audio(file_path))
+        if mode == "ocr":
+            return DocumentManager.ocr_images([file_path])[0]
+        if mode == "marker":
+            text, _ = DocumentManager.pdf_to_markdown_precise(file_path)
+            return text
+        return DocumentManager.get_markitdown().convert(file_path).text_content
+
+    @staticmethod
+    async def process_content(
+        file_path: str,
+        file_extension: str,
+        use_precise_pdf: Union[bool, str] = False,
+        content_hash: Optional[str] = None
+    ) -> str:
         """
         Extract content from file based on type
         
+        Converted markdown is cached on disk by file content hash, conversion mode and
+        converter version, so repeat uploads of the same file skip the conversion.
+        Cache misses are converted in the conversion worker pool so the event loop
+        stays free for other requests.
+
         Args:
             file_path: Path to the file
             file_extension: File extension
-            use_precise_pdf: Whether to use precise mode for PDFs
+            use_precise_pdf: Whether to use precise mode for PDFs, or "auto" to
+                escalate only pages with equations, tables or images to precise mode
+            content_hash: SHA-256 of the file if already known (e.g. computed while spooling)
         """
-        md = DocumentManager.get_markitdown()
-        
-        if file_extension == '.pdf' and use_precise_pdf:
-            text, _ = DocumentManager.pdf_to_markdown_precise(file_path)
-            return text
-        elif file_extension == '.md':
+        if file_extension == '.md':
             with open(file_path, 'r') as f:
                 return f.read()
-            
+
+        mode = DocumentManager.conversion_mode(file_extension, use_precise_pdf)
+        content_hash = content_hash or file_sha256(file_path)
+        cache_key = conversion_cache.make_key(content_hash, mode, DocumentManager.converter_version(mode))
+        cached = conversion_cache.get(cache_key)
+        if cached is not None:
+            print(f"Conversion cache hit for {file_path}")
+            return cached
+
         try:
-            result = md.convert(file_path)
-            return result.text_content
+            if mode == "marker":
+                text, _ = await DocumentManager.pdf_to_markdown_precise_parallel(file_path)
+            else:
+                text = await conversion_pool.run(convert_in_worker, file_path, mode)
+        except HTTPException:
+            raise
         except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error processing file: {str(e)}"
-            )
+            if mode != "ocr":
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error processing file: {str(e)}"
+                )
+            # Read the image with markitdown as before local OCR rather than dropping it
+            print(f"OCR failed for {file_path} ({str(e)}), converting with markitdown")
+            mode = "markitdown"
+            cache_key = conversion_cache.make_key(content_hash, mode, DocumentManager.converter_version(mode))
+            try:
+                text = await conversion_pool.run(convert_in_worker, file_path, mode)
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error processing file: {str(e)}"
+                )
+        conversion_cache.put(cache_key, text)
+        return text
 
     @staticmethod
     def get_collection_name(user_email: str) -> str:
@@ -108,6 +287,85 @@ class DocumentManager:
         # Create a valid collection name from email
         return f"user_{user_email.replace('@', '_').replace('.', '_')}"
 
+    @staticmethod
+    async def ingest_file(
+        file_path: str,
+        filename: str,
+        course_code: str,
+        topic: str,
+        user_email: Optional[str],
+        db_instance: ChromaDB,
+        use_precise_pdf: Union[bool, str] = False,
+        content_hash: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        chunk_ids_callback: Optional[Callable[[List[str]], None]] = None
+    ) -> Tuple[dict, List[str]]:
+        """
+        Convert a local file to markdown and add it to a collection.
+
+        Args:
+            file_path: Path of the (spooled) file on disk
+            filename: Original filename stored in the metadata
+            progress_callback: Called as progress_callback(embedded_chunks, total_chunks)
+                from the embedding thread, see ChromaDB.add_documents
+            chunk_ids_callback: Called with the chunk ids before they are written, see
+                ChromaDB.add_documents
+
+        Returns:
+            Tuple containing:
+                - the metadata stored with the document
+                - the ids of the chunks added to the collection
+        """
+        file_extension = os.path.splitext(filename.lower())[1]
+        metadata = {
+            "filename": filename,
+            "course_code": course_code,
+            "type": file_extension, 
+            "topic": topic,
+            "user_email": user_email,
+            "date_added": datetime.now().isoformat()
+        }
+        if user_email is None:
+            del metadata["user_email"]
+        
+        # debug file type
+        print(f"File type: {file_extension}")
+
+        markdown_content = await DocumentManager.process_content(
+            file_path,
+            file_extension,
+            use_precise_pdf,
+            content_hash=content_hash
+        )
+        
+        print("sussessfully converted to markdown")
+        documents = [
+            Document(
+                page_content=markdown_content,
+                metadata=metadata
+            )
+        ]
+        if file_extension in AUDIO_EXTENSIONS:
+            # One document per group of transcript segments, keeping their time span
+            groups = group_segments(parse_transcript(markdown_content))
+            if groups:
+                documents = [
+                    Document(
+                        page_content=group.text,
+                        metadata={**metadata, "start_time": group.start, "end_time": group.end}
+                    )
+                    for group in groups
+                ]
+
+        # Add to vector store; embedding runs in a thread so other
+        # uploads in the batch keep converting meanwhile
+        chunk_ids = await asyncio.to_thread(
+            db_instance.add_documents, documents, progress_callback, chunk_ids_callback
+        )
+
+        print("sussessfully added to db")
+        return metadata, chunk_ids
+
     @staticmethod
     async def upload_document(
         file: UploadFile,
@@ -116,13 +374,18 @@ class DocumentManager:
         topic: str,
         user_email: str,
         collection_name: str = "default",
-        use_precise_pdf: bool = False
+        use_precise_pdf: Union[bool, str] = False,
+        db_instance: Optional[ChromaDB] = None
     ) -> dict:
-        """Process one file upload and return a dictionary with the result."""
-        db_instance = None
+        """
+        Process one file upload and return a dictionary with the result.
+        Pass db_instance to reuse an already opened collection (e.g. for a batch upload).
+        """
+        owns_instance = db_instance is None
         try:
             # Get the specified collection
-            db_instance = ChromaDB.get_collection(collection_name)
+            if owns_instance:
+                db_instance = ChromaDB.get_collection(collection_name)
             
             file_extension = os.path.splitext(file.filename.lower())[1]
             
@@ -132,46 +395,22 @@ class DocumentManager:
                     detail=f"Unsupported format. Supported: {', '.join(SUPPORTED_FILE_TYPES.values())}"
                 )
 
-            content = await file.read()
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-                # Write content to temp file
-                temp_file.write(content)
-                temp_file.flush()
-                
-                try:
-                    metadata = {
-                        "filename": file.filename,
-                        "course_code": course_code,
-                        "type": file_extension, 
-                        "topic": topic,
-                        "user_email": user_email,
-                        "date_added": datetime.now().isoformat()
-                    }
-                    
-                    # debug file type
-                    print(f"File type: {file_extension}")
-
-                    markdown_content = await DocumentManager.process_content(
-                        temp_file.name,
-                        file_extension,
-                        use_precise_pdf
-                    )
-                    
-                    print("sussessfully converted to markdown")
-                    # Add to vector store as Document
-                    db_instance.add_documents([
-                        Document(
-                            page_content=markdown_content,
-                            metadata=metadata
-                        )
-                    ])
-
-                    print("sussessfully added to db")
-                finally:
-                    # Clean up: remove temp file
-                    os.unlink(temp_file.name)
+            # Stream the upload to disk, hashing it on the way
+            spooled = await spool_upload(file, suffix=file_extension)
+            try:
+                metadata, _ = await DocumentManager.ingest_file(
+                    file_path=spooled.path,
+                    filename=file.filename,
+                    course_code=course_code,
+                    topic=topic,
+                    user_email=user_email,
+                    db_instance=db_instance,
+                    use_precise_pdf=use_precise_pdf,
+                    content_hash=spooled.sha256
+                )
+            finally:
+                # Clean up: remove spooled file
+                spooled.cleanup()
 
             return {
                 "message": "Document uploaded successfully",
@@ -181,22 +420,82 @@ class DocumentManager:
             }
 
         except Exception as e:
+            # Oversized uploads keep their 413 so the client can tell them apart
+            if isinstance(e, HTTPException) and e.status_code == 413:
+                raise
             raise HTTPException(
                 status_code=500,
                 detail=f"Error uploading document: {str(e)}"
             )
         finally:
-            if db_instance:
+            if owns_instance and db_instance:
                 ChromaDB.close_collection(collection_name)
 
     @staticmethod
-    async def list_documents(collection_name: str = "default") -> JSONResponse:
-        """List all documents in the specified collection."""
+    async def upload_documents(
+        files: List[UploadFile],
+        document_type: str,
+        course_code: str,
+        topic: str,
+        user_email: str,
+        collection_name: str = "default",
+        use_precise_pdf: Union[bool, str] = False,
+        max_concurrency: int = UPLOAD_CONCURRENCY
+    ) -> List[dict]:
+        """
+        Upload a batch of files concurrently into one collection.
+
+        Up to max_concurrency files are converted, chunked and embedded at the same time,
+        all sharing one collection handle. Returns one result per file in input order;
+        a failed file yields an entry with an "error" instead of failing the whole batch.
+        """
+        db_instance = ChromaDB.get_collection(collection_name)
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def upload_one(file: UploadFile) -> dict:
+            async with semaphore:
+                try:
+                    return await DocumentManager.upload_document(
+                        file=file,
+                        document_type=document_type,
+                        course_code=course_code,
+                        topic=topic,
+                        user_email=user_email,
+                        collection_name=collection_name,
+                        use_precise_pdf=use_precise_pdf,
+                        db_instance=db_instance
+                    )
+                except HTTPException as e:
+                    return {
+                        "message": "Document upload failed",
+                        "filename": file.filename,
+                        "error": e.detail,
+                        "collection": collection_name
+                    }
+
+        try:
+            return await asyncio.gather(*(upload_one(file) for file in files))
+        finally:
+            ChromaDB.close_collection(collection_name)
+
+    @staticmethod
+    async def list_documents(
+        collection_name: str = "default",
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        sort: str = "date_added",
+        order: str = "desc"
+    ) -> JSONResponse:
+        """List one page of the documents in the specified collection."""
         db_instance = None
         try:
             db_instance = ChromaDB.get_collection(collection_name)
-            collection_info = db_instance.get_collection_info()
+            collection_info = await asyncio.to_thread(
+                db_instance.get_collection_info, limit, cursor, sort, order
+            )
             return JSONResponse(content=collection_info)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
         except Exception as e:
             return JSONResponse(
                 status_code=500,
@@ -212,8 +511,9 @@ class DocumentManager:
         db_instance = None
         try:
             db_instance = ChromaDB.get_collection(collection_name)
-            success = db_instance.delete_document(document_id)
-            if success:
+            deleted = await asyncio.to_thread(db_instance.delete_document, document_id)
+            if deleted:
+                ingestion_manifest.forget_chunks(collection_name, deleted)
                 return JSONResponse(content={"message": f"Document {document_id} deleted successfully"})
             else:
                 return JSONResponse(
@@ -230,7 +530,79 @@ class DocumentManager:
                 ChromaDB.close_collection(collection_name)
 
     @staticmethod
-    async def process_files(files: List[UploadFile], use_precise_pdf: bool = False) -> List[str]:
+    async def bulk_delete(
+        collection_name: str,
+        metadata_filters: Optional[dict] = None,
+        ids: Optional[List[str]] = None
+    ) -> JSONResponse:
+        """Delete the chunks matching metadata filters and/or ids in one operation."""
+        db_instance = None
+        try:
+            db_instance = ChromaDB.get_collection(collection_name)
+            deleted = await asyncio.to_thread(db_instance.bulk_delete, metadata_filters, ids)
+            ingestion_manifest.forget_chunks(collection_name, deleted)
+            return JSONResponse(content={
+                "message": f"Deleted {len(deleted)} chunks from {collection_name}",
+                "deleted_chunks": len(deleted)
+            })
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": f"An error occurred: {str(e)}"}
+            )
+        finally:
+            if db_instance:
+                ChromaDB.close_collection(collection_name)
+
+    @staticmethod
+    async def delete_collection(collection_name: str) -> JSONResponse:
+        """Delete a whole collection and its ingestion manifest."""
+        try:
+            deleted = await asyncio.to_thread(ChromaDB.drop_collection, collection_name)
+            ingestion_manifest.drop(collection_name)
+            return JSONResponse(content={
+                "message": f"Collection {collection_name} deleted successfully",
+                "deleted_chunks": deleted
+            })
+        except KeyError as e:
+            return JSONResponse(status_code=404, content={"error": e.args[0]})
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": f"An error occurred: {str(e)}"}
+            )
+
+    @staticmethod
+    async def compact_collection(collection_name: str) -> JSONResponse:
+        """Rebuild a collection's index and vacuum the databases, reporting reclaimed bytes."""
+        try:
+            db_instance = ChromaDB.get_collection(collection_name)
+            return JSONResponse(content=await asyncio.to_thread(db_instance.compact))
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": f"An error occurred: {str(e)}"}
+            )
+
+    @staticmethod
+    async def compact_shared_stores() -> JSONResponse:
+        """Rebuild the shared chunk stores of the personal collections, see compact_collection."""
+        try:
+            return JSONResponse(content={
+                "stores": await asyncio.to_thread(ChromaDB.compact_shared_stores)
+            })
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": f"An error occurred: {str(e)}"}
+            )
+
+    @staticmethod
+    async def process_files(files: List[UploadFile], use_precise_pdf: Union[bool, str] = False) -> List[str]:
         """
         Process uploaded files and convert to markdown content.
         
@@ -238,37 +610,93 @@ class DocumentManager:
             files: List of uploaded files to process
             use_precise_pdf: Whether to use precise mode for PDFs
         """
-        processed_content = []
+        spooled_files = []
         for file in files:
             try:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=file.filename.lower()) as temp_file:
-                    content = await file.read()
-                    temp_file.write(content)
-                    temp_file.flush()
-                    
+                file_extension = os.path.splitext(file.filename.lower())[1]
+                spooled_files.append((await spool_upload(file, suffix=file_extension), file_extension))
+            except Exception as e:
+                print(f"Error processing file {file.filename}: {str(e)}")
+
+        processed_content = []
+        try:
+            # Images are OCR'd together in one worker job
+            ocr_texts = await DocumentManager.ocr_batch([
+                spooled for spooled, file_extension in spooled_files
+                if DocumentManager.conversion_mode(file_extension) == "ocr"
+            ])
+            for spooled, file_extension in spooled_files:
+                try:
+                    if spooled.path in ocr_texts:
+                        processed_content.append(ocr_texts[spooled.path])
+                        continue
                     markdown_content = await DocumentManager.process_content(
-                        temp_file.name,
-                        os.path.splitext(file.filename.lower())[1],
-                        use_precise_pdf
+                        spooled.path,
+                        file_extension,
+                        use_precise_pdf,
+                        content_hash=spooled.sha256
                     )
                     processed_content.append(markdown_content)
-                    
-                    os.unlink(temp_file.name)
-            except Exception as e:
-                print(f"Error processing file {file.filename}: {str(e)}")
-                continue
+                except Exception as e:
+                    print(f"Error processing file {spooled.filename}: {str(e)}")
+                    continue
+        finally:
+            for spooled, _ in spooled_files:
+                spooled.cleanup()
         return processed_content
 
+    @staticmethod
+    async def ocr_batch(spooled_images: List[SpooledUpload]) -> Dict[str, str]:
+        """
+        OCR several images with one conversion worker job, using the conversion cache.
+
+        Returns:
+            Dict of spooled file path -> text; images that failed are left out so the
+            caller can fall back to converting them one by one
+        """
+        texts = {}
+        misses = []
+        for spooled in spooled_images:
+            cache_key = conversion_cache.make_key(
+                spooled.sha256, "ocr", DocumentManager.converter_version("ocr")
+            )
+            cached = conversion_cache.get(cache_key)
+            if cached is not None:
+                texts[spooled.path] = cached
+            else:
+                misses.append((spooled, cache_key))
+
+        if misses:
+            try:
+                results = await conversion_pool.run(
+                    ocr_batch_in_worker, [spooled.path for spooled, _ in misses]
+                )
+            except Exception as e:
+                print(f"Error in batched OCR: {str(e)}")
+                return texts
+            for (spooled, cache_key), text in zip(misses, results):
+                conversion_cache.put(cache_key, text)
+                texts[spooled.path] = text
+        return texts
+
     @staticmethod
     async def upload_document_from_path(
         file_path: str,
         document_type: str,
         course_code: str,
         topic: str,
-        collection_name: str = "default"
+        collection_name: str = "default",
+        incremental: bool = True,
+        db_instance: Optional[ChromaDB] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        chunk_ids_callback: Optional[Callable[[List[str]], None]] = None
     ) -> dict:
         """
         Upload a document from a file path (for developer use).
+
+        With incremental=True an unchanged file (same size and mtime, or same content hash
+        as in the ingestion manifest of the collection) is skipped. Either way a file
+        already in the manifest has its previous chunks replaced instead of duplicated.
         
         Args:
             file_path: Path to the file on the server
@@ -276,14 +704,22 @@ class DocumentManager:
             course_code: Course code for the document
             topic: Topic of the document
             collection_name: Name of the collection to store in
+            incremental: Whether to skip unchanged files already in the manifest
+            db_instance: Already opened collection to reuse
+            progress_callback: Called as progress_callback(embedded_chunks, total_chunks)
+                while the file's chunks are embedded
+            chunk_ids_callback: Called with the chunk ids before they are written, see
+                ChromaDB.add_documents
             
         Returns:
-            Dictionary containing upload result details
+            Dictionary containing upload result details, with "status" one of
+            "added", "updated" or "unchanged"
         """
-        db_instance = None
+        owns_instance = db_instance is None
         try:
             # Get the specified collection
-            db_instance = ChromaDB.get_collection(collection_name)
+            if owns_instance:
+                db_instance = ChromaDB.get_collection(collection_name)
             
             file_extension = os.path.splitext(file_path.lower())[1]
             
@@ -294,32 +730,48 @@ class DocumentManager:
                 )
                 
             try:
-                metadata = {
-                    "filename": os.path.basename(file_path),
-                    "course_code": course_code,
-                    "type": file_extension,
-                    "topic": topic,
-                    "date_added": datetime.now().isoformat()
-                }
-                
-                # Convert content to markdown
-                markdown_content = await DocumentManager.process_content(
-                    file_path,
-                    file_extension
-                )
-                
-                # Add to vector store
-                db_instance.add_documents([
-                    Document(
-                        page_content=markdown_content,
-                        metadata=metadata
+                path = os.path.abspath(file_path)
+                stat = os.stat(path)
+                # Read even when not incremental, so the previous chunks still get replaced
+                entry = ingestion_manifest.get(collection_name, path)
+
+                if incremental and entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                    return DocumentManager._unchanged_result(path, collection_name, entry)
+
+                content_hash = file_sha256(path)
+                if incremental and entry and entry["content_hash"] == content_hash:
+                    # Touched but not modified: only refresh the recorded mtime
+                    ingestion_manifest.upsert(
+                        collection_name, path, stat.st_size, stat.st_mtime, content_hash, entry["chunk_ids"]
                     )
-                ])
+                    return DocumentManager._unchanged_result(path, collection_name, entry)
+
+                # Convert content to markdown and add to vector store
+                metadata, chunk_ids = await DocumentManager.ingest_file(
+                    file_path=path,
+                    filename=os.path.basename(path),
+                    course_code=course_code,
+                    topic=topic,
+                    user_email=None,
+                    db_instance=db_instance,
+                    content_hash=content_hash,
+                    progress_callback=progress_callback,
+                    chunk_ids_callback=chunk_ids_callback
+                )
+
+                # Replace the chunks of the previous version of the file
+                if entry:
+                    await asyncio.to_thread(db_instance.delete_ids, entry["chunk_ids"])
+                ingestion_manifest.upsert(
+                    collection_name, path, stat.st_size, stat.st_mtime, content_hash, chunk_ids
+                )
 
                 return {
                     "message": "Document uploaded successfully",
-                    "filename": os.path.basename(file_path),
+                    "status": "updated" if entry else "added",
+                    "filename": os.path.basename(path),
                     "metadata": metadata,
+                    "chunk_count": len(chunk_ids),
                     "collection": collection_name
                 }
 
@@ -330,12 +782,93 @@ class DocumentManager:
                 )
 
         except Exception as e:
-            if db_instance:
-                ChromaDB.close_collection(collection_name)
             raise HTTPException(
                 status_code=500,
                 detail=f"Error uploading document: {str(e)}"
             )
+        finally:
+            if owns_instance and db_instance:
+                ChromaDB.close_collection(collection_name)
+
+    @staticmethod
+    def _unchanged_result(path: str, collection_name: str, entry: dict) -> dict:
+        return {
+            "message": "Document unchanged, skipped",
+            "status": "unchanged",
+            "filename": os.path.basename(path),
+            "chunk_count": len(entry["chunk_ids"]),
+            "collection": collection_name
+        }
+
+    @staticmethod
+    def remove_missing_files(
+        directories: List[str],
+        found_paths: List[str],
+        collection_name: str,
+        db_instance: ChromaDB,
+        recursive: bool = True
+    ) -> List[str]:
+        """
+        Delete the chunks and manifest entries of files that were ingested from the given
+        directories but no longer exist there.
+
+        Returns:
+            The removed file paths
+        """
+        found = {os.path.abspath(path) for path in found_paths}
+        removed = []
+        for directory in directories:
+            directory = os.path.abspath(directory)
+            for entry in ingestion_manifest.entries_under(collection_name, directory):
+                path = entry["path"]
+                if path in found:
+                    continue
+                # Non-recursive scans only own the files directly inside the directory
+                if not recursive and os.path.dirname(path) != directory:
+                    continue
+                db_instance.delete_ids(entry["chunk_ids"])
+                ingestion_manifest.delete(collection_name, path)
+                removed.append(path)
+        return removed
+
+    @staticmethod
+    def collect_paths(paths: List[str], recursive: bool = True) -> Tuple[List[str], List[dict]]:
+        """
+        Expand file and directory paths into the list of supported files to upload.
+
+        Returns:
+            Tuple containing:
+                - list of file paths
+                - list of errors for paths that don't exist or have an unsupported type
+        """
+        file_paths = []
+        errors = []
+
+        def collect_directory(dir_path: str):
+            for entry in os.scandir(dir_path):
+                if entry.is_file():
+                    # Check if file extension is supported
+                    file_extension = os.path.splitext(entry.name.lower())[1]
+                    if file_extension in SUPPORTED_FILE_TYPES.values():
+                        file_paths.append(entry.path)
+                elif entry.is_dir() and recursive:
+                    # Recursively process subdirectories if recursive is True
+                    collect_directory(entry.path)
+
+        for path in paths:
+            if os.path.isdir(path):
+                collect_directory(path)
+            elif not os.path.exists(path):
+                errors.append({"file": path, "error": f"File not found: {path}"})
+            elif os.path.splitext(path.lower())[1] not in SUPPORTED_FILE_TYPES.values():
+                errors.append({
+                    "file": path,
+                    "error": f"Unsupported file type: {os.path.splitext(path.lower())[1]}"
+                })
+            else:
+                file_paths.append(path)
+
+        return file_paths, errors
 
     @staticmethod
     async def upload_from_paths(
@@ -344,10 +877,15 @@ class DocumentManager:
         course_code: str,
         topic: str,
         collection_name: str = "default",
-        recursive: bool = True
+        recursive: bool = True,
+        incremental: bool = True
     ) -> dict:
         """
         Unified upload function that handles both file paths and directories.
+
+        With incremental=True, unchanged files are skipped, changed files have their chunks
+        replaced, and files previously ingested from the given directories that no longer
+        exist have their chunks deleted.
         
         Args:
             paths: List of file or directory paths
@@ -356,59 +894,55 @@ class DocumentManager:
             topic: Topic of the documents
             collection_name: Name of the collection to store in
             recursive: Whether to search subdirectories recursively
+            incremental: Whether to diff against the collection's ingestion manifest
             
         Returns:
             Dictionary containing upload results
         """
         results = []
-        errors = []
-        
-        async def process_directory(dir_path: str):
-            """Helper function to process a directory"""
-            for entry in os.scandir(dir_path):
-                if entry.is_file():
-                    # Check if file extension is supported
-                    file_extension = os.path.splitext(entry.name.lower())[1]
-                    if file_extension in SUPPORTED_FILE_TYPES.values():
-                        await process_file(entry.path)
-                elif entry.is_dir() and recursive:
-                    # Recursively process subdirectories if recursive is True
-                    await process_directory(entry.path)
-        
-        async def process_file(file_path: str):
-            """Helper function to process a single file"""
-            try:
-                if not os.path.exists(file_path):
-                    raise FileNotFoundError(f"File not found: {file_path}")
-                    
-                file_extension = os.path.splitext(file_path.lower())[1]
-                if file_extension not in SUPPORTED_FILE_TYPES.values():
-                    raise ValueError(f"Unsupported file type: {file_extension}")
-                    
-                result = await DocumentManager.upload_document_from_path(
-                    file_path=file_path,
-                    document_type=document_type,
-                    course_code=course_code,
-                    topic=topic,
-                    collection_name=collection_name
+        file_paths, errors = DocumentManager.collect_paths(paths, recursive)
+        removed = []
+
+        db_instance = ChromaDB.get_collection(collection_name)
+        try:
+            for file_path in file_paths:
+                try:
+                    result = await DocumentManager.upload_document_from_path(
+                        file_path=file_path,
+                        document_type=document_type,
+                        course_code=course_code,
+                        topic=topic,
+                        collection_name=collection_name,
+                        incremental=incremental,
+                        db_instance=db_instance
+                    )
+                    results.append(result)
+                except Exception as e:
+                    errors.append({
+                        "file": file_path,
+                        "error": str(e)
+                    })
+
+            if incremental:
+                removed = await asyncio.to_thread(
+                    DocumentManager.remove_missing_files,
+                    [path for path in paths if os.path.isdir(path)],
+                    file_paths,
+                    collection_name,
+                    db_instance,
+                    recursive
                 )
-                results.append(result)
-            except Exception as e:
-                errors.append({
-                    "file": file_path,
-                    "error": str(e)
-                })
-        
-        # Process each path
-        for path in paths:
-            if os.path.isdir(path):
-                await process_directory(path)
-            else:
-                await process_file(path)
-        
+        finally:
+            ChromaDB.close_collection(collection_name)
+
+        unchanged = sum(1 for result in results if result.get("status") == "unchanged")
         return {
-            "message": f"Upload complete. Processed {len(results)} files successfully, {len(errors)} failures",
+            "message": (
+                f"Upload complete. Processed {len(results)} files successfully "
+                f"({unchanged} unchanged), {len(errors)} failures, {len(removed)} removed"
+            ),
             "successful_uploads": results,
             "errors": errors,
+            "removed": removed,
             "collection": collection_name
         }
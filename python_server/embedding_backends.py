@@ -0,0 +1,119 @@
+"""
+Pluggable embedding backends.
+
+A backend is a factory returning a LangChain Embeddings object, registered by name like
+the transcription backends of audio_pipeline. Models are only built on first use, so
+importing the server needs no credentials or network. Built-in backends:
+
+- "azure": AzureOpenAIEmbeddings (the original behaviour)
+- "hashing": a local CPU feature-hashing vectorizer over the CJK-aware lexical tokens,
+  deterministic and dependency-free, for tests, benchmarks and bulk local ingestion
+- "sentence-transformers": a local sentence-embedding model (SENTENCE_TRANSFORMER_MODEL)
+
+Each collection is bound to one backend (vectors of different backends can't be mixed):
+EMBEDDING_BACKEND_COLLECTIONS maps collection name patterns to backends, e.g.
+"bench_*=hashing,user_*=azure", and EMBEDDING_BACKEND is used for everything else.
+"""
+
+import os
+import hashlib
+import threading
+from fnmatch import fnmatch
+from typing import Callable, Dict, List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from embedding_cache import CachedEmbeddings, embedding_cache
+from lexical_index import tokenize
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "azure")
+EMBEDDING_BACKEND_COLLECTIONS = os.getenv("EMBEDDING_BACKEND_COLLECTIONS", "")
+HASHING_DIMENSIONS = int(os.getenv("HASHING_DIMENSIONS", "1024"))
+SENTENCE_TRANSFORMER_MODEL = os.getenv("SENTENCE_TRANSFORMER_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# backend name -> factory returning the Embeddings
+EMBEDDING_BACKENDS: Dict[str, Callable[[], Embeddings]] = {}
+
+_models: Dict[str, CachedEmbeddings] = {}
+_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[[], Embeddings]) -> None:
+    """Register an embedding backend, built on first use by calling factory()."""
+    EMBEDDING_BACKENDS[name] = factory
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Signed feature hashing of the lexical index tokens into a fixed number of dimensions,
+    with sublinear term frequency and L2 normalization. Matches on shared terms only,
+    no semantics, but needs no model and runs at CPU speed.
+    """
+
+    def __init__(self, dimensions: int = HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+        self.model = f"hashing-{dimensions}"
+
+    def _embed(self, text: str) -> List[float]:
+        counts: Dict[int, float] = {}
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            index = value % self.dimensions
+            sign = 1.0 if value >> 63 else -1.0
+            counts[index] = counts.get(index, 0.0) + sign
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        if counts:
+            indexes = np.fromiter(counts.keys(), dtype=np.int64)
+            values = np.fromiter(counts.values(), dtype=np.float32)
+            vector[indexes] = np.sign(values) * np.log1p(np.abs(values))
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _azure() -> Embeddings:
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://hkust.azure-api.net")
+    os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-10-01-preview")
+    return AzureOpenAIEmbeddings()
+
+
+def _sentence_transformers() -> Embeddings:
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    return HuggingFaceEmbeddings(
+        model_name=SENTENCE_TRANSFORMER_MODEL,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True}
+    )
+
+
+register_backend("azure", _azure)
+register_backend("hashing", HashingEmbeddings)
+register_backend("sentence-transformers", _sentence_transformers)
+
+
+def get_embeddings(backend: str = EMBEDDING_BACKEND) -> CachedEmbeddings:
+    """The process-wide embeddings of a backend, behind the on-disk embedding cache."""
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}. Available: {', '.join(EMBEDDING_BACKENDS)}")
+    with _lock:
+        if backend not in _models:
+            _models[backend] = CachedEmbeddings(EMBEDDING_BACKENDS[backend](), embedding_cache)
+        return _models[backend]
+
+
+def configured_backend(collection_name: str) -> str:
+    """The backend EMBEDDING_BACKEND_COLLECTIONS / EMBEDDING_BACKEND assign to a collection."""
+    for rule in EMBEDDING_BACKEND_COLLECTIONS.split(","):
+        pattern, _, backend = rule.partition("=")
+        if backend and fnmatch(collection_name, pattern.strip()):
+            return backend.strip()
+    return EMBEDDING_BACKEND
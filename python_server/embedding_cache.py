@@ -0,0 +1,145 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk store of embeddings keyed by (model, SHA-256 of the text).
+    Vectors are stored as compact float32 blobs. The database is created on first use,
+    so importing the module leaves no file behind.
+    """
+
+    def __init__(self, db_path: str = "./chroma_db/embedding_cache.sqlite3"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._created = False
+        self.counters = {
+            "document_hits": 0,
+            "document_misses": 0,
+            "query_hits": 0,
+            "query_misses": 0
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        with self._lock:
+            if not self._created:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                with sqlite3.connect(self.db_path, timeout=30) as conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS embeddings ("
+                        "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                        "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+                    )
+                self._created = True
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return the cached vectors among hashes as {hash: vector}."""
+        found = {}
+        with self._connect() as conn:
+            # stay below SQLite's bound parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, h, np.asarray(vector, dtype=np.float32).tobytes())
+                    for h, vector in items.items()
+                ]
+            )
+
+    def record(self, kind: str, hits: int, misses: int) -> None:
+        with self._lock:
+            self.counters[f"{kind}_hits"] += hits
+            self.counters[f"{kind}_misses"] += misses
+
+    def stats(self) -> Dict[str, float]:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = sum(self.counters.values())
+        hits = self.counters["document_hits"] + self.counters["query_hits"]
+        return {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults the EmbeddingCache before calling the underlying
+    model, for both document and query embeddings.
+    """
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_name = model_name or (
+            getattr(underlying, "deployment", None)
+            or getattr(underlying, "model", None)
+            or getattr(underlying, "model_name", None)
+            or type(underlying).__name__
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        found = self.cache.get_many(self.model_name, list(set(hashes)))
+
+        # Embed each distinct missing text once
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found and h not in missing:
+                missing[h] = text
+        missed = sum(h in missing for h in hashes)
+        self.cache.record("document", len(texts) - missed, missed)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, new_items)
+            found.update(new_items)
+
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        h = text_hash(text)
+        found = self.cache.get_many(self.model_name, [h])
+        if h in found:
+            self.cache.record("query", 1, 0)
+            return found[h]
+
+        self.cache.record("query", 0, 1)
+        vector = self.underlying.embed_query(text)
+        self.cache.put_many(self.model_name, {h: vector})
+        return vector
+
+
+def _default_path() -> str:
+    # Caches filled before the cache moved next to the other bookkeeping stores stay in use
+    if os.path.exists("./embedding_cache.sqlite3"):
+        return "./embedding_cache.sqlite3"
+    return "./chroma_db/embedding_cache.sqlite3"
+
+
+embedding_cache = EmbeddingCache(db_path=os.getenv("EMBEDDING_CACHE_PATH") or _default_path())
@@ -0,0 +1,407 @@
+"""
+Background ingestion jobs for /documents/upload and /documents/upload-from-paths.
+
+Jobs and their per-file progress are stored in a local SQLite table, so queued work
+survives a server restart. Uploaded files are spooled into a persistent directory until
+their job has processed them.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException, UploadFile
+from database import ChromaDB
+from document_manager import DocumentManager, UPLOAD_CONCURRENCY, ingestion_manifest
+from upload_spool import spool_upload
+
+POLL_INTERVAL = 2.0
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class IngestionJobQueue:
+    def __init__(
+        self,
+        db_path: str = "./ingestion_jobs.sqlite3",
+        spool_dir: str = "./ingestion_spool",
+        workers: int = 1
+    ):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    owner_pid INTEGER,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS job_files (
+                    job_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    content_hash TEXT,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    result TEXT,
+                    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+                    chunks_total INTEGER,
+                    chunk_ids TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (job_id, position)
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            """)
+            # Job databases created before chunk progress was tracked
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(job_files)")}
+            if "chunks_embedded" not in columns:
+                conn.execute("ALTER TABLE job_files ADD COLUMN chunks_embedded INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE job_files ADD COLUMN chunks_total INTEGER")
+            if "chunk_ids" not in columns:
+                conn.execute("ALTER TABLE job_files ADD COLUMN chunk_ids TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_job(self, kind: str, params: dict, files: List[Dict[str, Any]]) -> str:
+        job_id = uuid.uuid4().hex
+        now = _now()
+        with self._connect() as conn:
+            conn.execute("BEGIN")
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params), now, now)
+            )
+            conn.executemany(
+                "INSERT INTO job_files (job_id, position, filename, path, content_hash, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                [
+                    (job_id, i, f["filename"], f["path"], f.get("content_hash"), now)
+                    for i, f in enumerate(files)
+                ]
+            )
+            conn.execute("COMMIT")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def submit_uploads(self, files: List[UploadFile], params: dict) -> str:
+        """Spool uploaded files to the persistent spool directory and queue a job for them."""
+        spooled_files = []
+        try:
+            for file in files:
+                suffix = os.path.splitext(file.filename.lower())[1]
+                spooled = await spool_upload(file, suffix=suffix, directory=self.spool_dir)
+                spooled_files.append(spooled)
+        except Exception:
+            for spooled in spooled_files:
+                spooled.cleanup()
+            raise
+
+        return self._create_job("upload", params, [
+            {"filename": s.filename, "path": s.path, "content_hash": s.sha256}
+            for s in spooled_files
+        ])
+
+    def submit_paths(self, file_paths: List[str], params: dict) -> str:
+        """Queue a job for files already on the server."""
+        return self._create_job("paths", params, [
+            {"filename": os.path.basename(path), "path": path}
+            for path in file_paths
+        ])
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Return a job with per-file progress, or None if it doesn't exist."""
+        with self._connect() as conn:
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            files = conn.execute(
+                "SELECT * FROM job_files WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+
+        counts: Dict[str, int] = {}
+        for f in files:
+            counts[f["status"]] = counts.get(f["status"], 0) + 1
+        return {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+            "progress": {
+                "total": len(files),
+                "completed": counts.get("completed", 0),
+                "failed": counts.get("failed", 0),
+                "pending": counts.get("pending", 0) + counts.get("running", 0),
+                "chunks_embedded": sum(f["chunks_embedded"] for f in files),
+                "chunks_total": sum(f["chunks_total"] or 0 for f in files)
+            },
+            "files": [
+                {
+                    "filename": f["filename"],
+                    "status": f["status"],
+                    "error": f["error"],
+                    # chunks_total is null until the file is converted and chunked
+                    "chunks_embedded": f["chunks_embedded"],
+                    "chunks_total": f["chunks_total"],
+                    "result": json.loads(f["result"]) if f["result"] else None
+                }
+                for f in files
+            ]
+        }
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Atomically mark the oldest queued job as running by this process."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            job = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if job is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner_pid = ?, updated_at = ? WHERE id = ?",
+                    (os.getpid(), _now(), job["id"])
+                )
+            conn.execute("COMMIT")
+        return job
+
+    def _recover(self) -> None:
+        """
+        Requeue jobs left running by a process that no longer exists (e.g. after a restart).
+        Their interrupted files keep the chunk ids they were writing, which are deleted
+        before the file runs again, see _run_job.
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in conn.execute("SELECT id, owner_pid FROM jobs WHERE status = 'running'").fetchall():
+                if job["owner_pid"] == os.getpid() or not _pid_alive(job["owner_pid"]):
+                    conn.execute(
+                        "UPDATE jobs SET status = 'queued', owner_pid = NULL, updated_at = ? WHERE id = ?",
+                        (_now(), job["id"])
+                    )
+                    conn.execute(
+                        "UPDATE job_files SET status = 'pending', chunks_embedded = 0, chunks_total = NULL "
+                        "WHERE job_id = ? AND status = 'running'",
+                        (job["id"],)
+                    )
+            conn.execute("COMMIT")
+
+    def _update_file(self, job_id: str, position: int, status: str, error: str = None, result: dict = None) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_files SET status = ?, error = ?, result = ?, updated_at = ? "
+                "WHERE job_id = ? AND position = ?",
+                (status, error, json.dumps(result) if result is not None else None, _now(), job_id, position)
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (_now(), job_id))
+
+    def _update_chunk_progress(self, job_id: str, position: int, embedded: int, total: int) -> None:
+        """Record a file's embedding progress; called from the embedding thread."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_files SET chunks_embedded = ?, chunks_total = ?, updated_at = ? "
+                "WHERE job_id = ? AND position = ?",
+                (embedded, total, _now(), job_id, position)
+            )
+
+    def _record_chunk_ids(self, job_id: str, position: int, chunk_ids: List[str]) -> None:
+        """Record the ids of the chunks a file is about to write; called from the embedding thread."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE job_files SET chunk_ids = ? WHERE job_id = ? AND position = ?",
+                (json.dumps(chunk_ids), job_id, position)
+            )
+
+    def _finish_job(self, job_id: str, error: str = None) -> None:
+        with self._connect() as conn:
+            failed = conn.execute(
+                "SELECT COUNT(*) FROM job_files WHERE job_id = ? AND status = 'failed'", (job_id,)
+            ).fetchone()[0]
+            status = "failed" if error or failed else "completed"
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, owner_pid = NULL, updated_at = ? WHERE id = ?",
+                (status, error, _now(), job_id)
+            )
+
+    async def _run_job(self, job: sqlite3.Row) -> None:
+        params = json.loads(job["params"])
+        collection_name = params["collection_name"]
+        with self._connect() as conn:
+            files = conn.execute(
+                "SELECT * FROM job_files WHERE job_id = ? AND status = 'pending' ORDER BY position",
+                (job["id"],)
+            ).fetchall()
+
+        db_instance = None
+        semaphore = asyncio.Semaphore(max(1, UPLOAD_CONCURRENCY))
+
+        def discard_spooled(f: sqlite3.Row) -> None:
+            # spooled uploads are kept until processed (not when cancelled by a shutdown)
+            if job["kind"] == "upload":
+                try:
+                    os.unlink(f["path"])
+                except FileNotFoundError:
+                    pass
+
+        async def process(f: sqlite3.Row) -> None:
+            async with semaphore:
+                self._update_file(job["id"], f["position"], "running")
+
+                def progress(embedded: int, total: int) -> None:
+                    self._update_chunk_progress(job["id"], f["position"], embedded, total)
+
+                def record_chunk_ids(chunk_ids: List[str]) -> None:
+                    self._record_chunk_ids(job["id"], f["position"], chunk_ids)
+
+                try:
+                    if f["chunk_ids"]:
+                        # Written (maybe partly) by an attempt a crash interrupted
+                        partial = json.loads(f["chunk_ids"])
+                        print(f"Deleting {len(partial)} chunks of the interrupted ingestion of {f['filename']}")
+                        await asyncio.to_thread(db_instance.delete_ids, partial)
+                        ingestion_manifest.forget_chunks(collection_name, partial)
+                    if job["kind"] == "paths":
+                        result = await DocumentManager.upload_document_from_path(
+                            file_path=f["path"],
+                            document_type=params["document_type"],
+                            course_code=params["course_code"],
+                            topic=params["topic"],
+                            collection_name=collection_name,
+                            incremental=params.get("incremental", True),
+                            db_instance=db_instance,
+                            progress_callback=progress,
+                            chunk_ids_callback=record_chunk_ids
+                        )
+                    else:
+                        metadata, _ = await DocumentManager.ingest_file(
+                            file_path=f["path"],
+                            filename=f["filename"],
+                            course_code=params["course_code"],
+                            topic=params["topic"],
+                            user_email=params.get("user_email"),
+                            db_instance=db_instance,
+                            use_precise_pdf=params.get("use_precise_pdf", False),
+                            content_hash=f["content_hash"],
+                            progress_callback=progress,
+                            chunk_ids_callback=record_chunk_ids
+                        )
+                        result = {
+                            "message": "Document uploaded successfully",
+                            "filename": f["filename"],
+                            "metadata": metadata,
+                            "collection": collection_name
+                        }
+                    self._update_file(job["id"], f["position"], "completed", result=result)
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    self._update_file(job["id"], f["position"], "failed", error=str(detail))
+                discard_spooled(f)
+
+        try:
+            try:
+                db_instance = ChromaDB.get_collection(collection_name)
+            except Exception as e:
+                # e.g. an unusable embedding backend: the job can't run, so none of its files will
+                for f in files:
+                    self._update_file(job["id"], f["position"], "failed", error=f"Could not open collection: {e}")
+                    discard_spooled(f)
+                raise
+            await asyncio.gather(*(process(f) for f in files))
+            if job["kind"] == "paths" and params.get("incremental", True):
+                with self._connect() as conn:
+                    all_paths = [
+                        row["path"] for row in conn.execute(
+                            "SELECT path FROM job_files WHERE job_id = ?", (job["id"],)
+                        )
+                    ]
+                await asyncio.to_thread(
+                    DocumentManager.remove_missing_files,
+                    params.get("directories", []),
+                    all_paths,
+                    collection_name,
+                    db_instance,
+                    params.get("recursive", True)
+                )
+            self._finish_job(job["id"])
+        except Exception as e:
+            self._finish_job(job["id"], error=str(e))
+        finally:
+            if db_instance is not None:
+                ChromaDB.close_collection(collection_name)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                await self._work_once()
+            except Exception as e:
+                # One bad job (or a locked job database) must not stop the worker
+                print(f"Ingestion worker error: {e}")
+                await asyncio.sleep(POLL_INTERVAL)
+
+    async def _work_once(self) -> None:
+        """Run the next queued job, or wait up to POLL_INTERVAL for one."""
+        job = self._claim_next()
+        if job is None:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            return
+        print(f"Running ingestion job {job['id']}")
+        try:
+            await self._run_job(job)
+        except Exception as e:
+            self._finish_job(job["id"], error=str(e))
+            raise
+
+    async def start(self) -> None:
+        """Recover interrupted jobs and start the background workers."""
+        self._wakeup = asyncio.Event()
+        self._recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+ingestion_jobs = IngestionJobQueue(
+    db_path=os.getenv("INGESTION_JOB_DB", "./ingestion_jobs.sqlite3"),
+    spool_dir=os.getenv("INGESTION_SPOOL_DIR", "./ingestion_spool"),
+    workers=int(os.getenv("INGESTION_WORKERS", "1"))
+)
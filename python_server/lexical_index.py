@@ -0,0 +1,197 @@
+"""
+Local BM25 inverted index over chunk text.
+
+Embedding search is weak on exact identifiers (function names, Python keywords, course
+codes), so every chunk is also indexed by its terms at ingestion time. The index lives
+in the collection index database next to Chroma and is kept in sync on insert and delete.
+
+Tokenization is CJK-aware: Latin text is split into lowercased words (identifiers are
+kept whole and also split on underscores and camelCase), while runs of Chinese, Japanese
+or Korean characters, which have no spaces, are indexed as character unigrams and bigrams.
+"""
+
+import re
+import math
+from collections import Counter
+from typing import Iterable, List, Tuple
+from collection_index import connect
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD_PATTERN = re.compile(
+    r"[A-Za-z0-9_]+"
+    "|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+"  # kana, CJK, hangul
+)
+CAMEL_CASE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into index terms, see the module docstring."""
+    tokens = []
+    for word in WORD_PATTERN.findall(text):
+        if word[0].isascii():
+            tokens.append(word.lower())
+            # similarity_search -> similarity, search; TextSplitter -> text, splitter
+            parts = [
+                part.lower()
+                for piece in word.split("_") if piece
+                for part in CAMEL_CASE.findall(piece)
+            ]
+            if len(parts) > 1:
+                tokens.extend(parts)
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Inverted index (term -> chunk ids with term frequency) per collection, with the
+    chunk lengths and collection totals needed for BM25 scoring.
+    """
+
+    def __init__(self, persist_directory: str = "./chroma_db"):
+        self.persist_directory = persist_directory
+        with connect(self.persist_directory) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS lexical_postings (
+                    collection TEXT NOT NULL,
+                    term TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (collection, term, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS lexical_postings_by_chunk
+                    ON lexical_postings (collection, chunk_id);
+                CREATE TABLE IF NOT EXISTS lexical_chunks (
+                    collection TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (collection, chunk_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS lexical_stats (
+                    collection TEXT PRIMARY KEY,
+                    chunk_count INTEGER NOT NULL,
+                    total_length INTEGER NOT NULL
+                );
+            """)
+
+    @staticmethod
+    def _add(conn, collection: str, ids: List[str], documents: List[str]) -> None:
+        postings = []
+        lengths = []
+        for chunk_id, text in zip(ids, documents):
+            counts = Counter(tokenize(text or ""))
+            lengths.append((collection, chunk_id, sum(counts.values())))
+            postings.extend((collection, term, chunk_id, tf) for term, tf in counts.items())
+        conn.executemany(
+            "INSERT OR REPLACE INTO lexical_postings (collection, term, chunk_id, tf) VALUES (?, ?, ?, ?)",
+            postings
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO lexical_chunks (collection, chunk_id, length) VALUES (?, ?, ?)",
+            lengths
+        )
+        conn.execute(
+            "INSERT INTO lexical_stats (collection, chunk_count, total_length) VALUES (?, ?, ?) "
+            "ON CONFLICT(collection) DO UPDATE SET "
+            "chunk_count = chunk_count + excluded.chunk_count, "
+            "total_length = total_length + excluded.total_length",
+            (collection, len(lengths), sum(length for _, _, length in lengths))
+        )
+
+    def is_built(self, collection: str) -> bool:
+        with connect(self.persist_directory) as conn:
+            return conn.execute(
+                "SELECT 1 FROM lexical_stats WHERE collection = ?", (collection,)
+            ).fetchone() is not None
+
+    def rebuild(self, collection: str, chunk_pages: Iterable[Tuple[List[str], List[str]]]) -> None:
+        """Index a collection from scratch, from pages of (ids, documents)."""
+        with connect(self.persist_directory) as conn:
+            self._drop(conn, collection)
+            conn.execute(
+                "INSERT INTO lexical_stats (collection, chunk_count, total_length) VALUES (?, 0, 0)",
+                (collection,)
+            )
+            for ids, documents in chunk_pages:
+                self._add(conn, collection, ids, documents)
+
+    def add(self, collection: str, ids: List[str], documents: List[str]) -> None:
+        with connect(self.persist_directory) as conn:
+            self._add(conn, collection, ids, documents)
+
+    def remove(self, collection: str, ids: List[str]) -> None:
+        with connect(self.persist_directory) as conn:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                removed, removed_length = conn.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM lexical_chunks "
+                    f"WHERE collection = ? AND chunk_id IN ({placeholders})",
+                    [collection, *batch]
+                ).fetchone()
+                conn.execute(
+                    f"DELETE FROM lexical_postings WHERE collection = ? AND chunk_id IN ({placeholders})",
+                    [collection, *batch]
+                )
+                conn.execute(
+                    f"DELETE FROM lexical_chunks WHERE collection = ? AND chunk_id IN ({placeholders})",
+                    [collection, *batch]
+                )
+                conn.execute(
+                    "UPDATE lexical_stats SET chunk_count = chunk_count - ?, "
+                    "total_length = total_length - ? WHERE collection = ?",
+                    (removed, removed_length, collection)
+                )
+
+    @staticmethod
+    def _drop(conn, collection: str) -> None:
+        conn.execute("DELETE FROM lexical_postings WHERE collection = ?", (collection,))
+        conn.execute("DELETE FROM lexical_chunks WHERE collection = ?", (collection,))
+        conn.execute("DELETE FROM lexical_stats WHERE collection = ?", (collection,))
+
+    def drop(self, collection: str) -> None:
+        with connect(self.persist_directory) as conn:
+            self._drop(conn, collection)
+
+    def search(self, collection: str, query: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Rank the chunks of a collection against a query with BM25.
+
+        Returns:
+            Up to limit (chunk id, BM25 score) pairs, highest score first
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        scores = {}
+        with connect(self.persist_directory) as conn:
+            stats = conn.execute(
+                "SELECT chunk_count, total_length FROM lexical_stats WHERE collection = ?",
+                (collection,)
+            ).fetchone()
+            if not stats or not stats["chunk_count"]:
+                return []
+            chunk_count = stats["chunk_count"]
+            avg_length = stats["total_length"] / chunk_count or 1
+
+            for term in terms:
+                postings = conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM lexical_postings p "
+                    "JOIN lexical_chunks c ON c.collection = p.collection AND c.chunk_id = p.chunk_id "
+                    "WHERE p.collection = ? AND p.term = ?",
+                    (collection, term)
+                ).fetchall()
+                if not postings:
+                    continue
+                idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf, length in postings:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
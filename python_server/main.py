@@ -8,12 +8,15 @@
 # 4. follow-up chatbot
 
 import os
+import hmac
 import random
+import asyncio
 import fitz
-from typing import List, Dict, Any
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, File, Form, UploadFile, Body, Request, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, Body, Request, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from langchain_openai import AzureChatOpenAI, ChatOpenAI
@@ -24,7 +27,17 @@ from dotenv import load_dotenv
 from document_manager import DocumentManager
 from prompts import SUMMARY_PROMPT
 from summary_manager import SummaryManager
+import database
+import ocr_pipeline
 from database import ChromaDB
+from retrieval import RetrievalService
+from conversion_cache import conversion_cache
+from embedding_cache import embedding_cache
+from retrieval_cache import retrieval_cache
+from shared_chunks import shared_store_stats
+from conversion_pool import conversion_pool
+from ingestion_jobs import ingestion_jobs
+from upload_spool import MAX_REQUEST_BYTES, RequestSizeLimitMiddleware
 from quiz_generation import gen_quiz
 from quiz_grader import grader
 from chatbot_utils import start_followup_chatbot, start_career_advisor, get_history_by_user_id, get_session_ids, get_history_by_session_id, new_guidance
@@ -32,8 +45,30 @@ from chatbot_utils import start_followup_chatbot, start_career_advisor, get_hist
 # Load environment variables
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one Chroma client for the whole process, collection handles are pooled on top of it;
+    # also moves personal collections created before the shared chunk store into it
+    await asyncio.to_thread(database.startup)
+    # images fall back to markitdown if tesseract or its language data is missing
+    ocr_pipeline.ocr_available()
+    # opt-in: start the conversion workers (and load marker in them) before the first request
+    if conversion_pool.warmup_marker:
+        await conversion_pool.warmup()
+    # background workers for queued uploads (resumes jobs interrupted by a restart)
+    await ingestion_jobs.start()
+    yield
+    await ingestion_jobs.stop()
+    database.cleanup()
+    # stop the document conversion worker processes
+    conversion_pool.shutdown()
+
 # set up the fastapi environment
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Reject request bodies larger than MAX_REQUEST_MB while they are received. Added before
+# CORS so CORS stays the outermost middleware and the 413 carries its headers
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_REQUEST_BYTES)
 
 # Configure CORS
 app.add_middleware(
@@ -51,6 +86,8 @@ api_key = os.getenv("AZURE_OPENAI_API_KEY")
 os.environ["AZURE_OPENAI_ENDPOINT"] = "https://hkust.azure-api.net"
 os.environ["AZURE_OPENAI_DEPLOYMENT_NAME"] = "gpt-4o-mini"
 api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-01-preview")
+# Token of the admin endpoints (X-Admin-Token header); they are disabled without one
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 client = AzureOpenAI(api_key=api_key,
                      api_version=api_version,
@@ -117,8 +154,8 @@ async def submit_summary(
         if filenames:
             metadata_filters["filename"] = filenames[0].split(',') if ',' in filenames[0] else filenames
         
-        # Convert precise_pdf string to boolean
-        use_precise_pdf = precise_pdf.lower() == "true"
+        # Convert precise_pdf string ("true" / "false" / "auto") to the PDF mode
+        use_precise_pdf = DocumentManager.parse_pdf_mode(precise_pdf)
         
         return await SummaryManager.submit_summary(
             files=files,
@@ -214,8 +251,8 @@ async def submit_quiz(
         if filenames:
             metadata_filters["filename"] = filenames[0].split(',') if ',' in filenames[0] else filenames
 
-        # Convert precise_pdf string to boolean
-        use_precise_pdf = precise_pdf.lower() == "true"
+        # Convert precise_pdf string ("true" / "false" / "auto") to the PDF mode
+        use_precise_pdf = DocumentManager.parse_pdf_mode(precise_pdf)
 
         # Call gen_quiz with proper parameters
         result = await gen_quiz(
@@ -358,9 +395,14 @@ async def upload_documents(
     topic: str = Form(...),
     user_email: str = Form(None),
     collection_name: str = Form(None),
-    precise_pdf: str = Form("false")
+    precise_pdf: str = Form("false"),
+    async_mode: str = Form("false")
 ):
-    """Handle multiple uploads at once."""
+    """
+    Handle multiple uploads at once.
+    With async_mode="true" the files are queued and a job id is returned immediately,
+    poll GET /documents/jobs/{job_id} for progress.
+    """
     # Determine collection name based on inputs
     if collection_name:
         # Developer upload to specified collection
@@ -371,31 +413,57 @@ async def upload_documents(
     else:
         raise HTTPException(status_code=400, detail="Either collection_name or user_email must be provided")
 
-    # Convert precise_pdf string to boolean
-    use_precise_pdf = precise_pdf.lower() == "true"
-
-    results = []
-    for file in files:
-        single_result = await DocumentManager.upload_document(
-            file=file,
-            document_type=document_type,
-            course_code=course_code,
-            topic=topic,
-            user_email=user_email,
-            collection_name=target_collection,
-            use_precise_pdf=use_precise_pdf
+    # Convert precise_pdf string ("true" / "false" / "auto") to the PDF mode
+    use_precise_pdf = DocumentManager.parse_pdf_mode(precise_pdf)
+
+    if async_mode.lower() == "true":
+        job_id = await ingestion_jobs.submit_uploads(files, {
+            "document_type": document_type,
+            "course_code": course_code,
+            "topic": topic,
+            "user_email": user_email,
+            "collection_name": target_collection,
+            "use_precise_pdf": use_precise_pdf
+        })
+        return JSONResponse(
+            status_code=202,
+            content={"message": "Upload queued", "job_id": job_id, "status_url": f"/documents/jobs/{job_id}"}
         )
-        results.append(single_result)
+
+    # Files are processed concurrently (bounded by UPLOAD_CONCURRENCY) into one collection handle
+    results = await DocumentManager.upload_documents(
+        files=files,
+        document_type=document_type,
+        course_code=course_code,
+        topic=topic,
+        user_email=user_email,
+        collection_name=target_collection,
+        use_precise_pdf=use_precise_pdf
+    )
 
     return JSONResponse(
         content={"message": "Batch upload complete", "details": results}
     )
 
+@app.get("/documents/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    """Status and per-file progress of a queued upload job."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JSONResponse(content=job)
+
 @app.get("/documents/{collection_name}")
-async def list_documents(collection_name: str = "default"):
-    """List all documents in the specified collection."""
+async def list_documents(
+    collection_name: str = "default",
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    sort: str = "date_added",
+    order: str = "desc"
+):
+    """List the documents in the specified collection, one page at a time."""
     try:
-        result = await DocumentManager.list_documents(collection_name)
+        result = await DocumentManager.list_documents(collection_name, limit, cursor, sort, order)
         return result
     finally:
         ChromaDB.close_collection(collection_name)
@@ -405,6 +473,50 @@ async def delete_document(collection_name: str, document_id: str):
     """Delete a document from the specified collection."""
     return await DocumentManager.delete_document(document_id, collection_name)
 
+@app.post("/documents/{collection_name}/bulk-delete")
+async def bulk_delete_documents(
+    collection_name: str,
+    ids: List[str] = Body(None),
+    course_codes: List[str] = Body(None),
+    topics: List[str] = Body(None),
+    filenames: List[str] = Body(None)
+):
+    """Delete every chunk matching the given course codes / topics / filenames and/or chunk ids."""
+    metadata_filters = {}
+    if course_codes:
+        metadata_filters["course_code"] = course_codes
+    if topics:
+        metadata_filters["topic"] = topics
+    if filenames:
+        metadata_filters["filename"] = filenames
+    return await DocumentManager.bulk_delete(collection_name, metadata_filters, ids)
+
+def require_admin(x_admin_token: Optional[str]) -> None:
+    """Refuse the request unless the X-Admin-Token header matches ADMIN_TOKEN (403)."""
+    if not ADMIN_TOKEN or not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.delete("/documents/{collection_name}")
+async def delete_collection(collection_name: str, x_admin_token: Optional[str] = Header(None)):
+    """Delete a whole collection; needs the ADMIN_TOKEN header."""
+    require_admin(x_admin_token)
+    return await DocumentManager.delete_collection(collection_name)
+
+@app.post("/documents/{collection_name}/compact")
+async def compact_collection(collection_name: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Rebuild the collection index without deleted entries and report the reclaimed bytes;
+    needs the ADMIN_TOKEN header.
+    """
+    require_admin(x_admin_token)
+    return await DocumentManager.compact_collection(collection_name)
+
+@app.post("/admin/shared-chunks/compact")
+async def compact_shared_chunks(x_admin_token: Optional[str] = Header(None)):
+    """Rebuild the shared chunk stores of the personal collections; needs the ADMIN_TOKEN header."""
+    require_admin(x_admin_token)
+    return await DocumentManager.compact_shared_stores()
+
 @app.post("/documents/upload")
 async def upload_documents(
     files: List[UploadFile] = File(...),
@@ -435,29 +547,14 @@ async def get_collection_metadata(collection_name: str):
     """Get metadata information for a collection."""
     try:
         db_instance = ChromaDB.get_collection(collection_name)
-        collection_data = db_instance.vector_store._collection.get()
-        
-        # Extract unique metadata values
-        metadata = {
-            "course_codes": set(),
-            "topics": set(),
-            "filenames": set()
-        }
+        # Served from the facet index maintained on insert / delete
+        facets = db_instance.get_facets()
         
-        for doc_metadata in collection_data["metadatas"]:
-            if doc_metadata:
-                if "course_code" in doc_metadata:
-                    metadata["course_codes"].add(doc_metadata["course_code"])
-                if "topic" in doc_metadata:
-                    metadata["topics"].add(doc_metadata["topic"])
-                if "filename" in doc_metadata:
-                    metadata["filenames"].add(doc_metadata["filename"])
-        
-        # Convert sets to sorted lists for JSON serialization
         return JSONResponse({
-            "course_codes": sorted(list(metadata["course_codes"])),
-            "topics": sorted(list(metadata["topics"])),
-            "filenames": sorted(list(metadata["filenames"]))
+            "course_codes": sorted(facets["course_code"]),
+            "topics": sorted(facets["topic"]),
+            "filenames": sorted(facets["filename"]),
+            "counts": facets
         })
     except Exception as e:
         return JSONResponse(
@@ -474,7 +571,9 @@ async def upload_from_paths(
     course_code: str = Body(...),
     topic: str = Body(...),
     collection_name: str = Body("default"),
-    recursive: bool = Body(True)
+    recursive: bool = Body(True),
+    incremental: bool = Body(True),
+    async_mode: bool = Body(False)
 ):
     """
     Upload documents from file paths and/or directories.
@@ -490,17 +589,49 @@ async def upload_from_paths(
         "course_code": "CS101",
         "topic": "Introduction to Programming",
         "collection_name": "my_collection",
-        "recursive": true
+        "recursive": true,
+        "incremental": true,
+        "async_mode": false
     }
+
+    With incremental true (default) files unchanged since the last run are skipped, changed
+    files have their chunks replaced and files removed from the given directories have
+    their chunks deleted. With incremental false every file is ingested again, still
+    replacing the chunks it had.
+
+    With async_mode true the files are queued and a job id is returned immediately,
+    poll GET /documents/jobs/{job_id} for progress.
     """
     try:
+        if async_mode:
+            file_paths, errors = DocumentManager.collect_paths(paths, recursive)
+            job_id = ingestion_jobs.submit_paths(file_paths, {
+                "document_type": document_type,
+                "course_code": course_code,
+                "topic": topic,
+                "collection_name": collection_name,
+                "recursive": recursive,
+                "incremental": incremental,
+                "directories": [path for path in paths if os.path.isdir(path)]
+            })
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "message": "Upload queued",
+                    "job_id": job_id,
+                    "status_url": f"/documents/jobs/{job_id}",
+                    "errors": errors
+                }
+            )
+
         result = await DocumentManager.upload_from_paths(
             paths=paths,
             document_type=document_type,
             course_code=course_code,
             topic=topic,
             collection_name=collection_name,
-            recursive=recursive
+            recursive=recursive,
+            incremental=incremental
         )
         
         return JSONResponse(content=result)
@@ -524,7 +655,8 @@ async def test_metadata_search(
     collections: List[str] = Form(None),
     course_codes: List[str] = Form(None),
     topics: List[str] = Form(None),
-    filenames: List[str] = Form(None)
+    filenames: List[str] = Form(None),
+    mode: Optional[str] = Form(None)
 ):
     """Test endpoint to verify metadata filtering."""
     try:
@@ -545,27 +677,21 @@ async def test_metadata_search(
         if filenames:
             metadata_filters["filename"] = filenames[0].split(',') if ',' in filenames[0] else filenames
 
-        all_results = []
-        # Search across specified collections
-        for collection_name in collection_list:
-            try:
-                db_instance = ChromaDB.get_collection(collection_name)
-                docs = db_instance.similarity_search(
-                    query=query,
-                    k=4,
-                    metadata_filters=metadata_filters
-                )
-                
-                # Format results for this collection
-                collection_results = [{
-                    "content": doc.page_content[:200] + "...",  # First 200 chars for preview
-                    "metadata": doc.metadata,
-                    "collection": collection_name
-                } for doc in docs]
-                
-                all_results.extend(collection_results)
-            finally:
-                ChromaDB.close_collection(collection_name)
+        # Search all collections concurrently and merge into a global top-k
+        chunks = await asyncio.to_thread(
+            RetrievalService.search,
+            query,
+            collection_list,
+            k=4,
+            metadata_filters=metadata_filters,
+            mode=mode
+        )
+        all_results = [{
+            "content": chunk.document.page_content[:200] + "...",  # First 200 chars for preview
+            "metadata": chunk.document.metadata,
+            "collection": chunk.collection,
+            "score": chunk.score
+        } for chunk in chunks]
 
         return JSONResponse({
             "query": query,
@@ -580,3 +706,20 @@ async def test_metadata_search(
             status_code=500,
             content={"error": f"Error in metadata search: {str(e)}"}
         )
+
+
+#######################################################
+# 7. cache statistics
+#######################################################
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and disk usage of the server-side caches."""
+    return JSONResponse({
+        "conversion": conversion_cache.stats(),
+        "conversion_pool": conversion_pool.stats(),
+        "embedding": embedding_cache.stats(),
+        "retrieval": retrieval_cache.stats(),
+        "collection_pool": ChromaDB.pool_stats(),
+        "shared_chunks": shared_store_stats()
+    })
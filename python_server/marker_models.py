@@ -0,0 +1,175 @@
+"""
+Lazy loading and sharing of the marker models used for precise PDF conversion.
+
+The models are only loaded on the first precise-mode request (or by an explicit warmup),
+so importing the server doesn't pay for them. To share a single loaded model set between
+several uvicorn workers / conversion processes, run this module as a model server:
+
+    python marker_models.py
+
+and set MARKER_SERVER_ADDRESS (e.g. "127.0.0.1:8765") for the API server. Conversion
+requests are then sent to the model server instead of loading marker in every process.
+MARKER_SERVER_AUTHKEY must be set to the same secret for both: requests are pickled, so
+anyone able to connect could otherwise run code in the model server.
+"""
+
+import os
+import re
+import threading
+from multiprocessing.connection import Client, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+PAGE_SEPARATOR = re.compile(r"\n*\{(\d+)\}-{48}\n*")
+
+_artifact_dict = None
+_pdf_converter = None
+# Reentrant: get_pdf_converter() loads the models while holding it
+_converter_lock = threading.RLock()
+
+
+def get_artifact_dict() -> Dict[str, Any]:
+    """Return the process-wide marker model dict, loading the models on first use."""
+    global _artifact_dict
+    if _artifact_dict is None:
+        with _converter_lock:
+            if _artifact_dict is None:
+                from marker.models import create_model_dict
+
+                print("Loading marker models...")
+                _artifact_dict = create_model_dict()
+    return _artifact_dict
+
+
+def get_pdf_converter(page_range: Optional[List[int]] = None):
+    """
+    Return a marker PdfConverter backed by the shared models.
+
+    Args:
+        page_range: 0-based page indices to convert; the whole document if None.
+            Converters for a page range are cheap to build since they reuse the models.
+    """
+    global _pdf_converter
+    from marker.converters.pdf import PdfConverter
+
+    if page_range is not None:
+        return PdfConverter(
+            artifact_dict=get_artifact_dict(),
+            config={"page_range": page_range, "paginate_output": True},
+        )
+    if _pdf_converter is None:
+        with _converter_lock:
+            if _pdf_converter is None:
+                _pdf_converter = PdfConverter(
+                    artifact_dict=get_artifact_dict(),
+                )
+    return _pdf_converter
+
+
+def is_loaded() -> bool:
+    return _artifact_dict is not None
+
+
+def _server_address() -> Optional[Tuple[str, int]]:
+    address = os.getenv("MARKER_SERVER_ADDRESS")
+    if not address:
+        return None
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def _authkey() -> bytes:
+    authkey = os.getenv("MARKER_SERVER_AUTHKEY")
+    if not authkey:
+        raise RuntimeError("MARKER_SERVER_AUTHKEY must be set to use the marker model server")
+    return authkey.encode("utf-8")
+
+
+def _check_pdf_path(file_path: Any) -> str:
+    """Only convert existing regular files that are PDFs."""
+    if not isinstance(file_path, str) or not os.path.isabs(file_path) or not os.path.isfile(file_path):
+        raise ValueError("file_path must be the absolute path of an existing file")
+    with open(file_path, "rb") as f:
+        if f.read(5) != b"%PDF-":
+            raise ValueError("file_path is not a PDF")
+    return file_path
+
+
+def convert_pdf_local(file_path: str, page_range: Optional[List[int]] = None) -> Tuple[str, Dict[str, Any]]:
+    """Convert a PDF with the models loaded in this process."""
+    from marker.output import text_from_rendered
+
+    rendered = get_pdf_converter(page_range)(file_path)
+    text, _, images = text_from_rendered(rendered)
+    return text, images
+
+
+def convert_pdf(file_path: str, page_range: Optional[List[int]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Convert a PDF to markdown, using the shared model server if one is configured.
+
+    Args:
+        file_path: Path to PDF file
+        page_range: 0-based page indices to convert; the whole document if None.
+            The output then carries marker's page separators, see split_paginated().
+
+    Returns:
+        Tuple containing the markdown text and the extracted images
+    """
+    address = _server_address()
+    if address is None:
+        return convert_pdf_local(file_path, page_range)
+
+    with Client(address, authkey=_authkey()) as conn:
+        conn.send({"file_path": os.path.abspath(file_path), "page_range": page_range})
+        response = conn.recv()
+    if "error" in response:
+        raise RuntimeError(f"Marker server error: {response['error']}")
+    return response["text"], response["images"]
+
+
+def split_paginated(text: str) -> Dict[int, str]:
+    """
+    Split paginated marker output into {page index: markdown}.
+    marker separates pages with a line of the form "{page_id}" followed by 48 dashes.
+    """
+    pages: Dict[int, str] = {}
+    parts = PAGE_SEPARATOR.split(text)
+    # parts = [text before first separator, page_id, page text, page_id, page text, ...]
+    for i in range(1, len(parts) - 1, 2):
+        pages[int(parts[i])] = parts[i + 1].strip()
+    return pages
+
+
+def _handle_connection(conn, convert_lock: threading.Lock) -> None:
+    with conn:
+        try:
+            request = conn.recv()
+            file_path = _check_pdf_path(request.get("file_path"))
+            # marker models are not safe to call concurrently
+            with convert_lock:
+                text, images = convert_pdf_local(file_path, request.get("page_range"))
+            conn.send({"text": text, "images": images})
+        except EOFError:
+            pass
+        except Exception as e:
+            conn.send({"error": str(e)})
+
+
+def serve(address: Tuple[str, int]) -> None:
+    """Load the models once and serve conversion requests from other processes."""
+    authkey = _authkey()
+    get_pdf_converter()
+    convert_lock = threading.Lock()
+    with Listener(address, authkey=authkey) as listener:
+        print(f"Marker model server listening on {address[0]}:{address[1]}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(
+                target=_handle_connection,
+                args=(conn, convert_lock),
+                daemon=True
+            ).start()
+
+
+if __name__ == "__main__":
+    serve(_server_address() or ("127.0.0.1", 8765))
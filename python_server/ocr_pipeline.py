@@ -0,0 +1,117 @@
+"""
+Local OCR for image uploads.
+
+Text-heavy images (scanned notes, screenshots of slides) are read with Tesseract locally
+instead of sending every image to a remote vision model. Only images whose OCR confidence
+is below OCR_MIN_CONFIDENCE are escalated to remote captioning, and only when
+OCR_REMOTE_ESCALATION is enabled.
+
+Tesseract and its language data are system packages, so local OCR is only used when
+ocr_languages() finds the binary and at least one of the OCR_LANG languages; otherwise
+images go through the markitdown converter as before.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() == "true"
+OCR_LANG = os.getenv("OCR_LANG", "eng+chi_tra")
+OCR_MIN_CONFIDENCE = float(os.getenv("OCR_MIN_CONFIDENCE", "60"))
+OCR_REMOTE_ESCALATION = os.getenv("OCR_REMOTE_ESCALATION", "false").lower() == "true"
+OCR_THREADS = int(os.getenv("OCR_THREADS", "4"))
+
+
+@dataclass
+class OcrResult:
+    text: str
+    confidence: float  # mean word confidence, 0-100
+
+
+@lru_cache(maxsize=None)
+def ocr_languages() -> str:
+    """
+    The OCR_LANG languages installed for Tesseract, joined by "+", or "" if local OCR
+    can't run (disabled, pytesseract or the tesseract binary missing, no language data).
+    Checked once per process.
+    """
+    if not OCR_ENABLED:
+        return ""
+    try:
+        import pytesseract
+
+        installed = set(pytesseract.get_languages(config=""))
+    except Exception as e:
+        print(f"Local OCR unavailable ({e}), images will be converted with markitdown")
+        return ""
+    wanted = [lang for lang in OCR_LANG.split("+") if lang]
+    languages = [lang for lang in wanted if lang in installed]
+    missing = [lang for lang in wanted if lang not in installed]
+    if missing:
+        print(f"Tesseract language data missing for {', '.join(missing)}")
+    if not languages:
+        print("Local OCR unavailable (no OCR_LANG language installed), images will be converted with markitdown")
+    return "+".join(languages)
+
+
+def ocr_available() -> bool:
+    return bool(ocr_languages())
+
+
+def ocr_image(file_path: str) -> OcrResult:
+    """Run Tesseract on one image and rebuild its text line by line."""
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        data = pytesseract.image_to_data(image, lang=ocr_languages(), output_type=pytesseract.Output.DICT)
+
+    lines = {}
+    total_conf = 0.0
+    total_chars = 0
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        word = word.strip()
+        if conf < 0 or not word:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        # weight by length so stray one-letter noise doesn't dominate
+        total_conf += conf * len(word)
+        total_chars += len(word)
+
+    text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+    return OcrResult(text=text, confidence=total_conf / total_chars if total_chars else 0.0)
+
+
+def ocr_images(
+    file_paths: List[str],
+    escalate: Optional[Callable[[str], str]] = None
+) -> List[str]:
+    """
+    OCR a batch of images concurrently (Tesseract runs as a subprocess per image).
+
+    Args:
+        file_paths: Images to read
+        escalate: Remote captioning function used for low-confidence images when
+            OCR_REMOTE_ESCALATION is enabled
+
+    Returns:
+        markdown text for each image, in input order
+    """
+    with ThreadPoolExecutor(max_workers=OCR_THREADS) as executor:
+        results = list(executor.map(ocr_image, file_paths))
+
+    texts = []
+    for file_path, result in zip(file_paths, results):
+        if escalate and OCR_REMOTE_ESCALATION and result.confidence < OCR_MIN_CONFIDENCE:
+            print(f"OCR confidence {result.confidence:.0f} for {file_path}, escalating to remote captioning")
+            caption = escalate(file_path)
+            texts.append(f"{caption}\n\n{result.text}".strip())
+        else:
+            texts.append(result.text)
+    return texts
@@ -0,0 +1,122 @@
+"""
+Hybrid PDF conversion: PyMuPDF text extraction for plain pages, marker only where needed.
+
+Most lecture slides are plain text, which PyMuPDF extracts orders of magnitude faster
+than marker. Pages that look like they contain equations, tables or images (or have no
+text layer at all) are escalated to marker, and the results are merged in page order.
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+import fitz
+
+import marker_models
+
+# Fonts used by LaTeX / Office equation editors. Not "Symbol": PowerPoint and Word use
+# it (e.g. SymbolMT) for bullets, and its Greek / operator glyphs already show up in the
+# text layer for MATH_CHAR_PATTERN
+MATH_FONT_PATTERN = re.compile(r"CMMI|CMSY|CMEX|MSAM|MSBM|Math|STIX|Euclid", re.IGNORECASE)
+# Math operators, Greek letters, arrows and sub/superscripts in the text layer
+MATH_CHAR_PATTERN = re.compile(r"[∀-⋿Α-ω←-⇿⁰-₟√∫]")
+
+MIN_TEXT_CHARS = 20
+MIN_MATH_CHARS = 3
+# A page is escalated for an image only if the image covers this fraction of the page and
+# the text layer holds little besides it (a scanned page or a screenshot of code, formulas
+# or a diagram with labels, which marker OCRs). Slides with a picture next to their bullet
+# points keep the PyMuPDF text, as the image itself is dropped from the markdown anyway
+MIN_IMAGE_AREA_RATIO = 0.3
+MAX_IMAGE_PAGE_TEXT_CHARS = 200
+# find_tables() is slow, so it only runs on pages with this many rows of text split into
+# several columns by gaps wider than TABLE_COLUMN_GAP points
+MIN_TABLE_ROWS = 3
+TABLE_COLUMN_GAP = 15
+
+
+@dataclass
+class PageAnalysis:
+    index: int
+    text: str
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def needs_precise(self) -> bool:
+        return bool(self.reasons)
+
+
+def analyze_page(page: "fitz.Page") -> PageAnalysis:
+    """Extract a page's text and decide whether it has content PyMuPDF can't render as markdown."""
+    text = page.get_text("text").strip()
+    analysis = PageAnalysis(index=page.number, text=text)
+
+    if len(text) < MIN_TEXT_CHARS:
+        analysis.reasons.append("no_text_layer")
+
+    if len(MATH_CHAR_PATTERN.findall(text)) >= MIN_MATH_CHARS or any(
+        MATH_FONT_PATTERN.search(font[3]) for font in page.get_fonts()
+    ):
+        analysis.reasons.append("equation")
+
+    page_area = abs(page.rect) or 1
+    if len(text) <= MAX_IMAGE_PAGE_TEXT_CHARS:
+        for image in page.get_image_info():
+            x0, y0, x1, y1 = image["bbox"]
+            if (x1 - x0) * (y1 - y0) / page_area >= MIN_IMAGE_AREA_RATIO:
+                analysis.reasons.append("image")
+                break
+
+    try:
+        if _looks_tabular(page) and page.find_tables().tables:
+            analysis.reasons.append("table")
+    except AttributeError:
+        # find_tables needs PyMuPDF >= 1.23
+        pass
+
+    return analysis
+
+
+def _looks_tabular(page: "fitz.Page") -> bool:
+    """Whether enough rows of words are split into columns to be worth a find_tables()."""
+    rows = {}
+    for x0, _, x1, y1, *_ in page.get_text("words"):
+        # Words of one row share their baseline, even across text blocks
+        rows.setdefault(round(y1 / 2), []).append((x0, x1))
+    column_rows = 0
+    for words in rows.values():
+        words.sort()
+        if any(start - end > TABLE_COLUMN_GAP for (_, end), (start, _) in zip(words, words[1:])):
+            column_rows += 1
+            if column_rows >= MIN_TABLE_ROWS:
+                return True
+    return False
+
+
+def analyze_pdf(file_path: str) -> List[PageAnalysis]:
+    with fitz.open(file_path) as doc:
+        return [analyze_page(page) for page in doc]
+
+
+def convert_pdf_hybrid(file_path: str) -> str:
+    """
+    Convert a PDF with PyMuPDF, escalating only the pages that need it to marker.
+
+    Returns:
+        markdown text with pages in document order
+    """
+    pages = analyze_pdf(file_path)
+    precise_pages = [page.index for page in pages if page.needs_precise]
+    print(f"Hybrid PDF conversion: {len(precise_pages)}/{len(pages)} pages escalated to marker")
+
+    markdown_pages = {page.index: page.text for page in pages}
+    if precise_pages:
+        text, _ = marker_models.convert_pdf(file_path, page_range=precise_pages)
+        # Keep the PyMuPDF text for any escalated page marker returned nothing for
+        for index, page_text in marker_models.split_paginated(text).items():
+            if page_text:
+                markdown_pages[index] = page_text
+
+    return "\n\n".join(
+        markdown_pages[index] for index in sorted(markdown_pages) if markdown_pages[index]
+    )
@@ -1,12 +1,11 @@
 import json
 import os
 import re
-import tempfile
 from textwrap import dedent
 from langchain_community.document_loaders import PyPDFLoader
 import random
 from langchain.chains import RetrievalQA
-from database import ChromaDB
+from retrieval import RetrievalService
 from openai import AzureOpenAI
 from langchain_openai import AzureChatOpenAI
 from document_manager import DocumentManager
@@ -20,27 +19,8 @@ async def process_files_content(files, file_type, use_precise_pdf=False):
         file_type: Type of files
         use_precise_pdf: Whether to use precise mode for PDFs
     """
-    all_content = []
-    
-    for file in files:
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file.filename.lower()) as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-                temp_file.flush()
-                
-                # Process the content using DocumentManager
-                file_content = await DocumentManager.process_content(
-                    temp_file.name,
-                    os.path.splitext(file.filename.lower())[1],
-                    use_precise_pdf
-                )
-                all_content.append(file_content)
-                
-                os.unlink(temp_file.name)
-        except Exception as e:
-            print(f"Error processing file {file.filename}: {str(e)}")
-            continue
+    # DocumentManager spools the uploads and batches image OCR
+    all_content = await DocumentManager.process_files(files, use_precise_pdf)
     
     return "\n\n".join(all_content)
 
@@ -62,17 +42,13 @@ def get_system_prompt(user_content, difficulty, llm, prompt, language="English",
     
     # If collections specified, get context from vector DB
     if collections:
-        for collection_name in collections:
-            try:
-                db_instance = ChromaDB.get_collection(collection_name)
-                docs = db_instance.similarity_search(
-                    user_content,
-                    k=4,
-                    metadata_filters=metadata_filters
-                )
-                all_documents.extend(docs)
-            finally:
-                ChromaDB.close_collection(collection_name)
+        # Search all collections at once and keep the global top-k
+        chunks = RetrievalService.search(
+            user_content,
+            collections,
+            metadata_filters=metadata_filters
+        )
+        all_documents = [chunk.document for chunk in chunks]
         
         # Combine vector DB results
         context = "\n\n".join(doc.page_content for doc in all_documents)
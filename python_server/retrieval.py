@@ -0,0 +1,183 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain.schema import Document
+from database import ChromaDB
+
+# Number of chunks retrieved across all collections, and collections searched in parallel
+DEFAULT_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+SEARCH_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", "8"))
+# "vector" is embeddings only, "hybrid" fuses BM25 over the lexical index with the vector
+# search, "mmr" picks diverse chunks and skips near duplicates
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+
+
+@dataclass
+class RetrievedChunk:
+    document: Document
+    score: float  # distance (vector) or 1 - fused score (hybrid), lower is closer
+    collection: str
+
+
+class RetrievalService:
+    """
+    Search several collections for one query.
+
+    The query is embedded once, every collection is searched concurrently with that
+    embedding, and the hits are merged by score into a single global top-k. In hybrid
+    and mmr mode the collections return their unranked candidates instead, which are
+    fused or selected from together, since scores normalized within one collection can't
+    be compared and duplicates across collections must be seen to be skipped.
+    Per-collection results come from the retrieval cache when the collection is unchanged.
+    """
+
+    @staticmethod
+    def search(
+        query: str,
+        collections: List[str],
+        k: int = DEFAULT_TOP_K,
+        metadata_filters: Optional[dict] = None,
+        mode: Optional[str] = None
+    ) -> List[RetrievedChunk]:
+        """
+        Args:
+            query: Search query
+            collections: Names of the collections to search
+            k: Number of chunks to return in total
+            metadata_filters: Dict of metadata filters, see ChromaDB.similarity_search
+            mode: "vector", "hybrid" or "mmr", defaults to RETRIEVAL_MODE
+
+        Returns:
+            Up to k chunks from all collections, closest first. The collection name is also
+            set in each document's metadata.
+        """
+        if not collections or not query:
+            return []
+        mode = mode or RETRIEVAL_MODE
+
+        # Embedded at most once per embedding backend, and only if some collection of that
+        # backend misses the retrieval cache
+        query_embeddings: Dict[str, List[float]] = {}
+        embedding_lock = threading.Lock()
+
+        def embed_query(db_instance: ChromaDB) -> List[float]:
+            with embedding_lock:
+                if db_instance.embedding_backend not in query_embeddings:
+                    query_embeddings[db_instance.embedding_backend] = db_instance.embed_model.embed_query(query)
+            return query_embeddings[db_instance.embedding_backend]
+
+        def search_collection(collection_name: str) -> Tuple[str, List[tuple]]:
+            db_instance = ChromaDB.get_collection(collection_name)
+            try:
+                if mode in ("hybrid", "mmr"):
+                    results = db_instance.search_candidates(
+                        query, k, metadata_filters, embed_query=lambda: embed_query(db_instance), mode=mode
+                    )
+                else:
+                    # Each collection contributes at most k chunks to the global top-k
+                    results = db_instance.similarity_search_with_scores(
+                        query, k, metadata_filters, embed_query=lambda: embed_query(db_instance), mode=mode
+                    )
+            finally:
+                ChromaDB.close_collection(collection_name)
+            for doc, *_ in results:
+                doc.metadata["collection"] = collection_name
+            return db_instance.embedding_backend, results
+
+        names = list(dict.fromkeys(collections))
+        with ThreadPoolExecutor(max_workers=min(SEARCH_CONCURRENCY, len(names))) as executor:
+            per_collection = list(executor.map(search_collection, names))
+
+        if mode == "hybrid":
+            return RetrievalService._fuse_hybrid(names, per_collection, k)
+        if mode == "mmr":
+            def backend_query_embedding(backend: str) -> List[float]:
+                # Every collection of the backend may have hit the retrieval cache
+                if backend not in query_embeddings:
+                    name = next(name for name, (owner, _) in zip(names, per_collection) if owner == backend)
+                    return embed_query(ChromaDB.get_collection(name))
+                return query_embeddings[backend]
+
+            return RetrievalService._select_mmr(names, per_collection, k, backend_query_embedding)
+
+        merged = [
+            RetrievedChunk(doc, score, collection_name)
+            for collection_name, (_, results) in zip(names, per_collection)
+            for doc, score in results
+        ]
+        merged.sort(key=lambda chunk: chunk.score)
+        return merged[:k]
+
+    @staticmethod
+    def _select_mmr(
+        collections: List[str],
+        per_collection: List[Tuple[str, List[tuple]]],
+        k: int,
+        query_embedding: Callable[[str], List[float]]
+    ) -> List[RetrievedChunk]:
+        """
+        Select k chunks by max marginal relevance over the candidates of all the
+        collections at once, see ChromaDB._mmr_select, so near duplicates are skipped
+        across collections too. Embeddings of different backends can't be compared: each
+        backend's candidates are selected from separately, and the selections interleaved
+        by rank, dropping chunks whose text was already picked.
+
+        Returns:
+            Up to k chunks in selection order, with their distances as scores
+        """
+        groups: Dict[str, List[Tuple[tuple, str]]] = {}
+        for collection_name, (backend, results) in zip(collections, per_collection):
+            groups.setdefault(backend, []).extend((candidate, collection_name) for candidate in results)
+
+        selections = []
+        for backend, candidates in groups.items():
+            if not candidates:
+                continue
+            selected = ChromaDB._mmr_select(
+                query_embedding(backend), [embedding for (_, _, embedding), _ in candidates], k
+            )
+            selections.append([candidates[i] for i in selected])
+
+        chunks, texts = [], set()
+        for rank in range(k):
+            for selection in selections:
+                if rank >= len(selection):
+                    continue
+                (doc, distance, _), collection_name = selection[rank]
+                if doc.page_content not in texts:
+                    texts.add(doc.page_content)
+                    chunks.append(RetrievedChunk(doc, distance, collection_name))
+        return chunks[:k]
+
+    @staticmethod
+    def _fuse_hybrid(
+        collections: List[str],
+        per_collection: List[Tuple[str, List[tuple]]],
+        k: int
+    ) -> List[RetrievedChunk]:
+        """
+        Fuse the hybrid candidates of all the collections into one top-k, see
+        ChromaDB.fuse_hybrid. Distances of different embedding backends aren't on the same
+        scale, so with several backends they are first min-max normalized per backend.
+        """
+        candidates, owners = [], []
+        for collection_name, (backend, results) in zip(collections, per_collection):
+            for candidate in results:
+                candidates.append(candidate)
+                owners.append((collection_name, backend))
+
+        backends = {backend for _, backend in owners}
+        if len(backends) > 1:
+            for backend in backends:
+                indexes = [i for i, (_, owner) in enumerate(owners) if owner == backend]
+                normalized = ChromaDB._min_max({i: candidates[i][1] for i in indexes})
+                for i in indexes:
+                    doc, _, bm25 = candidates[i]
+                    candidates[i] = (doc, normalized[i], bm25)
+
+        return [
+            RetrievedChunk(candidates[i][0], score, owners[i][0])
+            for i, score in ChromaDB.fuse_hybrid(candidates, k)
+        ]
@@ -0,0 +1,78 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from langchain.schema import Document
+
+
+class RetrievalCache:
+    """
+    In-memory LRU cache of similarity search results.
+
+    Keys are (collection, collection version, query hash, filters, k, mode). The version is
+    bumped on every write to the collection, so entries for an older version are never
+    read again and simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # (document, score) results, or (document, scores...) search candidates
+        self._entries: "OrderedDict[tuple, List[tuple]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        collection: str,
+        version: int,
+        query: str,
+        metadata_filters: Optional[dict],
+        k: int,
+        mode: str = "vector"
+    ) -> tuple:
+        query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+        filters = json.dumps(metadata_filters or {}, sort_keys=True)
+        return (collection, version, query_hash, filters, k, mode)
+
+    @staticmethod
+    def _copy(results: List[tuple]) -> List[tuple]:
+        # callers annotate document metadata, so never hand out the cached objects
+        return [
+            (Document(page_content=doc.page_content, metadata=dict(doc.metadata)), *scores)
+            for doc, *scores in results
+        ]
+
+    def get(self, key: tuple) -> Optional[List[tuple]]:
+        with self._lock:
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self._copy(results)
+
+    def put(self, key: tuple, results: List[tuple]) -> None:
+        with self._lock:
+            self._entries[key] = self._copy(results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries
+        }
+
+
+retrieval_cache = RetrievalCache(
+    max_entries=int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+)
@@ -0,0 +1,364 @@
+"""
+Content-addressed chunk store shared by the personal (user_*) collections.
+
+Many students upload the same lecture files to their personal collections. Instead of
+storing and embedding a copy of every chunk per user, each distinct chunk text is stored
+once in a shared Chroma collection under its SHA-256, and a personal collection only
+keeps references (ref id -> chunk hash and the store holding it, plus the user-specific
+metadata) in the collection index database. There is one store per embedding backend; a
+shared chunk is deleted when the last reference into its store goes.
+
+ReferenceCollection exposes the subset of the Chroma collection API that ChromaDB uses
+(add, get, delete, query, count, metadata), so the rest of the server is unchanged.
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from collection_index import connect
+from embedding_cache import text_hash
+
+# Above this many candidate chunks the shared index is searched without an id filter
+# and the hits outside the collection are dropped
+MAX_FILTER_CHUNKS = 5000
+# Most shared chunks one unfiltered search may return; when that is not enough the
+# candidates are searched MAX_FILTER_CHUNKS at a time instead
+MAX_SCAN_CHUNKS = 20000
+
+FIELD_NAME = re.compile(r"^\w+$")
+OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def _where_sql(where: dict) -> Tuple[str, list]:
+    """Translate a Chroma where clause into SQL over the JSON metadata of the references."""
+    if "$and" in where or "$or" in where:
+        operator = "$and" if "$and" in where else "$or"
+        parts = [_where_sql(clause) for clause in where[operator]]
+        joiner = " AND " if operator == "$and" else " OR "
+        return "(" + joiner.join(sql for sql, _ in parts) + ")", [p for _, params in parts for p in params]
+
+    clauses, params = [], []
+    for field, condition in where.items():
+        if not FIELD_NAME.match(field):
+            raise ValueError(f"Invalid metadata field: {field}")
+        column = f"json_extract(metadata, '$.{field}')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in ("$in", "$nin"):
+                if not value:
+                    clauses.append("0" if operator == "$in" else "1")
+                    continue
+                negate = "NOT " if operator == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({','.join('?' * len(value))})")
+                params.extend(value)
+            elif operator in OPERATORS:
+                clauses.append(f"{column} {OPERATORS[operator]} ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return "(" + " AND ".join(clauses or ["1"]) + ")", params
+
+
+def _create_tables(persist_directory: str) -> None:
+    with connect(persist_directory) as conn:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunk_refs (
+                collection TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                store TEXT,
+                PRIMARY KEY (collection, ref_id)
+            );
+            CREATE INDEX IF NOT EXISTS chunk_refs_by_hash ON chunk_refs (chunk_hash);
+        """)
+        # References created before the store was recorded get it when their collection
+        # is opened, see ReferenceCollection
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(chunk_refs)")}
+        if "store" not in columns:
+            conn.execute("ALTER TABLE chunk_refs ADD COLUMN store TEXT")
+
+
+class ReferenceCollection:
+    """
+    A personal collection made of references into the shared chunk store, see the
+    module docstring.
+    """
+
+    def __init__(self, name: str, shared_collection: Any, persist_directory: str = "./chroma_db"):
+        self.name = name
+        self.shared = shared_collection
+        self.persist_directory = persist_directory
+        _create_tables(persist_directory)
+        # A collection's references all point into the store of its embedding backend
+        with connect(persist_directory) as conn:
+            conn.execute(
+                "UPDATE chunk_refs SET store = ? WHERE collection = ? AND store IS NULL",
+                (self.shared.name, name)
+            )
+
+    @property
+    def metadata(self) -> Optional[dict]:
+        return self.shared.metadata
+
+    def _select(
+        self,
+        conn,
+        columns: str,
+        ids: Optional[List[str]] = None,
+        where: Optional[dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        hashes: Optional[List[str]] = None,
+        order: str = "rowid"
+    ) -> list:
+        query = f"SELECT {columns} FROM chunk_refs WHERE collection = ?"
+        params: list = [self.name]
+        for column, values in (("ref_id", ids), ("chunk_hash", hashes)):
+            if values is None:
+                continue
+            if not values:
+                return []
+            query += f" AND {column} IN ({','.join('?' * len(values))})"
+            params.extend(values)
+        if where:
+            sql, where_params = _where_sql(where)
+            query += f" AND {sql}"
+            params.extend(where_params)
+        query += f" ORDER BY {order}"
+        if limit is not None:
+            query += " LIMIT ? OFFSET ?"
+            params += [limit, offset or 0]
+        return conn.execute(query, params).fetchall()
+
+    def _fetch_shared(self, hashes: List[str], include: List[str]) -> Dict[str, Dict[str, Any]]:
+        """{hash: {"documents": ..., "embeddings": ...}} for the requested fields."""
+        fields = [field for field in include if field in ("documents", "embeddings")]
+        if not fields or not hashes:
+            return {}
+        found = {}
+        for start in range(0, len(hashes), 1000):
+            batch = self.shared.get(ids=hashes[start:start + 1000], include=fields)
+            for i, chunk_hash in enumerate(batch["ids"]):
+                found[chunk_hash] = {field: batch[field][i] for field in fields}
+        return found
+
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[dict],
+        documents: List[str]
+    ) -> None:
+        """Reference the chunks, storing the ones not in the shared store yet."""
+        hashes = [text_hash(document) for document in documents]
+        with connect(self.persist_directory) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_refs (collection, ref_id, chunk_hash, metadata, store) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (self.name, ref_id, chunk_hash, json.dumps(metadata or {}), self.shared.name)
+                    for ref_id, chunk_hash, metadata in zip(ids, hashes, metadatas)
+                ]
+            )
+
+        new_chunks = {}
+        for chunk_hash, embedding, document in zip(hashes, embeddings, documents):
+            new_chunks.setdefault(chunk_hash, (embedding, document))
+        existing = set(self.shared.get(ids=list(new_chunks), include=[])["ids"])
+        missing = [chunk_hash for chunk_hash in new_chunks if chunk_hash not in existing]
+        print(f"Shared chunk store: {len(ids) - len(missing)}/{len(ids)} chunks already stored")
+        if missing:
+            self.shared.add(
+                ids=missing,
+                embeddings=[new_chunks[chunk_hash][0] for chunk_hash in missing],
+                metadatas=[{"chunk_hash": chunk_hash} for chunk_hash in missing],
+                documents=[new_chunks[chunk_hash][1] for chunk_hash in missing]
+            )
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[dict] = None,
+        include: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None
+    ) -> Dict[str, Any]:
+        include = ["metadatas", "documents"] if include is None else include
+        with connect(self.persist_directory) as conn:
+            rows = self._select(conn, "ref_id, chunk_hash, metadata", ids, where, limit, offset)
+        shared = self._fetch_shared(list({row["chunk_hash"] for row in rows}), include)
+
+        result: Dict[str, Any] = {"ids": [row["ref_id"] for row in rows]}
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row["metadata"]) for row in rows]
+        for field in ("documents", "embeddings"):
+            if field in include:
+                result[field] = [shared.get(row["chunk_hash"], {}).get(field) for row in rows]
+        return result
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None) -> None:
+        """Drop references, and the shared chunks no collection references in this store anymore."""
+        with connect(self.persist_directory) as conn:
+            rows = self._select(conn, "ref_id, chunk_hash", ids, where)
+            if not rows:
+                return
+            ref_ids = [row["ref_id"] for row in rows]
+            for start in range(0, len(ref_ids), 500):
+                batch = ref_ids[start:start + 500]
+                conn.execute(
+                    f"DELETE FROM chunk_refs WHERE collection = ? AND ref_id IN ({','.join('?' * len(batch))})",
+                    [self.name, *batch]
+                )
+            hashes = list({row["chunk_hash"] for row in rows})
+            referenced = set()
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                # References whose store isn't recorded yet may point into this one
+                referenced.update(row["chunk_hash"] for row in conn.execute(
+                    f"SELECT DISTINCT chunk_hash FROM chunk_refs WHERE (store = ? OR store IS NULL) "
+                    f"AND chunk_hash IN ({','.join('?' * len(batch))})",
+                    [self.shared.name, *batch]
+                ))
+        orphans = [chunk_hash for chunk_hash in hashes if chunk_hash not in referenced]
+        for start in range(0, len(orphans), 5000):
+            self.shared.delete(ids=orphans[start:start + 5000])
+
+    def count(self) -> int:
+        with connect(self.persist_directory) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM chunk_refs WHERE collection = ?", (self.name,)
+            ).fetchone()[0]
+
+    def query(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 10,
+        where: Optional[dict] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Nearest referenced chunks; results shaped like Chroma's, for one query embedding."""
+        with connect(self.persist_directory) as conn:
+            candidates = self._select(conn, "COUNT(DISTINCT chunk_hash)", where=where)[0][0]
+        n_results = min(n_results, candidates)
+        if not n_results:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+        # Only ids and distances come back from the shared store; the documents are
+        # fetched for the final hits
+        if candidates <= MAX_FILTER_CHUNKS:
+            hits = self._query_batches(query_embeddings, n_results, where)
+        else:
+            hits = self._query_unfiltered(query_embeddings, n_results, where)
+
+        with connect(self.persist_directory) as conn:
+            refs = self._first_refs(conn, [chunk_hash for chunk_hash, _ in hits], where)
+        hits = [(chunk_hash, distance) for chunk_hash, distance in hits if chunk_hash in refs]
+        ref_ids = [refs[chunk_hash] for chunk_hash, _ in hits]
+        documents = self._fetch_shared([chunk_hash for chunk_hash, _ in hits], ["documents"])
+        with connect(self.persist_directory) as conn:
+            metadatas = {
+                row["ref_id"]: json.loads(row["metadata"])
+                for row in self._select(conn, "ref_id, metadata", ids=ref_ids)
+            }
+        return {
+            "ids": [ref_ids],
+            "documents": [[documents.get(chunk_hash, {}).get("documents") for chunk_hash, _ in hits]],
+            "metadatas": [[metadatas.get(ref_id, {}) for ref_id in ref_ids]],
+            "distances": [[distance for _, distance in hits]]
+        }
+
+    def _first_refs(self, conn, hashes: List[str], where: Optional[dict]) -> Dict[str, str]:
+        """{hash: first reference to it} for the hashes this collection references."""
+        refs: Dict[str, str] = {}
+        for start in range(0, len(hashes), 500):
+            for row in self._select(conn, "ref_id, chunk_hash", where=where, hashes=hashes[start:start + 500]):
+                refs.setdefault(row["chunk_hash"], row["ref_id"])
+        return refs
+
+    def _query_batches(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[dict]
+    ) -> List[Tuple[str, float]]:
+        """Search the referenced chunks MAX_FILTER_CHUNKS at a time with an id filter."""
+        hits = []
+        offset = 0
+        while True:
+            with connect(self.persist_directory) as conn:
+                hashes = [
+                    row[0] for row in
+                    self._select(
+                        conn, "DISTINCT chunk_hash", where=where,
+                        limit=MAX_FILTER_CHUNKS, offset=offset, order="chunk_hash"
+                    )
+                ]
+            if not hashes:
+                break
+            results = self.shared.query(
+                query_embeddings=query_embeddings,
+                n_results=min(n_results, len(hashes)),
+                where={"chunk_hash": {"$in": hashes}},
+                include=["distances"]
+            )
+            hits = sorted(
+                hits + list(zip(results["ids"][0], results["distances"][0])),
+                key=lambda hit: hit[1]
+            )[:n_results]
+            offset += MAX_FILTER_CHUNKS
+        return hits
+
+    def _query_unfiltered(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int,
+        where: Optional[dict]
+    ) -> List[Tuple[str, float]]:
+        """
+        Search more and more of the shared index until enough hits are ours, up to
+        MAX_SCAN_CHUNKS, then fall back to searching the candidates in batches.
+        """
+        total = self.shared.count()
+        fetch = n_results * 4
+        while True:
+            results = self.shared.query(
+                query_embeddings=query_embeddings,
+                n_results=min(fetch, total, MAX_SCAN_CHUNKS),
+                include=["distances"]
+            )
+            with connect(self.persist_directory) as conn:
+                refs = self._first_refs(conn, results["ids"][0], where)
+            hits = [
+                hit for hit in zip(results["ids"][0], results["distances"][0])
+                if hit[0] in refs
+            ][:n_results]
+            if len(hits) >= n_results or fetch >= total:
+                return hits
+            if fetch >= MAX_SCAN_CHUNKS:
+                return self._query_batches(query_embeddings, n_results, where)
+            fetch *= 4
+
+
+def reference_count(collection: str, persist_directory: str = "./chroma_db") -> int:
+    """Number of references a personal collection has, without opening the shared store."""
+    _create_tables(persist_directory)
+    with connect(persist_directory) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM chunk_refs WHERE collection = ?", (collection,)
+        ).fetchone()[0]
+
+
+def shared_store_stats(persist_directory: str = "./chroma_db") -> Dict[str, Any]:
+    """References, distinct shared chunks and the resulting deduplication factor."""
+    _create_tables(persist_directory)
+    with connect(persist_directory) as conn:
+        references, chunks = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT COALESCE(store, '') || ':' || chunk_hash) FROM chunk_refs"
+        ).fetchone()
+    return {
+        "references": references,
+        "shared_chunks": chunks,
+        "dedup_factor": references / chunks if chunks else 0.0
+    }
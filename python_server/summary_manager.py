@@ -1,9 +1,10 @@
+import asyncio
 from typing import List, Any
 from fastapi import UploadFile
 from fastapi.responses import JSONResponse
 from langchain.prompts import PromptTemplate
 from document_manager import DocumentManager
-from database import ChromaDB
+from retrieval import RetrievalService
 
 class SummaryManager:
     @staticmethod
@@ -103,20 +104,14 @@ class SummaryManager:
     ) -> JSONResponse:
         """Generate summary using collections and vector DB with metadata filtering."""
         try:
-            all_documents = []
-            
-            # Search across all specified collections with metadata filters
-            for collection_name in collections:
-                try:
-                    db_instance = ChromaDB.get_collection(collection_name)
-                    docs = db_instance.similarity_search(
-                        query or context, 
-                        k=4,
-                        metadata_filters=metadata_filters
-                    )
-                    all_documents.extend(docs)
-                finally:
-                    ChromaDB.close_collection(collection_name)
+            # Search all specified collections at once and keep the global top-k
+            chunks = await asyncio.to_thread(
+                RetrievalService.search,
+                query or context,
+                collections,
+                metadata_filters=metadata_filters
+            )
+            all_documents = [chunk.document for chunk in chunks]
             
             # Combine vector DB results with input content
             db_content = "\n\n".join(doc.page_content for doc in all_documents)
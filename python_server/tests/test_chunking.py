@@ -0,0 +1,167 @@
+import pytest
+
+tiktoken = pytest.importorskip("tiktoken")
+pytest.importorskip("langchain")
+
+import chunking
+from chunking import MarkdownChunker
+from langchain.schema import Document
+
+# One token per UTF-8 byte, so the tests need no downloaded encoding and token counts
+# are exact: len(text.encode())
+BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={}
+)
+
+
+def tokens(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+@pytest.fixture(autouse=True)
+def byte_encoding(monkeypatch):
+    monkeypatch.setattr(chunking.tiktoken, "get_encoding", lambda name: BYTE_ENCODING)
+
+
+def make_chunker(chunk_tokens=200, overlap_tokens=40, min_tokens=50):
+    return MarkdownChunker(chunk_tokens=chunk_tokens, overlap_tokens=overlap_tokens, min_tokens=min_tokens)
+
+
+def paragraphs(count: int, words: int = 12) -> str:
+    return "\n\n".join(
+        " ".join(f"word{p}x{w}" for w in range(words)) + "." for p in range(count)
+    )
+
+
+def test_small_text_is_one_chunk():
+    assert make_chunker().split_text("Hello world.") == [("Hello world.", "")]
+
+
+def test_code_fence_is_not_cut():
+    code = "```python\n" + "\n".join(f"x{i} = {i}" for i in range(12)) + "\n```"
+    text = paragraphs(3) + "\n\n" + code + "\n\n" + paragraphs(3)
+    chunks = [chunk for chunk, _ in make_chunker().split_text(text)]
+
+    assert sum(code in chunk for chunk in chunks) >= 1
+    for chunk in chunks:
+        assert chunk.count("```") % 2 == 0
+
+
+def test_oversized_code_fence_reopens_the_fence_in_every_piece():
+    code = "```python\n" + "\n".join(f"value_{i} = compute({i})" for i in range(40)) + "\n```"
+    chunks = [chunk for chunk, _ in make_chunker().split_text(code)]
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("```python\n")
+        assert chunk.endswith("\n```")
+        assert tokens(chunk) <= 200
+    lines = [line for chunk in chunks for line in chunk.split("\n")[1:-1]]
+    assert lines == code.split("\n")[1:-1]
+
+
+def test_table_is_not_cut():
+    table = "| a | b |\n| --- | --- |\n" + "\n".join(f"| {i} | {i * i} |" for i in range(10))
+    text = paragraphs(2) + "\n\n" + table + "\n\n" + paragraphs(2)
+    chunks = [chunk for chunk, _ in make_chunker().split_text(text)]
+
+    assert any(table in chunk for chunk in chunks)
+
+
+def test_oversized_table_repeats_its_header():
+    header = "| name | value |\n| --- | --- |"
+    table = header + "\n" + "\n".join(f"| row {i} | {i * 1000} |" for i in range(30))
+    chunks = [chunk for chunk, _ in make_chunker().split_text(table)]
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith(header + "\n")
+        assert tokens(chunk) <= 200
+
+
+def test_math_block_is_not_cut():
+    math = "$$\n" + "\n".join(f"x_{i} = \\frac{{{i}}}{{2}} \\\\" for i in range(8)) + "\n$$"
+    text = paragraphs(3) + "\n\n" + math + "\n\n" + paragraphs(3)
+    chunks = [chunk for chunk, _ in make_chunker().split_text(text)]
+
+    assert any(math in chunk for chunk in chunks)
+    for chunk in chunks:
+        assert chunk.count("$$") % 2 == 0
+
+
+def test_heading_path_becomes_the_section():
+    text = (
+        "Intro text.\n\n"
+        "# Sorting\n\n" + paragraphs(2) + "\n\n"
+        "## Quicksort\n\n" + paragraphs(2) + "\n\n"
+        "# Graphs\n\n" + paragraphs(2)
+    )
+    sections = [section for _, section in make_chunker(min_tokens=1).split_text(text)]
+
+    assert sections[0] == ""
+    assert "Sorting" in sections
+    assert "Sorting > Quicksort" in sections
+    assert sections[-1] == "Graphs"
+
+
+def test_heading_stays_with_the_content_after_it():
+    text = paragraphs(2) + "\n\n# Next\n\n" + paragraphs(2)
+    for chunk, _ in make_chunker(min_tokens=1).split_text(text):
+        assert not chunk.endswith("# Next")
+
+
+def test_split_documents_adds_the_section_and_keeps_metadata():
+    document = Document(page_content="# Title\n\n" + paragraphs(1), metadata={"filename": "a.md"})
+    [chunk] = make_chunker().split_documents([document])
+
+    assert chunk.metadata == {"filename": "a.md", "section": "Title"}
+
+
+def test_chunks_and_overlap_stay_within_budget():
+    chunk_tokens, overlap_tokens = 200, 40
+    text = "\n\n".join(f"Sentence number {i} is here." for i in range(60))
+    chunks = [chunk for chunk, _ in make_chunker(chunk_tokens, overlap_tokens).split_text(text)]
+
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert tokens(chunk) <= chunk_tokens
+    for previous, current in zip(chunks, chunks[1:]):
+        shared = [part for part in current.split("\n\n") if part in previous.split("\n\n")]
+        assert shared, "consecutive chunks of one section overlap"
+        assert tokens("\n\n".join(shared)) <= overlap_tokens
+
+
+def test_cjk_paragraph_is_split_on_sentences():
+    sentence = "排序算法把数组分成两部分"  # 12 characters
+    text = "。".join([sentence] * 20) + "。"
+    chunks = [chunk for chunk, _ in make_chunker(chunk_tokens=120, overlap_tokens=0).split_text(text)]
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert tokens(chunk) <= 120
+        assert chunk.endswith("。")
+    assert "".join(chunks) == text
+
+
+def test_sentence_without_boundary_is_split_on_words():
+    words = [f"token{i}" for i in range(200)]
+    text = " ".join(words)
+    chunks = [chunk for chunk, _ in make_chunker(overlap_tokens=0).split_text(text)]
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert tokens(chunk) <= 200
+        assert set(chunk.split()) <= set(words)
+    assert " ".join(chunk.strip() for chunk in chunks) == text
+
+
+def test_word_longer_than_a_chunk_is_cut():
+    text = "a" * 500
+    chunks = [chunk for chunk, _ in make_chunker(overlap_tokens=0).split_text(text)]
+
+    assert "".join(chunks) == text
+    for chunk in chunks:
+        assert tokens(chunk) <= 200
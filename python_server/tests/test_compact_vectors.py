@@ -0,0 +1,128 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from compact_vectors import CompactCollection, dequantize, distances, quantize, truncate
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.normal(size=(16, 64)).astype(np.float32)
+
+
+def test_int8_round_trip(vectors):
+    blobs = quantize(vectors, "int8")
+    restored = dequantize(blobs, "int8")
+
+    assert all(len(blob) == 4 + 64 for blob in blobs)
+    assert restored.dtype == np.float32
+    # Rounding to the nearest step of max|v| / 127 errs by half a step at most
+    steps = np.abs(vectors).max(axis=1, keepdims=True) / 127
+    assert np.all(np.abs(restored - vectors) <= steps / 2 + 1e-6)
+
+
+def test_float16_round_trip(vectors):
+    blobs = quantize(vectors, "float16")
+    restored = dequantize(blobs, "float16")
+
+    assert all(len(blob) == 2 * 64 for blob in blobs)
+    assert restored.dtype == np.float32
+    np.testing.assert_allclose(restored, vectors, rtol=1e-3, atol=1e-4)
+
+
+def test_int8_keeps_the_ranking(vectors):
+    query = vectors[0] + 0.01
+    exact = distances(query, vectors, "cosine")
+    approximate = distances(query, dequantize(quantize(vectors, "int8"), "int8"), "cosine")
+
+    assert np.argsort(approximate)[0] == np.argsort(exact)[0] == 0
+    np.testing.assert_allclose(approximate, exact, atol=1e-2)
+
+
+def test_zero_vector_round_trip():
+    zeros = np.zeros((1, 8), dtype=np.float32)
+
+    np.testing.assert_array_equal(dequantize(quantize(zeros, "int8"), "int8"), zeros)
+
+
+def test_truncate_renormalizes(vectors):
+    truncated = truncate(vectors, 16)
+
+    assert truncated.shape == (16, 16)
+    np.testing.assert_allclose(np.linalg.norm(truncated, axis=1), 1, rtol=1e-5)
+    prefix = vectors[:, :16]
+    np.testing.assert_allclose(truncated, prefix / np.linalg.norm(prefix, axis=1, keepdims=True), rtol=1e-5)
+
+
+@pytest.mark.parametrize("dimensions", [0, 64, 128])
+def test_truncate_keeps_short_vectors(vectors, dimensions):
+    assert truncate(vectors, dimensions) is vectors
+
+
+def test_distances_match_chroma_spaces():
+    query = [1.0, 0.0]
+    embeddings = [[1.0, 0.0], [0.0, 2.0], [-1.0, 0.0]]
+
+    np.testing.assert_allclose(distances(query, embeddings, "l2"), [0, 5, 4])
+    np.testing.assert_allclose(distances(query, embeddings, "ip"), [0, 1, 2])
+    np.testing.assert_allclose(distances(query, embeddings, "cosine"), [0, 1, 2])
+
+
+@pytest.mark.parametrize("quantization", ["int8", "float16"])
+def test_compact_collection_reranks_over_full_vectors(tmp_path, vectors, quantization):
+    chromadb = pytest.importorskip("chromadb")
+    inner = chromadb.EphemeralClient().create_collection(
+        f"compact_{quantization}_{tmp_path.name}",
+        metadata={"storage": "compact", "storage_dimensions": 16,
+                  "storage_quantization": quantization, "hnsw:space": "cosine"}
+    )
+    collection = CompactCollection(inner, str(tmp_path))
+    ids = [f"chunk{i}" for i in range(len(vectors))]
+    collection.add(ids, vectors.tolist(), [{"i": i} for i in range(len(vectors))], [f"text {i}" for i in ids])
+
+    results = collection.query([vectors[3].tolist()], n_results=3)
+    assert results["ids"][0][0] == "chunk3"
+    assert results["documents"][0][0] == "text chunk3"
+    assert results["distances"][0][0] == pytest.approx(0, abs=1e-3)
+    np.testing.assert_allclose(
+        results["distances"][0],
+        sorted(distances(vectors[3], vectors, "cosine"))[:3],
+        atol=1e-2
+    )
+
+    stored = collection.get(ids=["chunk5"], include=["embeddings"])["embeddings"][0]
+    np.testing.assert_allclose(stored, vectors[5], atol=np.abs(vectors[5]).max() / 127)
+
+    collection.delete(ids=["chunk3"])
+    assert collection.count() == 15
+    assert "chunk3" not in collection.query([vectors[3].tolist()], n_results=3)["ids"][0]
+
+
+def test_compact_collection_falls_back_to_index_vectors(tmp_path, vectors):
+    chromadb = pytest.importorskip("chromadb")
+    inner = chromadb.EphemeralClient().create_collection(
+        f"partial_{tmp_path.name}",
+        metadata={"storage": "compact", "storage_dimensions": 16,
+                  "storage_quantization": "int8", "hnsw:space": "cosine"}
+    )
+    collection = CompactCollection(inner, str(tmp_path))
+    ids = [f"chunk{i}" for i in range(len(vectors))]
+    collection.add(ids, vectors.tolist(), [{"i": i} for i in range(len(vectors))], [f"text {i}" for i in ids])
+    # Partially quantized: half the chunks lost their full vectors
+    collection.vectors.remove(collection.name, ids[::2])
+
+    stored = collection.get(ids=ids, include=["embeddings"])["embeddings"]
+    assert all(len(vector) == 64 for vector in stored)
+    # Missing rows are the truncated index vector padded with zeros
+    np.testing.assert_allclose(stored[0][:16], truncate(vectors[:1], 16)[0], rtol=1e-5)
+    assert not np.any(stored[0][16:])
+    np.testing.assert_allclose(stored[1], vectors[1], atol=np.abs(vectors[1]).max() / 127)
+
+    results = collection.query([vectors[4].tolist()], n_results=len(vectors))
+    assert sorted(results["ids"][0]) == sorted(ids)
+    assert results["ids"][0][0] == "chunk4"
+
+    collection.vectors.remove(collection.name, ids[1::2])
+    only_index = collection.get(ids=["chunk1"], include=["embeddings"])["embeddings"][0]
+    np.testing.assert_allclose(only_index, truncate(vectors[1:2], 16)[0], rtol=1e-5)
@@ -0,0 +1,123 @@
+import pytest
+
+from collection_index import DocumentRegistry, connect
+
+COLLECTION = "notes"
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = DocumentRegistry(str(tmp_path))
+    # Pairs of documents tie on every sort column, so paging has to fall back to document_id
+    for i in range(7):
+        filename = f"doc{i}.md"
+        chunks = i // 2 + 1
+        registry.add(
+            COLLECTION,
+            [f"{filename}-{c}" for c in range(chunks)],
+            [{"filename": filename, "type": ["pdf", "md"][i // 2 % 2], "date_added": f"2024-01-0{i // 2 + 1}"}] * chunks,
+            ["x" * (i // 2 + 1)] * chunks
+        )
+    registry.add("other", ["other-0"], [{"filename": "other.md"}], ["other"])
+    return registry
+
+
+def walk(registry, limit, **kwargs):
+    documents, cursor, pages = [], None, 0
+    while True:
+        page, cursor = registry.page(COLLECTION, limit=limit, cursor=cursor, **kwargs)
+        documents += page
+        pages += 1
+        if cursor is None:
+            return documents, pages
+
+
+@pytest.mark.parametrize("sort", list(DocumentRegistry.SORT_COLUMNS))
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_pages_cover_the_collection_in_order(registry, sort, order):
+    column = DocumentRegistry.SORT_COLUMNS[sort]
+    documents, pages = walk(registry, limit=2, sort=sort, order=order)
+
+    ids = [document["id"] for document in documents]
+    assert sorted(ids) == [f"doc{i}.md" for i in range(7)]
+    assert pages == 4
+    keys = [(document[column], document["id"]) for document in documents]
+    assert keys == sorted(keys, reverse=order == "desc")
+
+
+def test_single_page_has_no_cursor(registry):
+    documents, cursor = registry.page(COLLECTION, limit=7)
+
+    assert len(documents) == 7
+    assert cursor is None
+
+
+def test_page_entries(registry):
+    [document], _ = registry.page(COLLECTION, limit=1, sort="filename", order="asc")
+
+    assert document["id"] == "doc0.md"
+    assert document["chunk_count"] == 1
+    assert document["byte_size"] == 1
+    assert "collection" not in document
+    assert "chunk_ids" not in document
+
+
+def test_get_returns_the_chunk_ids(registry):
+    document = registry.get(COLLECTION, "doc4.md")
+
+    assert sorted(document["chunk_ids"]) == ["doc4.md-0", "doc4.md-1", "doc4.md-2"]
+    assert document["chunk_count"] == 3
+    assert registry.get(COLLECTION, "missing.md") is None
+
+
+def test_adding_chunks_to_a_document_updates_its_counts(registry):
+    registry.add(COLLECTION, ["doc0.md-1", "doc0.md-0"], [{"filename": "doc0.md"}] * 2, ["yy", "x"])
+    document = registry.get(COLLECTION, "doc0.md")
+
+    assert sorted(document["chunk_ids"]) == ["doc0.md-0", "doc0.md-1"]
+    assert document["chunk_count"] == 2
+
+    registry.remove(COLLECTION, ["doc0.md-1"], [{"filename": "doc0.md"}], ["yy"])
+    assert registry.get(COLLECTION, "doc0.md")["chunk_ids"] == ["doc0.md-0"]
+    assert registry.get(COLLECTION, "doc0.md")["chunk_count"] == 1
+
+
+def test_registry_with_chunk_id_lists_is_migrated(tmp_path):
+    with connect(str(tmp_path)) as conn:
+        conn.executescript("""
+            CREATE TABLE documents (
+                collection TEXT NOT NULL, document_id TEXT NOT NULL, filename TEXT NOT NULL,
+                type TEXT NOT NULL, course_code TEXT, topic TEXT, chunk_ids TEXT NOT NULL,
+                chunk_count INTEGER NOT NULL, byte_size INTEGER NOT NULL, date_added TEXT NOT NULL,
+                PRIMARY KEY (collection, document_id)
+            );
+            INSERT INTO documents VALUES ('notes', 'a.md', 'a.md', 'md', NULL, NULL, '["c1", "c2"]', 2, 10, '2024');
+        """)
+    registry = DocumentRegistry(str(tmp_path))
+
+    [document], _ = registry.page("notes")
+    assert "chunk_ids" not in document
+    assert document["chunk_count"] == 2
+    assert sorted(registry.get("notes", "a.md")["chunk_ids"]) == ["c1", "c2"]
+    registry.remove("notes", ["c1", "c2"], [{"filename": "a.md"}] * 2, ["x", "y"])
+    assert registry.count("notes") == 0
+
+
+def test_removed_documents_leave_the_pages(registry):
+    registry.remove(COLLECTION, ["doc6.md-0", "doc6.md-1", "doc6.md-2", "doc6.md-3"],
+                    [{"filename": "doc6.md"}] * 4, ["xxxx"] * 4)
+    documents, _ = walk(registry, limit=3)
+
+    assert "doc6.md" not in [document["id"] for document in documents]
+    assert registry.count(COLLECTION) == 6
+
+
+def test_invalid_cursor(registry):
+    with pytest.raises(ValueError):
+        registry.page(COLLECTION, cursor="not a cursor")
+
+
+@pytest.mark.parametrize("sort, order", [("chunk_ids", "asc"), ("filename", "sideways")])
+def test_invalid_sort(registry, sort, order):
+    with pytest.raises(ValueError):
+        registry.page(COLLECTION, sort=sort, order=order)
@@ -0,0 +1,86 @@
+import pytest
+
+from lexical_index import LexicalIndex, tokenize
+
+COLLECTION = "notes"
+
+
+def test_words_are_lowercased():
+    assert tokenize("Binary Search, O(log n)!") == ["binary", "search", "o", "log", "n"]
+
+
+def test_identifiers_are_kept_whole_and_split():
+    assert tokenize("similarity_search") == ["similarity_search", "similarity", "search"]
+    assert tokenize("TextSplitter") == ["textsplitter", "text", "splitter"]
+    assert tokenize("HTTPServer2") == ["httpserver2", "http", "server", "2"]
+
+
+def test_plain_word_is_not_repeated():
+    assert tokenize("python COMP3015") == ["python", "comp3015", "comp", "3015"]
+
+
+def test_cjk_runs_become_unigrams_and_bigrams():
+    assert tokenize("排序算法") == ["排", "序", "算", "法", "排序", "序算", "算法"]
+    assert tokenize("快速 sort") == ["快", "速", "快速", "sort"]
+
+
+def test_empty_text():
+    assert tokenize("") == []
+    assert tokenize("... ---") == []
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.rebuild(COLLECTION, [(
+        ["quick", "merge", "graph"],
+        [
+            "Quicksort partitions the array around a pivot.",
+            "Merge sort splits the array and merges the sorted halves. Merge, merge.",
+            "Dijkstra finds shortest paths in a weighted graph."
+        ]
+    )])
+    return index
+
+
+def ranked(index, query, limit=10):
+    return [chunk_id for chunk_id, _ in index.search(COLLECTION, query, limit)]
+
+
+def test_bm25_ranks_matching_chunks(index):
+    assert ranked(index, "merge") == ["merge"]
+    assert ranked(index, "array pivot") == ["quick", "merge"]
+    assert ranked(index, "dijkstra graph")[0] == "graph"
+
+
+def test_rare_terms_weigh_more(index):
+    [(first, first_score), (_, second_score)] = index.search(COLLECTION, "array pivot", 10)
+
+    assert first == "quick"
+    assert first_score > second_score > 0
+
+
+def test_limit_and_unknown_terms(index):
+    assert len(index.search(COLLECTION, "array", 1)) == 1
+    assert index.search(COLLECTION, "heap", 10) == []
+    assert index.search(COLLECTION, "", 10) == []
+    assert index.search("missing", "array", 10) == []
+
+
+def test_add_and_remove(index):
+    index.add(COLLECTION, ["heap"], ["A binary heap backs the priority queue."])
+    assert ranked(index, "heap") == ["heap"]
+
+    index.remove(COLLECTION, ["heap", "merge"])
+    assert ranked(index, "heap") == []
+    assert ranked(index, "array") == ["quick"]
+
+
+def test_rebuild_and_drop(index):
+    index.rebuild(COLLECTION, [(["only"], ["The array is gone."])])
+    assert ranked(index, "array") == ["only"]
+    assert index.is_built(COLLECTION)
+
+    index.drop(COLLECTION)
+    assert not index.is_built(COLLECTION)
+    assert index.search(COLLECTION, "array", 10) == []
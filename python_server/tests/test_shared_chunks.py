@@ -0,0 +1,144 @@
+import json
+import sqlite3
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+import shared_chunks
+from shared_chunks import ReferenceCollection, _where_sql
+
+ROWS = [
+    {"type": "pdf", "course_code": "COMP3015", "page": 1},
+    {"type": "pdf", "course_code": "COMP2010", "page": 7},
+    {"type": "md", "course_code": "COMP3015", "page": 3},
+    {"type": "docx", "page": 12},
+]
+
+
+def matching(where):
+    """Indexes of ROWS the translated where clause selects."""
+    sql, params = _where_sql(where)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE refs (i INTEGER, metadata TEXT)")
+    conn.executemany("INSERT INTO refs VALUES (?, ?)", [(i, json.dumps(row)) for i, row in enumerate(ROWS)])
+    return [i for (i,) in conn.execute(f"SELECT i FROM refs WHERE {sql} ORDER BY i", params)]
+
+
+@pytest.mark.parametrize("where, expected", [
+    ({"type": "pdf"}, [0, 1]),
+    ({"type": {"$eq": "md"}}, [2]),
+    ({"type": {"$ne": "pdf"}}, [2, 3]),
+    ({"page": {"$gt": 3}}, [1, 3]),
+    ({"page": {"$gte": 3}}, [1, 2, 3]),
+    ({"page": {"$lt": 3}}, [0]),
+    ({"page": {"$lte": 3}}, [0, 2]),
+    ({"type": {"$in": ["md", "docx"]}}, [2, 3]),
+    ({"type": {"$nin": ["md", "docx"]}}, [0, 1]),
+    ({"type": {"$in": []}}, []),
+    ({"type": {"$nin": []}}, [0, 1, 2, 3]),
+    ({"type": "pdf", "course_code": "COMP3015"}, [0]),
+    ({"$and": [{"type": "pdf"}, {"page": {"$gt": 1}}]}, [1]),
+    ({"$or": [{"type": "md"}, {"page": {"$gte": 12}}]}, [2, 3]),
+    ({"$or": [{"$and": [{"type": "pdf"}, {"page": 1}]}, {"type": "docx"}]}, [0, 3]),
+    ({}, [0, 1, 2, 3]),
+])
+def test_where_sql_matches_like_chroma(where, expected):
+    assert matching(where) == expected
+
+
+def test_where_values_are_parameters():
+    sql, params = _where_sql({"type": "pdf' OR 1=1 --"})
+
+    assert "OR 1=1" not in sql
+    assert params == ["pdf' OR 1=1 --"]
+    assert matching({"type": "pdf' OR 1=1 --"}) == []
+
+
+@pytest.mark.parametrize("where", [
+    {"type') OR 1=1 --": "pdf"},
+    {"type": {"$regex": "p.*"}},
+])
+def test_invalid_where_is_rejected(where):
+    with pytest.raises(ValueError):
+        _where_sql(where)
+
+
+@pytest.fixture
+def references(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    client = chromadb.EphemeralClient()
+    shared = client.create_collection(f"shared_{tmp_path.name}", metadata={"hnsw:space": "cosine"})
+    mine = ReferenceCollection("user_a", shared, str(tmp_path))
+    theirs = ReferenceCollection("user_b", shared, str(tmp_path))
+    # Every other chunk is only referenced by the other user
+    for i in range(40):
+        collection = mine if i % 2 == 0 else theirs
+        collection.add(
+            [f"ref{i}"], [[1.0, i / 40, 0.0]],
+            [{"page": i, "type": "pdf" if i % 4 == 0 else "md"}], [f"chunk {i}"]
+        )
+    return mine
+
+
+def expected_pages(where_type=None):
+    pages = [i for i in range(0, 40, 2) if where_type is None or ("pdf" if i % 4 == 0 else "md") == where_type]
+    return pages[:5]
+
+
+@pytest.mark.parametrize("max_filter, max_scan", [(5000, 20000), (4, 20000), (4, 8)])
+def test_query_returns_only_referenced_chunks(references, monkeypatch, max_filter, max_scan):
+    monkeypatch.setattr(shared_chunks, "MAX_FILTER_CHUNKS", max_filter)
+    monkeypatch.setattr(shared_chunks, "MAX_SCAN_CHUNKS", max_scan)
+
+    results = references.query([[1.0, 0.0, 0.0]], n_results=5)
+    assert [metadata["page"] for metadata in results["metadatas"][0]] == expected_pages()
+    assert results["ids"][0] == [f"ref{page}" for page in expected_pages()]
+    assert results["documents"][0] == [f"chunk {page}" for page in expected_pages()]
+    assert results["distances"][0] == sorted(results["distances"][0])
+
+    results = references.query([[1.0, 0.0, 0.0]], n_results=5, where={"type": "md"})
+    assert [metadata["page"] for metadata in results["metadatas"][0]] == expected_pages("md")
+
+
+def test_query_of_an_empty_collection(references):
+    results = references.query([[1.0, 0.0, 0.0]], n_results=5, where={"type": "docx"})
+
+    assert results == {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+
+def test_orphans_are_found_per_store(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    client = chromadb.EphemeralClient()
+    stores = [client.create_collection(f"{backend}_{tmp_path.name}") for backend in ("azure", "hashing")]
+    first = ReferenceCollection("user_a", stores[0], str(tmp_path))
+    second = ReferenceCollection("user_b", stores[1], str(tmp_path))
+    first.add(["a0"], [[1.0, 0.0]], [{}], ["same text"])
+    second.add(["b0"], [[0.0, 1.0, 0.0]], [{}], ["same text"])
+
+    first.delete(ids=["a0"])
+    assert stores[0].count() == 0
+    assert stores[1].count() == 1
+
+    second.delete(ids=["b0"])
+    assert stores[1].count() == 0
+
+
+def test_references_without_a_store_keep_their_chunks(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    store = chromadb.EphemeralClient().create_collection(f"store_{tmp_path.name}")
+    mine = ReferenceCollection("user_a", store, str(tmp_path))
+    mine.add(["a0"], [[1.0, 0.0]], [{}], ["same text"])
+    # A reference written before stores were recorded, by a collection not opened since
+    with shared_chunks.connect(str(tmp_path)) as conn:
+        conn.execute(
+            "INSERT INTO chunk_refs (collection, ref_id, chunk_hash, metadata) VALUES (?, ?, ?, ?)",
+            ("user_old", "old0", shared_chunks.text_hash("same text"), "{}")
+        )
+
+    mine.delete(ids=["a0"])
+    assert store.count() == 1
+
+    ReferenceCollection("user_old", store, str(tmp_path)).delete(ids=["old0"])
+    assert store.count() == 0
@@ -0,0 +1,131 @@
+import os
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+MAX_REQUEST_BYTES = int(os.getenv("MAX_REQUEST_MB", "1024")) * 1024 * 1024
+
+
+class RequestSizeLimitMiddleware:
+    """
+    ASGI middleware bounding request bodies to max_bytes while they are received.
+
+    Requests announcing a larger Content-Length are rejected without reading the body.
+    Otherwise (including chunked requests) the body bytes are counted as the app reads
+    them, and reading past max_bytes raises HTTPException(413), which stops Starlette's
+    multipart parser before it spools more of the request to disk.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"Request body exceeds the {self.max_bytes // (1024 * 1024)} MB limit"
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await JSONResponse(status_code=413, content={"detail": self._too_large().detail})(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise self._too_large()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except HTTPException as e:
+            # Raised outside a route (otherwise FastAPI turns it into the response itself)
+            if e.status_code != 413 or response_started:
+                raise
+            await JSONResponse(status_code=413, content={"detail": e.detail})(scope, receive, send)
+
+
+@dataclass
+class SpooledUpload:
+    """An upload written to a local file, with its content hash computed on the way."""
+    path: str
+    filename: str
+    size: int
+    sha256: str
+
+    def cleanup(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+async def spool_upload(
+    file: UploadFile,
+    suffix: str = "",
+    directory: Optional[str] = None,
+    max_bytes: int = MAX_UPLOAD_BYTES
+) -> SpooledUpload:
+    """
+    Stream an upload to a temporary file in fixed-size chunks.
+
+    Only one chunk is held in memory at a time, the SHA-256 is computed while writing,
+    and the upload is rejected as soon as it exceeds max_bytes. This bounds the memory
+    used per file, not what is received: by now Starlette has already parsed the whole
+    multipart body into its own temporary files, which only RequestSizeLimitMiddleware
+    (MAX_REQUEST_MB) bounds.
+
+    Raises:
+        HTTPException(413) if the file is larger than max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File {file.filename} exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+        )
+
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as temp_file:
+        spooled = SpooledUpload(path=temp_file.name, filename=file.filename, size=0, sha256="")
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File {file.filename} exceeds the {max_bytes // (1024 * 1024)} MB upload limit"
+                    )
+                digest.update(chunk)
+                temp_file.write(chunk)
+        except BaseException:
+            temp_file.close()
+            spooled.cleanup()
+            raise
+
+    spooled.size = size
+    spooled.sha256 = digest.hexdigest()
+    return spooled